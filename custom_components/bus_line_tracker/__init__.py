@@ -1,99 +1,165 @@
 """The Bus Line Tracker integration."""
 
+import asyncio
 import logging
-import math
-import os
+import random
+import time
 from datetime import datetime, timedelta
-from functools import partial
 from zoneinfo import ZoneInfo
 
+import numpy as np
 import pandas as pd
 import stride.common
+import stride.streaming
 import urllib3
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import Platform
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HassJob, HomeAssistant, callback
+from homeassistant.helpers import entity_registry as er
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+from homeassistant.helpers.event import async_call_later, async_track_point_in_time
+from homeassistant.helpers.storage import STORAGE_DIR
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
-from israel_bus_locator.bus_utils import (
-    get_routes_for_route_mkt,
-    get_vehicle_locations,
-    split_by_ride_id,
-)
+from stride import StrideRequestFailedException
 
+from .arrival import Arrival, estimate_arrivals
+from .backends import create_backend
 from .const import (
-    CONF_DIRECTION,
-    CONF_FILTER_NAME,
-    CONF_LAT,
-    CONF_LON,
-    CONF_ROUTE_MKT,
+    ATTR_ESTIMATED_ARRIVAL,
+    ATTR_LEAVE_AT,
+    ATTR_PLACES,
+    ATTR_TRAIL,
+    BUNCHING_HEADWAY,
+    COMPACT_SUMMARY_SUFFIX,
+    CONF_BACKEND,
+    CONF_BACKEND_SOURCE,
+    CONF_COMPACT,
+    CONF_EXECUTOR_WORKERS,
+    CONF_UPDATE_INTERVAL,
+    CONF_WALKING_TIME,
+    DEFAULT_BACKEND,
+    DEFAULT_EXECUTOR_WORKERS,
     DEFAULT_UPDATE_INTERVAL,
     DOMAIN,
+    EVENT_ARRIVAL,
+    EVENT_LEAVE_NOW,
+    HTTP_CACHE_DIR,
+    LOCATIONS_LOOKBACK,
+    MAX_PLAUSIBLE_SPEED,
+    MIN_HEADING_DISTANCE,
+    NEGATIVE_CACHE_BASE_TTL,
+    NEGATIVE_CACHE_MAX_TTL,
+    PREFETCH_START,
+    PREFETCH_WINDOW,
+    SIGNAL_ENTRY_UNLOADED,
+    VEHICLE_INDEX_FIXES,
+    VEHICLE_INDEX_MAX_AGE,
 )
+from .executor import BoundedExecutor
+from .fleet import diff_fleet, fleet_state
+from .geo import haversine_distance, haversine_distances  # noqa: F401
+from .gtfs_store import async_get_gtfs_store
+from .headway import compute_gaps, summarize_gaps
+from .http_cache import StrideRequests, enable_disk_cache
+from .locations import VehicleLocations
+from .negative_cache import NegativeCache
+from .route import RouteTracker, entry_places, entry_routes
+from .services import async_register_services, async_unregister_services
+from .shape import RouteShape, ShapeMatcher, build_route_shape
+from .trace import FrameTracer
+from .vehicle_index import VehicleIndex
+from .websocket import async_register_websocket_commands
 
 # Disable SSL verification warnings
 urllib3.disable_warnings()
 
-# Patch stride's get function to disable SSL verification
-original_get = stride.common.requests.get
-stride.common.requests.get = partial(original_get, verify=False)
-
-pd.set_option("display.max_rows", None)
-pd.set_option("display.max_columns", None)
-pd.set_option("display.width", None)
-pd.set_option("display.max_colwidth", None)
+# Send stride's requests, paged and streamed (catalogs, route shapes), through the
+# integration's caching session, which also disables SSL verification, without
+# patching requests.get for everyone else
+stride.common.requests = stride.streaming.requests = StrideRequests()
 
 _LOGGER = logging.getLogger(__name__)
 
-PLATFORMS: list[Platform] = [Platform.SENSOR, Platform.DEVICE_TRACKER]
-
-
-def haversine_distance(lat1, lon1, lat2, lon2):
-    """
-    Calculate the great circle distance between two points 
-    on the earth (specified in decimal degrees)
-    """
-    # Convert decimal degrees to radians
-    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-
-    # Haversine formula
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
-    c = 2 * math.asin(math.sqrt(a))
-    r = 6371000  # Radius of earth in meters
-    return c * r
+PLATFORMS: list[Platform] = [Platform.SENSOR, Platform.BINARY_SENSOR, Platform.DEVICE_TRACKER]
 
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up Bus Line Tracker from a config entry."""
     hass.data.setdefault(DOMAIN, {})
+    enable_disk_cache(hass.config.path(STORAGE_DIR, DOMAIN, HTTP_CACHE_DIR))
 
+    # The interval chosen at setup is kept in the data until the options are saved
+    update_interval = entry.options.get(
+        CONF_UPDATE_INTERVAL, entry.data.get(CONF_UPDATE_INTERVAL, DEFAULT_UPDATE_INTERVAL)
+    )
     coordinator = BusLineDataCoordinator(
         hass,
         config_entry=entry,
-        update_interval=timedelta(seconds=entry.options.get("update_interval", DEFAULT_UPDATE_INTERVAL)),
+        update_interval=timedelta(seconds=update_interval),
     )
 
     # Fetch initial data
     await coordinator.async_config_entry_first_refresh()
+    coordinator.async_schedule_prefetch()
 
     hass.data[DOMAIN][entry.entry_id] = coordinator
 
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
+    async_register_services(hass)
+    async_register_websocket_commands(hass)
+    entry.async_on_unload(entry.add_update_listener(async_update_options))
 
     return True
 
 
+async def async_update_options(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Apply changed options, which are only read on setup, by reloading the entry."""
+    coordinator = hass.data[DOMAIN].get(entry.entry_id)
+    compact = bool(entry.options.get(CONF_COMPACT))
+    if coordinator is not None and coordinator.compact != compact:
+        async_set_compact(hass, entry, compact)
+    await hass.config_entries.async_reload(entry.entry_id)
+
+
+@callback
+def async_set_compact(hass: HomeAssistant, entry: ConfigEntry, compact: bool) -> None:
+    """Disable the entry's per-route entities when compact mode is turned on, and enable them again when it is off.
+
+    New entities already follow the option through entity_registry_enabled_default;
+    this applies it to the ones registered before the option changed. Entities
+    the user disabled themselves are left alone.
+    """
+    registry = er.async_get(hass)
+    for entity in er.async_entries_for_config_entry(registry, entry.entry_id):
+        if entity.unique_id.endswith(COMPACT_SUMMARY_SUFFIX):
+            # The summary sensor only exists in compact mode
+            if not compact:
+                registry.async_remove(entity.entity_id)
+        elif compact and entity.disabled_by is None:
+            registry.async_update_entity(entity.entity_id, disabled_by=er.RegistryEntryDisabler.INTEGRATION)
+        elif not compact and entity.disabled_by is er.RegistryEntryDisabler.INTEGRATION:
+            registry.async_update_entity(entity.entity_id, disabled_by=None)
+
+
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
     if unload_ok := await hass.config_entries.async_unload_platforms(entry, PLATFORMS):
-        hass.data[DOMAIN].pop(entry.entry_id)
+        coordinator = hass.data[DOMAIN].pop(entry.entry_id)
+        await coordinator.async_shutdown()
+        # End the entry's WebSocket subscriptions, which would never hear from a reloaded coordinator
+        async_dispatcher_send(hass, SIGNAL_ENTRY_UNLOADED.format(entry.entry_id))
+        if not any(isinstance(value, BusLineDataCoordinator) for value in hass.data[DOMAIN].values()):
+            async_unregister_services(hass)
 
     return unload_ok
 
 
 class BusLineDataCoordinator(DataUpdateCoordinator):
-    """Class to manage fetching bus data."""
+    """Class to manage fetching bus data for all routes of an entry in one refresh.
+
+    The data is keyed by route (see RouteConfig.key), with the tracked bus of
+    each route as a dict of sensor values.
+    """
 
     def __init__(self, hass: HomeAssistant, config_entry: ConfigEntry, update_interval: timedelta) -> None:
         """Initialize."""
@@ -104,108 +170,397 @@ class BusLineDataCoordinator(DataUpdateCoordinator):
             update_interval=update_interval,
         )
 
-        self._route_mkt = config_entry.data[CONF_ROUTE_MKT]
-        self._filter_name = config_entry.data.get(CONF_FILTER_NAME)
-        self._direction = config_entry.data.get(CONF_DIRECTION)
-        self._ref_point = None
+        routes = entry_routes(config_entry)
+        self.executor = BoundedExecutor(
+            hass,
+            config_entry.options.get(CONF_EXECUTOR_WORKERS, DEFAULT_EXECUTOR_WORKERS),
+            name=f"{DOMAIN}_{'_'.join(dict.fromkeys(route.route_mkt for route in routes))}",
+        )
+        self.backend = create_backend(
+            config_entry.options.get(CONF_BACKEND, DEFAULT_BACKEND), config_entry.options.get(CONF_BACKEND_SOURCE)
+        )
 
-        lat = config_entry.data.get(CONF_LAT)
-        lon = config_entry.data.get(CONF_LON)
-        if lat is not None and lon is not None:
-            self._ref_point = (lat, lon)
+        self._entry_id = config_entry.entry_id
+        self.compact = bool(config_entry.options.get(CONF_COMPACT))
+        walking_time = config_entry.options.get(CONF_WALKING_TIME)
+        places = entry_places(config_entry)
+        self.trackers: dict[str, RouteTracker] = {
+            route.key: RouteTracker(route, walking_time, places) for route in routes
+        }
+        # Routes that differ only in their stop share one metadata query
+        self._queries = list(dict.fromkeys(route.query for route in routes))
+
+        # A single callback is kept scheduled for the earliest leave_at of all routes
+        self._leave_at: datetime | None = None
+        self._unsub_leave = None
+
+        # Route metadata is fetched once per day as (date_str, {query: routes_df}); the
+        # next day's routes are prefetched before midnight and swapped in at rollover
+        self._routes: tuple[str, dict[tuple, pd.DataFrame]] | None = None
+        self._next_routes: tuple[str, dict[tuple, pd.DataFrame]] | None = None
+        self._unsub_prefetch = None
+        # Spread entries over the prefetch window so they don't all hit the API at once
+        self._prefetch_offset = timedelta(seconds=random.randint(0, int(PREFETCH_WINDOW.total_seconds())))
+
+        # line_refs that keep coming back empty are skipped for a while
+        self._negative_cache = NegativeCache(NEGATIVE_CACHE_BASE_TTL, NEGATIVE_CACHE_MAX_TTL)
+
+        # The latest fixes of every vehicle of the entry's routes, kept across polls
+        self._vehicle_index = VehicleIndex(
+            VEHICLE_INDEX_FIXES, VEHICLE_INDEX_MAX_AGE.total_seconds(), MAX_PLAUSIBLE_SPEED, MIN_HEADING_DISTANCE
+        )
 
-    async def _async_update_data(self):
-        """Update data via library."""
-        # Get current date in Israel timezone
+        # Route shapes are loaded once per day, keyed by GTFS route id and shared by the routes
+        self._shapes_date = None
+        self._shapes: dict[int, RouteShape | None] = {}
+
+        # Every active bus of each route, and what changed in the last refresh, for
+        # WebSocket subscribers; fleet_version counts the refreshes that built it
+        self.fleet: dict[str, dict[str, dict]] = {}
+        self.fleet_changes: dict = {}
+        self.fleet_version = 0
+
+        # Frames of the latest refreshes, captured for diagnostics once started by a service call
+        self.tracer = FrameTracer()
+
+    async def async_shutdown(self) -> None:
+        """Stop refreshing and shut down the integration's worker pool."""
+        await super().async_shutdown()
+        if self._unsub_prefetch:
+            self._unsub_prefetch()
+            self._unsub_prefetch = None
+        if self._unsub_leave:
+            self._unsub_leave()
+            self._unsub_leave = None
+        await self.executor.async_shutdown()
+
+    def async_schedule_prefetch(self) -> None:
+        """Schedule fetching the next day's routes during the quiet window before midnight."""
         now = datetime.now(ZoneInfo("Israel"))
-        _LOGGER.debug(f"ref point: {self._ref_point}")
+        prefetch_at = now.replace(hour=PREFETCH_START.hour, minute=PREFETCH_START.minute, second=0, microsecond=0)
+        prefetch_at += self._prefetch_offset
+        if prefetch_at <= now:
+            prefetch_at += timedelta(days=1)
+
+        self._unsub_prefetch = async_call_later(
+            self.hass,
+            prefetch_at - now,
+            HassJob(self._async_prefetch_next_day, "bus_line_tracker route prefetch", cancel_on_shutdown=True),
+        )
 
-        # Get routes information
+    async def _async_prefetch_next_day(self, _now=None) -> None:
+        """Fetch tomorrow's routes so the first refresh after midnight needs no route request."""
+        self._unsub_prefetch = None
+        date_str = (datetime.now(ZoneInfo("Israel")) + timedelta(days=1)).strftime("%Y-%m-%d")
         try:
-            date_str = now.strftime("%Y-%m-%d")
-            routes_df = await self.hass.async_add_executor_job(
-                get_routes_for_route_mkt,
-                self._route_mkt,
-                date_str,
+            routes = await self._async_fetch_routes(date_str, self._queries)
+        except (OSError, StrideRequestFailedException) as e:
+            _LOGGER.warning("Failed to prefetch routes for %s: %s", date_str, e)
+            routes = {}
+
+        if routes:
+            _LOGGER.debug("Prefetched routes of %d queries for %s", len(routes), date_str)
+            self._next_routes = (date_str, routes)
+
+        if not self._shutdown_requested:
+            self.async_schedule_prefetch()
+
+    async def _async_get_routes(self, date_str: str) -> dict[tuple, pd.DataFrame]:
+        """Return the routes of every query for the given date, fetching each at most once per day."""
+        if self._next_routes is not None and self._next_routes[0] == date_str:
+            # Rollover: swap in the prefetched day in a single assignment
+            self._routes, self._next_routes = self._next_routes, None
+        if self._routes is None or self._routes[0] != date_str:
+            self._routes = (date_str, {})
+
+        cached = self._routes[1]
+        missing = [query for query in self._queries if query not in cached]
+        if missing:
+            cached.update(await self._async_fetch_routes(date_str, missing))
+        return cached
+
+    async def _async_fetch_routes(self, date_str: str, queries: list[tuple]) -> dict[tuple, pd.DataFrame]:
+        """Fetch the routes of the given queries from stride, leaving out the ones without routes."""
+        results = await asyncio.gather(*(self._async_fetch_query(date_str, query) for query in queries))
+        return {query: routes_df for query, routes_df in zip(queries, results, strict=True) if not routes_df.empty}
+
+    async def _async_fetch_query(self, date_str: str, query: tuple) -> pd.DataFrame:
+        """Fetch the routes of one (route_mkt, filter_name, direction) query."""
+        route_mkt, filter_name, direction = query
+        try:
+            routes_df = await self.executor.async_add_executor_job(
+                self.backend.get_routes,
+                route_mkt,
                 date_str,
-                self._filter_name,
-                self._direction,
+                filter_name,
+                direction,
             )
         except KeyError as e:
             _LOGGER.warning(
                 "Failed to get routes with parameters: route_mkt=%s, date=%s, filter_name=%s, direction=%s",
-                self._route_mkt,
+                route_mkt,
                 date_str,
-                self._filter_name,
-                self._direction,
+                filter_name,
+                direction,
             )
-            _LOGGER.error(f"KeyError: {e}", exc_info=True)
+            _LOGGER.error("KeyError: %s", e, exc_info=True)
             routes_df = pd.DataFrame()
 
-        if routes_df.empty:
-            _LOGGER.warning("No routes found for the given criteria")
-            return {}
+        return routes_df
 
-        _LOGGER.debug(f"routes_df:\n{routes_df}")
+    async def _async_update_data(self):
+        """Update data via library and schedule the leave-now callback."""
+        data = await self._async_fetch_data()
+        for key, tracker in self.trackers.items():
+            tracker.leave_at = data.get(key, {}).get(ATTR_LEAVE_AT)
+        self._async_schedule_leave()
+
+        fleet = {key: tracker.fleet for key, tracker in self.trackers.items()}
+        self.fleet_changes = diff_fleet(self.fleet, fleet)
+        self.fleet = fleet
+        self.fleet_version += 1
+        return data
+
+    def _async_schedule_leave(self) -> None:
+        """Keep one callback scheduled for the earliest upcoming leave_at, replacing the previous one."""
+        now = datetime.now(ZoneInfo("Israel"))
+        leave_at = min(
+            (
+                tracker.leave_at
+                for tracker in self.trackers.values()
+                if tracker.leave_at is not None
+                and tracker.leave_at > now
+                and tracker.leave_at != tracker.notified_leave_at
+            ),
+            default=None,
+        )
+        if leave_at == self._leave_at:
+            return
+        if self._unsub_leave:
+            self._unsub_leave()
+            self._unsub_leave = None
+        self._leave_at = leave_at
+
+        if leave_at is not None:
+            self._unsub_leave = async_track_point_in_time(
+                self.hass,
+                HassJob(self._async_leave_now, "bus_line_tracker leave now", cancel_on_shutdown=True),
+                leave_at,
+            )
 
-        # Check if we have line_ref column
-        if "line_ref" not in routes_df.columns:
-            _LOGGER.error("Required column 'line_ref' not found in routes data")
-            return {}
+    async def _async_leave_now(self, _now=None) -> None:
+        """Fire the leave-now event for every route whose time to leave has come."""
+        self._unsub_leave = None
+        due, self._leave_at = self._leave_at, None
+        data = self.data or {}
+        for key, tracker in self.trackers.items():
+            if tracker.leave_at is None or tracker.leave_at > due or tracker.leave_at == tracker.notified_leave_at:
+                continue
+            tracker.notified_leave_at = tracker.leave_at
+            route_data = data.get(key) or {}
+            self.hass.bus.async_fire(
+                EVENT_LEAVE_NOW,
+                {
+                    "entry_id": self._entry_id,
+                    "route_mkt": tracker.route.route_mkt,
+                    "vehicle_ref": route_data.get("vehicle_ref"),
+                    ATTR_LEAVE_AT: tracker.leave_at,
+                    ATTR_ESTIMATED_ARRIVAL: route_data.get(ATTR_ESTIMATED_ARRIVAL),
+                },
+            )
+        self._async_schedule_leave()
+
+    def _async_record_arrival(self, tracker: RouteTracker, arrival: Arrival) -> None:
+        """Remember a route's latest arrival and fire an event for it."""
+        _LOGGER.debug("Ride %s arrived at %s", arrival.ride_id, arrival.time)
+        tracker.last_arrival = arrival
+        self.hass.bus.async_fire(
+            EVENT_ARRIVAL,
+            {
+                "entry_id": self._entry_id,
+                "route_mkt": tracker.route.route_mkt,
+                "ride_id": arrival.ride_id,
+                "line_ref": arrival.line_ref,
+                "vehicle_ref": arrival.vehicle_ref,
+                "time": arrival.time,
+                "distance": round(arrival.distance, 1),
+            },
+        )
 
-        # Get vehicle locations for the last hour
-        end_time = now.replace(second=0, microsecond=0)
-        start_time = end_time - timedelta(minutes=30)
+    async def _async_fetch_data(self):
+        """Fetch the latest position of the tracked bus of every route."""
+        # Get current date in Israel timezone
+        now = datetime.now(ZoneInfo("Israel"))
 
-        vehicle_locations = pd.DataFrame()
+        # Get routes information
+        date_str = now.strftime("%Y-%m-%d")
+        routes = await self._async_get_routes(date_str)
+
+        data = {key: {} for key in self.trackers}
+        route_line_refs = {}
+        for key, tracker in self.trackers.items():
+            tracker.fleet = {}
+            routes_df = routes.get(tracker.route.query)
+            if routes_df is None:
+                _LOGGER.warning("No routes found for route_mkt=%s", tracker.route.route_mkt)
+                continue
 
-        # Iterate through all line_refs
-        for line_ref in routes_df["line_ref"]:
-            try:
-                line_locations = await self.hass.async_add_executor_job(
-                    get_vehicle_locations,
-                    line_ref,
-                    start_time,
-                    end_time,
-                )
-                # Append locations for this line to main dataframe
-                vehicle_locations = pd.concat([vehicle_locations, line_locations])
-
-            except KeyError as e:
-                _LOGGER.debug(
-                    "Failed to get vehicle locations with parameters: line_ref=%s, start_time=%s, end_time=%s",
-                    line_ref,
-                    start_time,
-                    end_time,
-                )
-                _LOGGER.debug(f"KeyError: {e}", exc_info=True)
+            _LOGGER.debug("Found %d route variants for route_mkt=%s", len(routes_df), tracker.route.route_mkt)
+
+            # Check if we have line_ref column
+            if "line_ref" not in routes_df.columns:
+                _LOGGER.error("Required column 'line_ref' not found in routes data")
                 continue
 
-        if vehicle_locations.empty:
-            _LOGGER.debug("No vehicle locations found")
+            route_line_refs[key] = tracker.get_line_refs(routes_df)
+
+        # Get vehicle locations for the last half hour; archived fixes are queried by
+        # the minute so repeated polls can be revalidated rather than downloaded
+        end_time = now if self.backend.realtime else now.replace(second=0, microsecond=0)
+        start_time = end_time - LOCATIONS_LOOKBACK
+
+        # Fetch the line_refs of all routes in a single request,
+        # leaving out the ones that recently returned nothing
+        self._negative_cache.start_day(date_str)
+        monotonic_now = time.monotonic()
+        line_refs = [
+            line_ref
+            for line_ref in dict.fromkeys(line_ref for refs in route_line_refs.values() for line_ref in refs)
+            if not self._negative_cache.is_suppressed(line_ref, monotonic_now)
+        ]
+        if not line_refs:
+            _LOGGER.debug("All line_refs recently returned no vehicle locations, skipping fetch")
+            if self.tracer.enabled:
+                self._trace(now, routes, line_refs, start_time, end_time, VehicleLocations.empty())
+            return data
+
+        fetched = True
+        try:
+            vehicle_locations = await self.executor.async_add_executor_job(
+                self.backend.fetch_vehicle_locations,
+                line_refs,
+                start_time,
+                end_time,
+            )
+        except (KeyError, ValueError) as e:
+            _LOGGER.debug(
+                "Failed to get vehicle locations with parameters: line_refs=%s, start_time=%s, end_time=%s",
+                line_refs,
+                start_time,
+                end_time,
+            )
+            _LOGGER.debug("%s: %s", type(e).__name__, e, exc_info=True)
+            vehicle_locations = VehicleLocations.empty()
+            fetched = False
+
+        if self.tracer.enabled:
+            self._trace(now, routes, line_refs, start_time, end_time, vehicle_locations)
+
+        self._vehicle_index.update(vehicle_locations)
+
+        # A failed request says nothing about whether the line_refs have vehicles
+        if fetched:
+            found_line_refs = set(vehicle_locations.split_by_line_ref())
+            for line_ref in line_refs:
+                if line_ref in found_line_refs:
+                    self._negative_cache.record_hit(line_ref)
+                else:
+                    self._negative_cache.record_empty(line_ref, monotonic_now)
+
+        for key, tracker_line_refs in route_line_refs.items():
+            tracker = self.trackers[key]
+            if not fetched:
+                # Nor about where the buses are: arrivals, trails and the fleet wait for the next good poll
+                data[key] = {}
+                continue
+            if len(self.trackers) == 1:
+                locations = vehicle_locations
+            else:
+                locations = vehicle_locations.select_line_refs(tracker_line_refs)
+            data[key] = await self._async_route_data(tracker, date_str, routes[tracker.route.query], locations)
+
+        return data
+
+    def _trace(self, now, routes, line_refs, start_time, end_time, vehicle_locations) -> None:
+        """Capture the frames of a refresh while tracing."""
+        self.tracer.capture(
+            now,
+            {key: routes.get(tracker.route.query) for key, tracker in self.trackers.items()},
+            line_refs,
+            start_time,
+            end_time,
+            vehicle_locations,
+        )
+
+    async def _async_route_data(
+        self, tracker: RouteTracker, date_str: str, routes_df: pd.DataFrame, vehicle_locations: VehicleLocations
+    ) -> dict:
+        """Reduce a route's vehicle locations to the sensor values of its tracked bus."""
+        if tracker.arrival_detector is not None:
+            for arrival in tracker.arrival_detector.update(vehicle_locations):
+                self._async_record_arrival(tracker, arrival)
+        tracker.trails.update(vehicle_locations)
+        tracker.fleet = fleet_state(vehicle_locations)
+
+        if vehicle_locations.is_empty:
+            _LOGGER.debug("No vehicle locations found for route_mkt=%s", tracker.route.route_mkt)
             return {}
 
         # Log unique rides found
-        unique_rides = vehicle_locations["siri_ride__id"].unique()
-        _LOGGER.debug(f"Unique rides: {unique_rides}, shape: {vehicle_locations.shape}")
-        # _LOGGER.debug(f"Vehicle locations:\n{vehicle_locations}")
+        unique_rides = np.unique(vehicle_locations["siri_ride__id"])
+        _LOGGER.debug("Unique rides: %d, fixes: %d", len(unique_rides), len(vehicle_locations))
 
         # Get the latest point for the ride closest to the journey start
-        split_rides = split_by_ride_id(vehicle_locations)
-        closest_ride = min(split_rides, key=lambda ride: ride["distance_from_journey_start"].iloc[0])
-        
-        latest_location = closest_ride.iloc[0]
-        _LOGGER.debug(f"Latest location: {latest_location}")
-
-        # Calculate distance from station using haversine formula if reference point is available
-        distance_from_station = None
-        if self._ref_point:
-            distance_from_station = haversine_distance(
-                latest_location["lat"],
-                latest_location["lon"],
-                self._ref_point[0],
-                self._ref_point[1],
+        latest_indices = vehicle_locations.latest_per_ride()
+        latest_distances = vehicle_locations["distance_from_journey_start"][latest_indices]
+        closest = 0 if np.isnan(latest_distances).all() else int(np.nanargmin(latest_distances))
+
+        latest_location = vehicle_locations.row(latest_indices[closest])
+        _LOGGER.debug("Latest location: %s", latest_location)
+
+        # SIRI often reports no (or a zero) speed and bearing for a moving bus
+        if not latest_location["velocity"] or not latest_location["bearing"]:
+            speed, bearing = self._vehicle_index.motion(latest_location["siri_ride__vehicle_ref"])
+            if not latest_location["velocity"] and speed is not None:
+                latest_location["velocity"] = speed
+            if not latest_location["bearing"] and bearing is not None:
+                latest_location["bearing"] = bearing
+
+        # Calculate the distances to the station and every place along the route
+        # shape in one pass, falling back to the straight-line haversine distance
+        # for the points that can't be matched
+        ref_point = tracker.route.ref_point
+        points = ([ref_point] if ref_point else []) + [(place.lat, place.lon) for place in tracker.places]
+        distances = np.empty(0)
+        if points:
+            points_lat, points_lon = np.array(points, dtype=np.float64).T
+            distances = haversine_distances(latest_location["lat"], latest_location["lon"], points_lat, points_lon)
+            matcher = await self._async_get_shape_matcher(
+                tracker, date_str, routes_df, latest_location["siri_route__line_ref"]
             )
+            if matcher is not None:
+                matcher.prune(unique_rides)
+                along = matcher.distances_along(
+                    latest_location["siri_ride__id"],
+                    latest_location["lat"],
+                    latest_location["lon"],
+                    latest_location["distance_from_journey_start"],
+                )
+                if along is not None:
+                    distances = np.where(np.isnan(along), distances, along)
+
+        arrivals = estimate_arrivals(latest_location["recorded_at_time"], distances, latest_location["velocity"])
+        distance_from_station = estimated_arrival = None
+        if ref_point:
+            distance_from_station, estimated_arrival = float(distances[0]), arrivals[0]
+        leave_at = estimated_arrival - tracker.walking_time if estimated_arrival is not None else None
+        first_place = len(points) - len(tracker.places)
+        places = {
+            place.name: {"distance": distance, ATTR_ESTIMATED_ARRIVAL: arrival}
+            for place, distance, arrival in zip(
+                tracker.places, distances[first_place:].tolist(), arrivals[first_place:], strict=True
+            )
+        }
 
         # Return the data in the format expected by the sensors
         return {
@@ -216,4 +571,56 @@ class BusLineDataCoordinator(DataUpdateCoordinator):
             "distance_from_station": distance_from_station,
             "vehicle_ref": latest_location["siri_ride__vehicle_ref"],
             "last_update": latest_location["recorded_at_time"],
+            ATTR_ESTIMATED_ARRIVAL: estimated_arrival,
+            ATTR_LEAVE_AT: leave_at,
+            ATTR_PLACES: places,
+            ATTR_TRAIL: tracker.trails.encoded(latest_location["siri_ride__id"]),
+            # Gaps between all of the route's active rides, not just the tracked one
+            **summarize_gaps(compute_gaps(vehicle_locations), BUNCHING_HEADWAY),
         }
+
+    async def _async_get_shape_matcher(self, tracker: RouteTracker, date_str, routes_df, line_ref):
+        """Return a route's shape matcher for a line_ref, loading each shape once per day."""
+        if tracker.shapes_date != date_str:
+            tracker.shapes_date = date_str
+            tracker.shape_matchers = {}
+
+        if line_ref not in tracker.shape_matchers:
+            shape = None
+            route_rows = routes_df[routes_df["line_ref"] == line_ref]
+            if "id" in routes_df.columns and not route_rows.empty:
+                shape = await self._async_get_shape(date_str, int(route_rows["id"].iloc[0]), line_ref)
+            tracker.shape_matchers[line_ref] = (
+                ShapeMatcher(
+                    shape,
+                    tracker.route.ref_point,
+                    [(place.lat, place.lon) for place in tracker.places],
+                    tracker.route.stop,
+                )
+                if shape is not None
+                else None
+            )
+
+        return tracker.shape_matchers[line_ref]
+
+    async def _async_get_shape(self, date_str, gtfs_route_id, line_ref) -> RouteShape | None:
+        """Return the shape of a GTFS route, shared by every route of the entry that runs it."""
+        if self._shapes_date != date_str:
+            self._shapes_date = date_str
+            self._shapes = {}
+
+        if gtfs_route_id not in self._shapes:
+            # A local GTFS store has the shape at hand, keyed by the GTFS route_id SIRI calls line_ref
+            store = await async_get_gtfs_store(self.hass)
+            shape = None
+            if store is not None:
+                shape = await self.executor.async_add_executor_job(store.route_shape, line_ref, date_str)
+            if shape is None:
+                try:
+                    shape = await self.executor.async_add_executor_job(build_route_shape, gtfs_route_id, date_str)
+                except (KeyError, ValueError, OSError, StrideRequestFailedException) as e:
+                    _LOGGER.warning("Failed to load route shape for line_ref=%s: %s", line_ref, e)
+            # Cache failures too, so a missing shape is not refetched on every poll
+            self._shapes[gtfs_route_id] = shape
+
+        return self._shapes[gtfs_route_id]
@@ -0,0 +1,235 @@
+"""Historical punctuality analytics, reduced day by day in a process pool."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from datetime import date, datetime, time, timedelta
+from functools import partial
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import STORAGE_DIR
+from israel_bus_locator.bus_utils import get_routes_for_route_mkt
+from stride import StrideRequestFailedException
+
+from .const import ANALYTICS_DIR, ANALYTICS_MAX_WORKERS, ARRIVAL_RADIUS, DOMAIN, HTTP_CACHE_DIR
+from .geo import haversine_distances
+from .http_cache import enable_disk_cache, get_session
+from .locations import fetch_vehicle_locations
+
+_LOGGER = logging.getLogger(__name__)
+
+# Per-ride summary columns and the types they are stored in; a plain str is as wide as its longest value
+RIDE_SUMMARY_FIELDS = {
+    "service_date": "U10",
+    "ride_id": np.int64,
+    "line_ref": np.int64,
+    "vehicle_ref": str,
+    "scheduled_start": np.float64,  # POSIX timestamps
+    "first_fix": np.float64,
+    "last_fix": np.float64,
+    "arrival": np.float64,  # NaN when the ride never came within the arrival radius
+    "closest_distance": np.float32,  # meters
+    "fixes": np.int32,
+}
+
+
+class AnalyticsDayError(Exception):
+    """A service day could not be fetched or reduced."""
+
+
+def empty_summary() -> dict[str, np.ndarray]:
+    """Return a ride summary without rides."""
+    return {field: np.empty(0, dtype=dtype) for field, dtype in RIDE_SUMMARY_FIELDS.items()}
+
+
+def summarize_rides(locations, service_date: str, ref_point: tuple[float, float] | None) -> dict[str, np.ndarray]:
+    """Reduce a day of vehicle locations to one row per ride.
+
+    A ride's arrival is the time of its fix closest to the reference point, if
+    that fix is within ARRIVAL_RADIUS.
+    """
+    if locations.is_empty:
+        return empty_summary()
+
+    ride_ids = locations["siri_ride__id"]
+    times = locations["recorded_at_time"]
+    order = np.lexsort((times, ride_ids))
+    sorted_rides = ride_ids[order]
+    starts = np.flatnonzero(np.r_[True, sorted_rides[1:] != sorted_rides[:-1]])
+    ends = np.r_[starts[1:], len(order)] - 1
+    first = order[starts]
+
+    if ref_point is not None:
+        distances = haversine_distances(locations["lat"], locations["lon"], ref_point[0], ref_point[1])
+        distances = np.where(np.isnan(distances), np.inf, distances)
+        # The first fix of each ride when ordered by distance is its closest one
+        by_distance = np.lexsort((distances, ride_ids))
+        closest = by_distance[starts]
+        closest_distance = distances[closest]
+        arrival = np.where(closest_distance <= ARRIVAL_RADIUS, times[closest], np.nan)
+    else:
+        closest_distance = np.full(len(starts), np.inf)
+        arrival = np.full(len(starts), np.nan)
+
+    summary = {
+        "service_date": np.full(len(starts), service_date),
+        "ride_id": sorted_rides[starts],
+        "line_ref": locations["siri_route__line_ref"][first],
+        "vehicle_ref": locations["siri_ride__vehicle_ref"][first],
+        "scheduled_start": locations["siri_ride__scheduled_start_time"][first],
+        "first_fix": times[first],
+        "last_fix": times[order[ends]],
+        "arrival": arrival,
+        "closest_distance": closest_distance,
+        "fixes": ends - starts + 1,
+    }
+    return {field: np.asarray(summary[field], dtype=dtype) for field, dtype in RIDE_SUMMARY_FIELDS.items()}
+
+
+def summarize_day(
+    route_mkt: str,
+    filter_name: str | None,
+    direction: str | None,
+    service_date: str,
+    ref_point: tuple[float, float] | None,
+    cache_dir: str | None = None,
+) -> dict[str, np.ndarray]:
+    """Fetch one service day of a route and reduce it to ride summaries.
+
+    Runs in a worker process, so only the compact summary is sent back. Past
+    days' pages are kept in the HTTP cache under cache_dir, so analysing the
+    same days again downloads nothing.
+    """
+    if cache_dir is not None:
+        enable_disk_cache(cache_dir)
+    try:
+        routes_df = get_routes_for_route_mkt(route_mkt, service_date, service_date, filter_name, direction)
+        if routes_df.empty or "line_ref" not in routes_df.columns:
+            return empty_summary()
+
+        day = date.fromisoformat(service_date)
+        start_time = datetime.combine(day, time.min, ZoneInfo("Israel"))
+        locations = fetch_vehicle_locations(
+            [int(line_ref) for line_ref in routes_df["line_ref"]],
+            start_time,
+            start_time + timedelta(days=1),
+            session=get_session(),
+        )
+    except (KeyError, ValueError, OSError, StrideRequestFailedException) as e:
+        # stride's exception can't be unpickled in the parent process
+        raise AnalyticsDayError(f"{type(e).__name__}: {e}") from None
+    return summarize_rides(locations, service_date, ref_point)
+
+
+def aggregate(summaries: list[dict[str, np.ndarray]]) -> dict[str, np.ndarray]:
+    """Concatenate daily summaries and add delay and headway columns.
+
+    A ride's delay is how much longer than usual it took from its scheduled start
+    to the stop (the median per line_ref); its headway is the gap since the
+    previous bus arrived on the same day.
+    """
+    if not summaries:
+        result = empty_summary()
+    else:
+        result = {field: np.concatenate([summary[field] for summary in summaries]) for field in RIDE_SUMMARY_FIELDS}
+
+    order = np.lexsort((result["arrival"], result["service_date"]))
+    result = {field: column[order] for field, column in result.items()}
+
+    travel = result["arrival"] - result["scheduled_start"]
+    delay = np.full(len(travel), np.nan)
+    for line_ref in np.unique(result["line_ref"]):
+        mask = (result["line_ref"] == line_ref) & ~np.isnan(travel)
+        if mask.any():
+            delay[mask] = travel[mask] - np.median(travel[mask])
+
+    arrival = result["arrival"]
+    same_day = np.r_[False, result["service_date"][1:] == result["service_date"][:-1]]
+    headway = np.where(same_day, arrival - np.r_[np.nan, arrival[:-1]], np.nan)
+
+    result["delay"] = delay
+    result["headway"] = headway
+    return result
+
+
+def _percentile(values: np.ndarray, q: float) -> float | None:
+    values = values[~np.isnan(values)]
+    return round(float(np.percentile(values, q)), 1) if len(values) else None
+
+
+def describe(result: dict[str, np.ndarray]) -> dict:
+    """Return headline statistics of an aggregated result, in seconds."""
+    return {
+        "rides": int(len(result["ride_id"])),
+        "arrivals": int(np.count_nonzero(~np.isnan(result["arrival"]))),
+        "median_delay": _percentile(result["delay"], 50),
+        "p90_delay": _percentile(result["delay"], 90),
+        "median_headway": _percentile(result["headway"], 50),
+        "p90_headway": _percentile(result["headway"], 90),
+    }
+
+
+def analytics_path(hass: HomeAssistant, route_mkt: str, start: date, end: date) -> str:
+    """Return where the results for a route and date range are written."""
+    return hass.config.path(DOMAIN, ANALYTICS_DIR, f"punctuality_{route_mkt}_{start}_{end}.npz")
+
+
+def write_results(path: str, result: dict[str, np.ndarray]) -> None:
+    """Write the aggregated columns to a compressed .npz file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp.npz"
+    np.savez_compressed(tmp_path, **result)
+    os.replace(tmp_path, path)
+
+
+def _create_pool(max_workers: int) -> Executor:
+    # Spawn rather than fork: forking Home Assistant's threaded process is unsafe
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+async def async_analyze_punctuality(
+    hass: HomeAssistant,
+    route_mkt: str,
+    filter_name: str | None,
+    direction: str | None,
+    ref_point: tuple[float, float] | None,
+    start: date,
+    end: date,
+) -> dict:
+    """Analyse every service day from start to end (inclusive) and write the ride summaries to disk.
+
+    Days are fetched and reduced in a process pool of their own, so neither the
+    event loop nor the live coordinators' workers are held up.
+    """
+    days = [(start + timedelta(days=offset)).isoformat() for offset in range((end - start).days + 1)]
+    pool = await hass.async_add_executor_job(_create_pool, min(ANALYTICS_MAX_WORKERS, len(days)))
+    cache_dir = hass.config.path(STORAGE_DIR, DOMAIN, HTTP_CACHE_DIR)
+
+    failed_days = []
+
+    async def _async_summarize(day: str) -> dict[str, np.ndarray] | None:
+        try:
+            return await asyncio.wrap_future(
+                pool.submit(summarize_day, route_mkt, filter_name, direction, day, ref_point, cache_dir)
+            )
+        except AnalyticsDayError as e:
+            _LOGGER.warning("Failed to analyse route %s on %s: %s", route_mkt, day, e)
+            failed_days.append(day)
+            return None
+
+    try:
+        summaries = await asyncio.gather(*(_async_summarize(day) for day in days))
+    finally:
+        await hass.async_add_executor_job(partial(pool.shutdown, wait=True, cancel_futures=True))
+
+    result = aggregate([summary for summary in summaries if summary is not None])
+    path = analytics_path(hass, route_mkt, start, end)
+    await hass.async_add_executor_job(write_results, path, result)
+
+    return {"path": path, "days": len(days), "failed_days": sorted(failed_days), **describe(result)}
@@ -0,0 +1,148 @@
+"""Arrival estimates and detection for the tracked bus."""
+
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+from .const import ARRIVAL_HYSTERESIS, ARRIVAL_RADIUS, ETA_FALLBACK_SPEED, ETA_MIN_SPEED, LOCATIONS_LOOKBACK
+from .geo import haversine_distances
+
+
+def estimate_arrival(
+    fix_time: datetime | None, distance_from_station: float | None, speed: float | None
+) -> datetime | None:
+    """Return when a bus reported at `fix_time` reaches the station, or None if it can't be estimated.
+
+    `speed` is the fix's velocity in km/h. A bus standing at a stop or at a light
+    would never arrive by its own speed, so slow fixes use a typical bus speed.
+    """
+    if fix_time is None or distance_from_station is None or distance_from_station < 0:
+        return None
+    if not speed or speed < ETA_MIN_SPEED:
+        speed = ETA_FALLBACK_SPEED
+    return fix_time + timedelta(seconds=distance_from_station / (speed / 3.6))
+
+
+def estimate_arrivals(fix_time: datetime | None, distances: np.ndarray, speed: float | None) -> list[datetime | None]:
+    """Return estimate_arrival() for an array of distances from one fix, in a single pass.
+
+    Distances that are NaN or negative (already passed) have no estimate.
+    """
+    if fix_time is None:
+        return [None] * len(distances)
+    if not speed or speed < ETA_MIN_SPEED:
+        speed = ETA_FALLBACK_SPEED
+    seconds = np.asarray(distances, dtype=np.float64) / (speed / 3.6)
+    return [fix_time + timedelta(seconds=s) if s >= 0 else None for s in seconds.tolist()]
+
+
+@dataclass(frozen=True)
+class Arrival:
+    """A ride passing the reference point."""
+
+    ride_id: int
+    line_ref: int | None
+    vehicle_ref: str | None
+    time: datetime
+    distance: float  # meters from the reference point at the closest fix
+
+
+class _RideTrack:
+    """What the detector remembers about one active ride."""
+
+    __slots__ = ("last_time", "min_distance", "min_time", "line_ref", "vehicle_ref", "arrived")
+
+    def __init__(self, line_ref, vehicle_ref) -> None:
+        self.last_time = -math.inf
+        self.min_distance = math.inf
+        self.min_time = math.nan
+        self.line_ref = line_ref
+        self.vehicle_ref = vehicle_ref
+        self.arrived = False
+
+
+class ArrivalDetector:
+    """Detects each ride's pass of the reference point from the fixes of successive polls.
+
+    Only fixes newer than those already seen are looked at, and every active ride
+    keeps a fixed amount of state: its closest approach so far. A ride arrives
+    once it was within ARRIVAL_RADIUS and then moves ARRIVAL_HYSTERESIS further
+    away (or ends its trip while still close), and arrives at most once: rides
+    that arrived are remembered after they end, until their last fix is older
+    than the polls' LOCATIONS_LOOKBACK, in case their fixes are reported again.
+    """
+
+    def __init__(self, ref_point: tuple[float, float]) -> None:
+        """Initialize the detector."""
+        self.ref_point = ref_point
+        self._rides: dict[int, _RideTrack] = {}
+        # ride_id -> last fix time of ended rides that arrived
+        self._arrived: dict[int, float] = {}
+        self._latest = -math.inf
+
+    def __len__(self) -> int:
+        """Return the number of tracked rides."""
+        return len(self._rides)
+
+    def update(self, locations) -> list[Arrival]:
+        """Feed the fixes of a poll and return the arrivals they complete, oldest first."""
+        arrivals = []
+        active = set()
+        if not locations.is_empty:
+            ride_ids = locations["siri_ride__id"]
+            times = locations["recorded_at_time"]
+            distances = haversine_distances(locations["lat"], locations["lon"], *self.ref_point)
+            self._latest = max(self._latest, float(times.max()))
+            order = np.lexsort((times, ride_ids))
+            starts = np.flatnonzero(np.r_[True, ride_ids[order][1:] != ride_ids[order][:-1]])
+            for group in np.split(order, starts[1:]):
+                ride_id = int(ride_ids[group[0]])
+                active.add(ride_id)
+                track = self._rides.get(ride_id)
+                if track is None:
+                    line_ref = int(locations["siri_route__line_ref"][group[0]])
+                    track = self._rides[ride_id] = _RideTrack(
+                        line_ref if line_ref >= 0 else None, str(locations["siri_ride__vehicle_ref"][group[0]]) or None
+                    )
+                    track.arrived = self._arrived.pop(ride_id, None) is not None
+                if track.arrived:
+                    continue
+                new = group[times[group] > track.last_time]
+                for fix_time, distance in zip(times[new].tolist(), distances[new].tolist(), strict=True):
+                    if distance < track.min_distance:
+                        track.min_distance, track.min_time = distance, fix_time
+                    elif track.min_distance <= ARRIVAL_RADIUS and distance > track.min_distance + ARRIVAL_HYSTERESIS:
+                        arrivals.append(self._arrive(ride_id, track))
+                        break
+                if len(new):
+                    track.last_time = max(track.last_time, float(times[new].max()))
+
+        # Rides that are no longer reported have ended; one that ended close by has arrived
+        for ride_id in [ride_id for ride_id in self._rides if ride_id not in active]:
+            track = self._rides.pop(ride_id)
+            if not track.arrived and track.min_distance <= ARRIVAL_RADIUS:
+                arrivals.append(self._arrive(ride_id, track))
+            if track.arrived:
+                self._arrived[ride_id] = track.last_time
+        horizon = self._latest - LOCATIONS_LOOKBACK.total_seconds()
+        for ride_id in [ride_id for ride_id, last_time in self._arrived.items() if last_time < horizon]:
+            del self._arrived[ride_id]
+
+        arrivals.sort(key=lambda arrival: arrival.time)
+        return arrivals
+
+    @staticmethod
+    def _arrive(ride_id: int, track: _RideTrack) -> Arrival:
+        track.arrived = True
+        return Arrival(
+            ride_id=ride_id,
+            line_ref=track.line_ref,
+            vehicle_ref=track.vehicle_ref,
+            time=datetime.fromtimestamp(track.min_time, ZoneInfo("Israel")),
+            distance=track.min_distance,
+        )
@@ -0,0 +1,223 @@
+"""Sources of route metadata and vehicle locations for the coordinator."""
+
+from __future__ import annotations
+
+import glob
+import json
+import logging
+import os
+import zlib
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import IO
+
+import json_stream
+import numpy as np
+import pandas as pd
+from israel_bus_locator.bus_utils import get_routes_for_route_mkt
+from json_stream.base import StreamingJSONList, StreamingJSONObject
+
+from .const import BACKEND_FILE, BACKEND_SIRI_VM, BACKEND_STRIDE
+from .http_cache import get_session
+from .locations import REQUEST_TIMEOUT, VehicleLocations, fetch_vehicle_locations, parse_locations
+
+_LOGGER = logging.getLogger(__name__)
+
+# Optional file next to FileBackend snapshots with the routes of each route_mkt
+FILE_BACKEND_ROUTES = "routes.json"
+
+
+class Backend(ABC):
+    """Where the coordinator gets routes and vehicle locations from.
+
+    Methods block and are run in the coordinator's worker pool.
+    """
+
+    # Whether fixes are fresh enough that queries shouldn't be truncated to the minute
+    realtime = False
+
+    @abstractmethod
+    def get_routes(self, route_mkt: str, date_str: str, filter_name: str | None, direction: str | None) -> pd.DataFrame:
+        """Return the route variants of a route_mkt running on a date, with at least id and line_ref columns."""
+
+    @abstractmethod
+    def fetch_vehicle_locations(
+        self, line_refs: list[int], start_time: datetime, end_time: datetime
+    ) -> VehicleLocations:
+        """Return the fixes of the given line_refs recorded between start_time and end_time."""
+
+
+class StrideBackend(Backend):
+    """The open-bus stride archive, queried page by page."""
+
+    def get_routes(self, route_mkt, date_str, filter_name, direction):
+        """Return the route variants from stride's GTFS routes."""
+        return get_routes_for_route_mkt(route_mkt, date_str, date_str, filter_name, direction)
+
+    def fetch_vehicle_locations(self, line_refs, start_time, end_time):
+        """Return the fixes from stride's siri_vehicle_locations, in one batched query."""
+        return fetch_vehicle_locations(line_refs, start_time, end_time, session=get_session())
+
+
+def _materialize(value):
+    """Return a json_stream value as plain Python objects."""
+    if isinstance(value, StreamingJSONObject):
+        return {key: _materialize(item) for key, item in value.items()}
+    if isinstance(value, StreamingJSONList):
+        return [_materialize(item) for item in value]
+    return value
+
+
+def _float(value) -> float | None:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def siri_ride_id(data_frame_ref, journey_ref, line_ref) -> int:
+    """Return a stable id for a SIRI journey, which has no numeric ride id like stride's."""
+    return zlib.crc32(f"{data_frame_ref}/{journey_ref}/{line_ref}".encode())
+
+
+def parse_siri_vm(stream: IO[bytes], line_refs: set[int] | None = None) -> VehicleLocations:
+    """Parse a SIRI-VM JSON snapshot, keeping the vehicles of the given line_refs.
+
+    Vehicle activities are decoded one at a time, so a nationwide snapshot is
+    never held in memory as a whole.
+    """
+    records = []
+    siri = json_stream.load(stream)
+    for delivery in siri["Siri"]["ServiceDelivery"]["VehicleMonitoringDelivery"]:
+        for activity in delivery["VehicleActivity"]:
+            activity = _materialize(activity)
+            journey = activity.get("MonitoredVehicleJourney") or {}
+            try:
+                line_ref = int(journey["LineRef"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if line_refs is not None and line_ref not in line_refs:
+                continue
+            framed = journey.get("FramedVehicleJourneyRef") or {}
+            location = journey.get("VehicleLocation") or {}
+            records.append(
+                {
+                    "siri_ride__id": siri_ride_id(
+                        framed.get("DataFrameRef"), framed.get("DatedVehicleJourneyRef"), line_ref
+                    ),
+                    "siri_ride__vehicle_ref": journey.get("VehicleRef"),
+                    "siri_route__line_ref": line_ref,
+                    "lat": _float(location.get("Latitude")),
+                    "lon": _float(location.get("Longitude")),
+                    "velocity": _float(journey.get("Velocity")),
+                    "bearing": _float(journey.get("Bearing")),
+                    "recorded_at_time": activity.get("RecordedAtTime"),
+                    "siri_ride__scheduled_start_time": journey.get("OriginAimedDepartureTime"),
+                }
+            )
+    return parse_locations(records, len(records))
+
+
+class SiriVmBackend(StrideBackend):
+    """The Ministry of Transport's real-time SIRI-VM feed.
+
+    Each poll downloads one snapshot of every active vehicle, whatever the number
+    of lines, and keeps the fixes of the requested ones. A snapshot only holds the
+    latest fix per vehicle, so the fixes of earlier polls are kept for as long as
+    they fall in the queried window. Route metadata still comes from stride.
+    """
+
+    realtime = True
+
+    def __init__(self, url: str) -> None:
+        """Initialize with the snapshot URL, including the access key the ministry issued."""
+        self.url = url
+        self._history = VehicleLocations.empty()
+
+    def _open_snapshot(self) -> IO[bytes]:
+        """Return a stream of the current snapshot."""
+        res = get_session().get(self.url, stream=True, timeout=REQUEST_TIMEOUT)
+        res.raise_for_status()
+        res.raw.decode_content = True
+        return res.raw
+
+    def fetch_vehicle_locations(self, line_refs, start_time, end_time):
+        """Add a fresh snapshot to the fix history and return the fixes in the window."""
+        stream = self._open_snapshot()
+        try:
+            snapshot = parse_siri_vm(stream, set(line_refs))
+        finally:
+            stream.close()
+
+        merged = VehicleLocations.concat([self._history, snapshot])
+        times = merged["recorded_at_time"]
+        merged = merged.take(times >= start_time.timestamp())
+        # A vehicle that didn't report since the last poll is in the snapshot again
+        order = np.lexsort((merged["recorded_at_time"], merged["siri_ride__id"]))
+        rides = merged["siri_ride__id"][order]
+        times = merged["recorded_at_time"][order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (rides[1:] != rides[:-1]) | (times[1:] != times[:-1])
+        self._history = merged.take(order[first])
+
+        in_window = (self._history["recorded_at_time"] <= end_time.timestamp()) & np.isin(
+            self._history["siri_route__line_ref"], line_refs
+        )
+        _LOGGER.debug("SIRI-VM snapshot: %d fixes kept of %d in history", len(snapshot), len(self._history))
+        return self._history.take(in_window)
+
+
+class FileBackend(SiriVmBackend):
+    """SIRI-VM snapshots replayed from local files, for tests and offline use.
+
+    The source is a snapshot file, or a directory of them that is replayed in name
+    order, one file per poll, repeating the last one. A routes.json in the
+    directory maps each route_mkt to its route variants and replaces stride's.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Initialize with a snapshot file or directory."""
+        super().__init__(path)
+        if os.path.isdir(path):
+            snapshots = glob.glob(os.path.join(path, "*.json"))
+            self._snapshots = sorted(name for name in snapshots if os.path.basename(name) != FILE_BACKEND_ROUTES)
+            routes_path = os.path.join(path, FILE_BACKEND_ROUTES)
+        else:
+            self._snapshots = [path]
+            routes_path = os.path.join(os.path.dirname(path), FILE_BACKEND_ROUTES)
+        self._routes_path = routes_path if os.path.exists(routes_path) else None
+        self._next = 0
+
+    def _open_snapshot(self) -> IO[bytes]:
+        """Return the next snapshot file."""
+        if not self._snapshots:
+            raise FileNotFoundError(f"No SIRI-VM snapshots in {self.url}")
+        path = self._snapshots[min(self._next, len(self._snapshots) - 1)]
+        self._next += 1
+        return open(path, "rb")  # pylint: disable=consider-using-with
+
+    def get_routes(self, route_mkt, date_str, filter_name, direction):
+        """Return the route variants from routes.json, or from stride without one."""
+        if self._routes_path is None:
+            return super().get_routes(route_mkt, date_str, filter_name, direction)
+
+        with open(self._routes_path, encoding="utf-8") as file:
+            routes_df = pd.DataFrame(json.load(file).get(route_mkt, []))
+        if routes_df.empty:
+            return routes_df
+        if filter_name and "route_long_name" in routes_df.columns:
+            routes_df = routes_df[routes_df["route_long_name"].str.contains(filter_name, regex=False)]
+        if direction and "route_direction" in routes_df.columns:
+            routes_df = routes_df[routes_df["route_direction"].astype(str) == str(direction)]
+        return routes_df.reset_index(drop=True)
+
+
+def create_backend(backend: str, source: str | None = None) -> Backend:
+    """Return the backend configured in an entry's options."""
+    if backend == BACKEND_SIRI_VM:
+        return SiriVmBackend(source)
+    if backend == BACKEND_FILE:
+        return FileBackend(source)
+    if backend != BACKEND_STRIDE:
+        _LOGGER.warning("Unknown backend %s, using stride", backend)
+    return StrideBackend()
@@ -0,0 +1,61 @@
+"""Support for Bus Line Tracker binary sensors."""
+
+from __future__ import annotations
+
+from homeassistant.components.binary_sensor import BinarySensorEntity
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
+
+from .const import ATTR_BUNCHED_VEHICLES, ATTR_BUNCHING, CONF_COMPACT, CONF_ROUTES, DOMAIN
+from .route import RouteConfig, entry_routes, route_device_info, route_label, route_unique_id
+
+
+async def async_setup_entry(
+    hass: HomeAssistant,
+    config_entry: ConfigEntry,
+    async_add_entities: AddEntitiesCallback,
+) -> None:
+    """Set up the Bus Line Tracker binary sensors."""
+    coordinator = hass.data[DOMAIN][config_entry.entry_id]
+
+    async_add_entities(
+        [BusBunchingBinarySensor(coordinator, config_entry, route) for route in entry_routes(config_entry)], True
+    )
+
+
+class BusBunchingBinarySensor(CoordinatorEntity, BinarySensorEntity):
+    """On while consecutive buses of the route run closer together than BUNCHING_HEADWAY."""
+
+    _attr_icon = "mdi:bus-multiple"
+
+    def __init__(self, coordinator, config_entry, route: RouteConfig | None = None):
+        """Initialize the sensor, for the entry's first route unless one is given."""
+        super().__init__(coordinator)
+        self._route = route or entry_routes(config_entry)[0]
+        name = "Bus Bunching"
+        if CONF_ROUTES in config_entry.data:
+            name = f"{route_label(config_entry, self._route)} {name}"
+        self._attr_name = name
+        self._attr_unique_id = f"{route_unique_id(config_entry, self._route)}_binary_sensor.bus_bunching"
+        self._attr_device_info = route_device_info(config_entry, self._route)
+        # In compact mode the summary sensor carries the value; this one is opt-in
+        self._attr_entity_registry_enabled_default = not config_entry.options.get(CONF_COMPACT)
+
+    @property
+    def route_data(self) -> dict:
+        """Return the coordinator's data for this sensor's route."""
+        return (self.coordinator.data or {}).get(self._route.key) or {}
+
+    @property
+    def is_on(self) -> bool | None:
+        """Return True if any two consecutive buses are bunched."""
+        return self.route_data.get(ATTR_BUNCHING)
+
+    @property
+    def extra_state_attributes(self):
+        """Return the vehicles that are bunched."""
+        if not self.route_data.get(ATTR_BUNCHING):
+            return {}
+        return {"vehicles": self.route_data[ATTR_BUNCHED_VEHICLES]}
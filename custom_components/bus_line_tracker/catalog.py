@@ -0,0 +1,346 @@
+"""Locally cached GTFS catalogs used by the Bus Line Tracker config flow."""
+
+from __future__ import annotations
+
+import bisect
+import logging
+import math
+import os
+import pickle
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import stride
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import STORAGE_DIR
+
+from .const import DATA_ROUTE_CATALOG, DATA_STOP_CATALOG, DOMAIN
+from .geo import haversine_distance
+from .gtfs_store import GtfsStore, async_get_gtfs_store
+
+_LOGGER = logging.getLogger(__name__)
+
+STOP_CATALOG_FILE = "stops.pickle"
+STOP_CATALOG_LIMIT = 100000  # Israel has ~30k active stops
+ROUTE_CATALOG_FILE = "routes.pickle"
+ROUTE_CATALOG_LIMIT = 100000  # one row per route_mkt, direction and alternative
+GRID_CELL_SIZE = 0.01  # degrees, roughly 1.1 km of latitude
+METERS_PER_DEGREE = 111320
+
+
+@dataclass(frozen=True)
+class Stop:
+    """A GTFS stop."""
+
+    code: str
+    name: str
+    city: str | None
+    lat: float
+    lon: float
+
+    @property
+    def label(self) -> str:
+        """Return a human readable label for the stop."""
+        if self.city:
+            return f"{self.name}, {self.city} ({self.code})"
+        return f"{self.name} ({self.code})"
+
+
+class StopCatalog:
+    """All stops of a single GTFS day, bucketed in a lat/lon grid."""
+
+    def __init__(self, date_str: str, stops: list[Stop], cell_size: float = GRID_CELL_SIZE) -> None:
+        """Initialize the catalog and build the grid index."""
+        self.date_str = date_str
+        self.cell_size = cell_size
+        self._stops = {stop.code: stop for stop in stops}
+        self._grid: dict[tuple[int, int], list[Stop]] = {}
+        for stop in self._stops.values():
+            self._grid.setdefault(self._cell(stop.lat, stop.lon), []).append(stop)
+        self._lat_cells = (min((c[0] for c in self._grid), default=0), max((c[0] for c in self._grid), default=0))
+        self._lon_cells = (min((c[1] for c in self._grid), default=0), max((c[1] for c in self._grid), default=0))
+
+    def __len__(self) -> int:
+        """Return the number of stops in the catalog."""
+        return len(self._stops)
+
+    def _cell(self, lat: float, lon: float) -> tuple[int, int]:
+        return math.floor(lat / self.cell_size), math.floor(lon / self.cell_size)
+
+    def get(self, code: str) -> Stop | None:
+        """Return the stop with the given code."""
+        return self._stops.get(code)
+
+    def nearest(self, lat: float, lon: float, count: int = 5, max_distance: float | None = None):
+        """Return up to `count` (distance, stop) pairs closest to the given point.
+
+        Grid rings are scanned outwards from the point's cell until no unscanned
+        cell can hold a stop closer than the current `count`-th candidate.
+        """
+        if not self._grid:
+            return []
+
+        center_lat, center_lon = self._cell(lat, lon)
+        # Width of a cell in meters along its narrowest (longitude) side
+        cell_meters = self.cell_size * METERS_PER_DEGREE * math.cos(math.radians(lat))
+        max_ring = max(
+            abs(center_lat - self._lat_cells[0]),
+            abs(center_lat - self._lat_cells[1]),
+            abs(center_lon - self._lon_cells[0]),
+            abs(center_lon - self._lon_cells[1]),
+        )
+
+        candidates = []
+        for ring in range(max_ring + 1):
+            for d_lat in range(-ring, ring + 1):
+                for d_lon in range(-ring, ring + 1):
+                    if max(abs(d_lat), abs(d_lon)) != ring:
+                        continue
+                    for stop in self._grid.get((center_lat + d_lat, center_lon + d_lon), ()):
+                        candidates.append((haversine_distance(lat, lon, stop.lat, stop.lon), stop))
+
+            # Anything in the next ring is at least `ring` full cells away
+            bound = ring * cell_meters
+            if max_distance is not None and bound > max_distance:
+                break
+            if len(candidates) >= count:
+                candidates.sort(key=lambda item: item[0])
+                if candidates[count - 1][0] <= bound:
+                    break
+
+        candidates.sort(key=lambda item: item[0])
+        if max_distance is not None:
+            candidates = [item for item in candidates if item[0] <= max_distance]
+        return candidates[:count]
+
+
+@dataclass(frozen=True)
+class Route:
+    """A GTFS route variant (one direction and alternative of a route_mkt)."""
+
+    route_mkt: str
+    short_name: str
+    long_name: str
+    direction: str
+    alternative: str
+    line_ref: int
+    agency: str | None
+
+    @property
+    def label(self) -> str:
+        """Return a human readable label for the route."""
+        return f"{self.short_name} ({self.route_mkt}, direction {self.direction}): {self.long_name}"
+
+
+_TOKEN_SPLIT = re.compile(r"[\s\-<>/()]+")
+
+
+def _normalize(text: str) -> str:
+    return text.strip().casefold()
+
+
+class RouteCatalog:
+    """All routes of a single GTFS day with an in-memory prefix index.
+
+    The index is a sorted list of (key, position) pairs over route_mkt, the short
+    name and every word of the long name, so a prefix lookup is a bisect followed
+    by a scan over the matching slice only.
+    """
+
+    def __init__(self, date_str: str, routes: list[Route]) -> None:
+        """Initialize the catalog and build the prefix index."""
+        self.date_str = date_str
+        self._routes = routes
+        self._by_route_mkt: dict[str, list[Route]] = {}
+        index = set()
+        for position, route in enumerate(routes):
+            self._by_route_mkt.setdefault(route.route_mkt, []).append(route)
+            index.add((_normalize(route.route_mkt), position))
+            index.add((_normalize(route.short_name), position))
+            for token in _TOKEN_SPLIT.split(route.long_name):
+                if token:
+                    index.add((_normalize(token), position))
+        self._index = sorted(index)
+
+    def __len__(self) -> int:
+        """Return the number of route variants in the catalog."""
+        return len(self._routes)
+
+    def get(self, route_mkt: str) -> list[Route]:
+        """Return all variants of the given route_mkt."""
+        return self._by_route_mkt.get(route_mkt, [])
+
+    def search(self, prefix: str, limit: int = 10) -> list[Route]:
+        """Return up to `limit` routes with a key starting with `prefix`."""
+        prefix = _normalize(prefix)
+        if not prefix:
+            return []
+
+        found: dict[int, Route] = {}
+        start = bisect.bisect_left(self._index, (prefix, -1))
+        for key, position in self._index[start:]:
+            if not key.startswith(prefix):
+                break
+            found.setdefault(position, self._routes[position])
+        return sorted(found.values(), key=lambda route: (len(route.route_mkt), route.route_mkt, route.direction))[
+            :limit
+        ]
+
+    def matches(self, route_mkt: str, filter_name: str | None = None, direction: str | None = None) -> list[Route]:
+        """Return the variants of route_mkt the coordinator would track for these filters."""
+        routes = self.get(route_mkt)
+        if filter_name:
+            routes = [route for route in routes if filter_name in route.long_name]
+        if direction:
+            routes = [route for route in routes if route.direction == direction]
+        return routes
+
+
+def israel_date_str(now: datetime | None = None) -> str:
+    """Return the current GTFS service date in Israel."""
+    now = now or datetime.now(ZoneInfo("Israel"))
+    return now.astimezone(ZoneInfo("Israel")).strftime("%Y-%m-%d")
+
+
+def build_stop_catalog(date_str: str) -> StopCatalog:
+    """Download all stops for the given date from stride and index them."""
+    stops = []
+    for item in stride.iterate(
+        "/gtfs_stops/list",
+        {"date_from": date_str, "date_to": date_str},
+        limit=STOP_CATALOG_LIMIT,
+    ):
+        if item.get("lat") is None or item.get("lon") is None:
+            continue
+        stops.append(
+            Stop(
+                code=str(item["code"]),
+                name=item.get("name") or "",
+                city=item.get("city"),
+                lat=float(item["lat"]),
+                lon=float(item["lon"]),
+            )
+        )
+    _LOGGER.debug("Built stop catalog for %s with %d stops", date_str, len(stops))
+    return StopCatalog(date_str, stops)
+
+
+def build_stop_catalog_from_store(store: GtfsStore, date_str: str) -> StopCatalog:
+    """Index the stops of a local GTFS store."""
+    stops = [Stop(code=code, name=name, city=None, lat=lat, lon=lon) for code, name, lat, lon in store.stops()]
+    _LOGGER.debug("Built stop catalog for %s with %d stops from the GTFS store", date_str, len(stops))
+    return StopCatalog(date_str, stops)
+
+
+def build_route_catalog(date_str: str) -> RouteCatalog:
+    """Download all routes for the given date from stride and index them."""
+    routes = []
+    for item in stride.iterate(
+        "/gtfs_routes/list",
+        {"date_from": date_str, "date_to": date_str},
+        limit=ROUTE_CATALOG_LIMIT,
+    ):
+        if item.get("route_mkt") is None or item.get("line_ref") is None:
+            continue
+        routes.append(
+            Route(
+                route_mkt=str(item["route_mkt"]),
+                short_name=str(item.get("route_short_name") or ""),
+                long_name=item.get("route_long_name") or "",
+                direction=str(item.get("route_direction") or ""),
+                alternative=str(item.get("route_alternative") or ""),
+                line_ref=int(item["line_ref"]),
+                agency=item.get("agency_name"),
+            )
+        )
+    _LOGGER.debug("Built route catalog for %s with %d routes", date_str, len(routes))
+    return RouteCatalog(date_str, routes)
+
+
+def _read_pickle(path: str):
+    try:
+        with open(path, "rb") as file:
+            return pickle.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as e:
+        _LOGGER.warning("Ignoring unreadable catalog cache %s: %s", path, e)
+        return None
+
+
+def _write_pickle(path: str, obj) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as file:
+        pickle.dump(obj, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def load_cached_catalog(path: str, date_str: str, builder):
+    """Return the catalog pickled at `path`, rebuilding it once per date.
+
+    If rebuilding fails the previous day's catalog is returned rather than nothing.
+    """
+    cached = _read_pickle(path)
+    if cached is not None and cached.date_str == date_str:
+        return cached
+
+    try:
+        catalog = builder(date_str)
+    except Exception:
+        if cached is None:
+            raise
+        _LOGGER.warning("Failed to rebuild catalog %s, using the one from %s", path, cached.date_str, exc_info=True)
+        return cached
+
+    _write_pickle(path, catalog)
+    return catalog
+
+
+def catalog_path(hass: HomeAssistant, filename: str) -> str:
+    """Return the on-disk location of a cached catalog."""
+    return hass.config.path(STORAGE_DIR, DOMAIN, filename)
+
+
+async def _async_get_catalog(hass: HomeAssistant, data_key: str, filename: str, builder):
+    """Return today's catalog from hass.data, loading or building it if needed."""
+    date_str = israel_date_str()
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    catalog = domain_data.get(data_key)
+    if catalog is not None and catalog.date_str == date_str:
+        return catalog
+
+    catalog = await hass.async_add_executor_job(
+        load_cached_catalog,
+        catalog_path(hass, filename),
+        date_str,
+        builder,
+    )
+    domain_data[data_key] = catalog
+    return catalog
+
+
+async def async_get_stop_catalog(hass: HomeAssistant) -> StopCatalog:
+    """Return today's stop catalog, loading or building it if needed.
+
+    With a local GTFS store the catalog is indexed from its mapped columns
+    instead of downloaded, and isn't cached on disk.
+    """
+    store = await async_get_gtfs_store(hass)
+    if store is not None:
+        date_str = israel_date_str()
+        domain_data = hass.data.setdefault(DOMAIN, {})
+        catalog = domain_data.get(DATA_STOP_CATALOG)
+        if catalog is None or catalog.date_str != date_str:
+            catalog = await hass.async_add_executor_job(build_stop_catalog_from_store, store, date_str)
+            domain_data[DATA_STOP_CATALOG] = catalog
+        return catalog
+
+    return await _async_get_catalog(hass, DATA_STOP_CATALOG, STOP_CATALOG_FILE, build_stop_catalog)
+
+
+async def async_get_route_catalog(hass: HomeAssistant) -> RouteCatalog:
+    """Return today's route catalog, loading or building it if needed."""
+    return await _async_get_catalog(hass, DATA_ROUTE_CATALOG, ROUTE_CATALOG_FILE, build_route_catalog)
@@ -1,27 +1,54 @@
 """Config flow for Bus Line Tracker integration."""
 
+import logging
+
 import voluptuous as vol
 from homeassistant import config_entries
 from homeassistant.core import callback
 
+from .catalog import async_get_route_catalog, async_get_stop_catalog
 from .const import (
+    BACKEND_STRIDE,
+    BACKENDS,
+    CONF_ADD_ANOTHER,
+    CONF_BACKEND,
+    CONF_BACKEND_SOURCE,
+    CONF_COMPACT,
     CONF_DIRECTION,
+    CONF_EXECUTOR_WORKERS,
     CONF_FILTER_NAME,
+    CONF_INTERPOLATION_INTERVAL,
     CONF_LAT,
     CONF_LON,
+    CONF_PLACES,
     CONF_ROUTE_MKT,
+    CONF_ROUTES,
+    CONF_STOP,
     CONF_UPDATE_INTERVAL,
     CONF_WALKING_TIME,
+    DEFAULT_BACKEND,
+    DEFAULT_EXECUTOR_WORKERS,
+    DEFAULT_INTERPOLATION_INTERVAL,
     DEFAULT_UPDATE_INTERVAL,
     DEFAULT_WALKING_TIME,
     DOMAIN,
+    ROUTE_SUGGESTIONS,
+    STOP_SUGGESTION_RADIUS,
+    STOP_SUGGESTIONS,
 )
+from .route import RouteConfig, parse_places
+
+_LOGGER = logging.getLogger(__name__)
 
 # Validation constants
 MIN_UPDATE_INTERVAL = 10  # seconds
 MAX_UPDATE_INTERVAL = 3600  # seconds
 MIN_WALKING_TIME = 1  # minutes
 MAX_WALKING_TIME = 60  # minutes
+MIN_EXECUTOR_WORKERS = 1
+MAX_EXECUTOR_WORKERS = 8
+MIN_INTERPOLATION_INTERVAL = 0  # seconds, 0 disables
+MAX_INTERPOLATION_INTERVAL = 60  # seconds
 MIN_LAT = 29.0  # Southernmost point of Israel
 MAX_LAT = 34.0  # Northernmost point of Israel
 MIN_LON = 34.0  # Westernmost point of Israel
@@ -33,15 +60,39 @@ class BusLineTrackerConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
 
     VERSION = 1
 
+    def __init__(self):
+        """Initialize the config flow."""
+        self._stop_catalog = None
+        self._route_catalog = None
+        # Routes entered so far when adding several routes to one entry
+        self._routes = []
+
     async def async_step_user(self, user_input=None):
         """Handle the initial step."""
         errors = {}
+        suggestions = []
+
+        if user_input is None and not self._routes:
+            # Catalogs are loaded when the form is first shown so submitting never waits on the network
+            self._stop_catalog = await self._async_get_catalog(async_get_stop_catalog)
+            self._route_catalog = await self._async_get_catalog(async_get_route_catalog)
+        elif user_input is not None:
+            user_input = dict(user_input)
+            add_another = user_input.pop(CONF_ADD_ANOTHER, False)
 
-        if user_input is not None:
             # Validate route_mkt format (should be numeric)
             if not user_input[CONF_ROUTE_MKT].isdigit():
                 errors[CONF_ROUTE_MKT] = "invalid_route_mkt"
 
+            # A chosen stop overrides the reference point
+            if user_input.get(CONF_STOP):
+                stop = self._stop_catalog.get(user_input[CONF_STOP]) if self._stop_catalog else None
+                if stop is None:
+                    errors[CONF_STOP] = "unknown_stop"
+                else:
+                    user_input[CONF_LAT] = stop.lat
+                    user_input[CONF_LON] = stop.lon
+
             # Validate lat/lon if provided
             if CONF_LAT in user_input and user_input[CONF_LAT] is not None:
                 if not MIN_LAT <= user_input[CONF_LAT] <= MAX_LAT:
@@ -66,25 +117,101 @@ class BusLineTrackerConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                 if user_input[CONF_DIRECTION] not in ["1", "2"]:
                     errors[CONF_DIRECTION] = "invalid_direction"
 
+            # Check the route against the local route catalog
+            if self._route_catalog and CONF_ROUTE_MKT not in errors and CONF_DIRECTION not in errors:
+                suggestions = self._validate_route(user_input, errors)
+
+            # Every route of an entry needs its own key
             if not errors:
-                return self.async_create_entry(title=f"Bus Line {user_input[CONF_ROUTE_MKT]}", data=user_input)
+                keys = {RouteConfig.from_dict(route).key for route in self._routes}
+                if RouteConfig.from_dict(user_input).key in keys:
+                    errors["base"] = "duplicate_route"
+
+            if not errors:
+                if add_another:
+                    self._routes.append(user_input)
+                    return await self.async_step_user()
+                return self._async_create_entry(user_input)
+
+        schema = {
+            vol.Required(CONF_ROUTE_MKT): str,
+            vol.Optional(CONF_FILTER_NAME): str,
+            vol.Optional(CONF_DIRECTION): str,
+        }
+        stop_options = self._nearest_stop_options()
+        if stop_options:
+            schema[vol.Optional(CONF_STOP)] = vol.In(stop_options)
+        schema.update(
+            {
+                vol.Optional(CONF_LAT): float,
+                vol.Optional(CONF_LON): float,
+                vol.Optional(CONF_WALKING_TIME, default=DEFAULT_WALKING_TIME): int,
+                vol.Optional(CONF_UPDATE_INTERVAL, default=DEFAULT_UPDATE_INTERVAL): int,
+                vol.Optional(CONF_ADD_ANOTHER, default=False): bool,
+            }
+        )
 
         return self.async_show_form(
             step_id="user",
-            data_schema=vol.Schema(
-                {
-                    vol.Required(CONF_ROUTE_MKT): str,
-                    vol.Optional(CONF_FILTER_NAME): str,
-                    vol.Optional(CONF_DIRECTION): str,
-                    vol.Optional(CONF_LAT): float,
-                    vol.Optional(CONF_LON): float,
-                    vol.Optional(CONF_WALKING_TIME, default=DEFAULT_WALKING_TIME): int,
-                    vol.Optional(CONF_UPDATE_INTERVAL, default=DEFAULT_UPDATE_INTERVAL): int,
-                }
-            ),
+            data_schema=vol.Schema(schema),
             errors=errors,
+            description_placeholders={
+                "routes": ", ".join(route[CONF_ROUTE_MKT] for route in self._routes) or "-",
+                "suggestions": "\n".join(f"- {route.label}" for route in suggestions),
+            },
+        )
+
+    def _async_create_entry(self, user_input):
+        """Create an entry for the last route, together with the routes added before it."""
+        if not self._routes:
+            return self.async_create_entry(title=f"Bus Line {user_input[CONF_ROUTE_MKT]}", data=user_input)
+
+        # The polling interval is entry-wide, so it is taken from the last form and kept with the options
+        update_interval = user_input.pop(CONF_UPDATE_INTERVAL, DEFAULT_UPDATE_INTERVAL)
+        for route in self._routes:
+            route.pop(CONF_UPDATE_INTERVAL, None)
+        routes = [*self._routes, user_input]
+        return self.async_create_entry(
+            title=f"Bus Lines {', '.join(route[CONF_ROUTE_MKT] for route in routes)}",
+            data={CONF_ROUTES: routes},
+            options={CONF_UPDATE_INTERVAL: update_interval},
         )
 
+    async def _async_get_catalog(self, getter):
+        """Return a cached catalog, or None if it cannot be loaded."""
+        try:
+            return await getter(self.hass)
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.debug("Catalog unavailable, skipping suggestions and route validation", exc_info=True)
+            return None
+
+    def _validate_route(self, user_input, errors):
+        """Validate the route filters against the route catalog and return suggestions."""
+        route_mkt = user_input[CONF_ROUTE_MKT]
+        variants = self._route_catalog.get(route_mkt)
+        if not variants:
+            errors[CONF_ROUTE_MKT] = "unknown_route_mkt"
+            return self._route_catalog.search(route_mkt, limit=ROUTE_SUGGESTIONS)
+
+        if not self._route_catalog.matches(route_mkt, user_input.get(CONF_FILTER_NAME), user_input.get(CONF_DIRECTION)):
+            errors[CONF_FILTER_NAME] = "no_matching_routes"
+            return variants[:ROUTE_SUGGESTIONS]
+
+        return []
+
+    def _nearest_stop_options(self):
+        """Return the stops closest to the Home Assistant home location."""
+        if not self._stop_catalog:
+            return {}
+
+        nearest = self._stop_catalog.nearest(
+            self.hass.config.latitude,
+            self.hass.config.longitude,
+            count=STOP_SUGGESTIONS,
+            max_distance=STOP_SUGGESTION_RADIUS,
+        )
+        return {stop.code: f"{stop.label} - {distance:.0f} m" for distance, stop in nearest}
+
     @staticmethod
     @callback
     def async_get_options_flow(config_entry):
@@ -104,9 +231,9 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
         errors = {}
 
         if user_input is not None:
-            # Validate walking time
-            walking_time = user_input.get(CONF_WALKING_TIME, DEFAULT_WALKING_TIME)
-            if not MIN_WALKING_TIME <= walking_time <= MAX_WALKING_TIME:
+            # Validate walking time, left out to keep each route's own
+            walking_time = user_input.get(CONF_WALKING_TIME)
+            if walking_time is not None and not MIN_WALKING_TIME <= walking_time <= MAX_WALKING_TIME:
                 errors[CONF_WALKING_TIME] = "invalid_walking_time"
 
             # Validate update interval
@@ -114,18 +241,68 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
             if not MIN_UPDATE_INTERVAL <= update_interval <= MAX_UPDATE_INTERVAL:
                 errors[CONF_UPDATE_INTERVAL] = "invalid_update_interval"
 
+            # Validate worker pool size
+            executor_workers = user_input.get(CONF_EXECUTOR_WORKERS, DEFAULT_EXECUTOR_WORKERS)
+            if not MIN_EXECUTOR_WORKERS <= executor_workers <= MAX_EXECUTOR_WORKERS:
+                errors[CONF_EXECUTOR_WORKERS] = "invalid_executor_workers"
+
+            # Validate position interpolation tick
+            interpolation_interval = user_input.get(CONF_INTERPOLATION_INTERVAL, DEFAULT_INTERPOLATION_INTERVAL)
+            if not MIN_INTERPOLATION_INTERVAL <= interpolation_interval <= MAX_INTERPOLATION_INTERVAL:
+                errors[CONF_INTERPOLATION_INTERVAL] = "invalid_interpolation_interval"
+
+            # The real-time feed and the file replay need a URL or path
+            backend = user_input.get(CONF_BACKEND, DEFAULT_BACKEND)
+            if backend != BACKEND_STRIDE and not user_input.get(CONF_BACKEND_SOURCE):
+                errors[CONF_BACKEND_SOURCE] = "missing_backend_source"
+
+            # Validate places, each within Israel
+            try:
+                places = parse_places(user_input.get(CONF_PLACES))
+            except ValueError:
+                errors[CONF_PLACES] = "invalid_places"
+            else:
+                if any(not (MIN_LAT <= place.lat <= MAX_LAT and MIN_LON <= place.lon <= MAX_LON) for place in places):
+                    errors[CONF_PLACES] = "invalid_places"
+
             if not errors:
                 return self.async_create_entry(title="", data=user_input)
 
         options = {
             vol.Optional(
                 CONF_UPDATE_INTERVAL,
-                default=self.config_entry.options.get(CONF_UPDATE_INTERVAL, DEFAULT_UPDATE_INTERVAL),
+                default=self.config_entry.options.get(
+                    CONF_UPDATE_INTERVAL, self.config_entry.data.get(CONF_UPDATE_INTERVAL, DEFAULT_UPDATE_INTERVAL)
+                ),
             ): int,
             vol.Optional(
                 CONF_WALKING_TIME,
-                default=self.config_entry.options.get(CONF_WALKING_TIME, DEFAULT_WALKING_TIME),
+                description={"suggested_value": self.config_entry.options.get(CONF_WALKING_TIME)},
+            ): int,
+            vol.Optional(
+                CONF_EXECUTOR_WORKERS,
+                default=self.config_entry.options.get(CONF_EXECUTOR_WORKERS, DEFAULT_EXECUTOR_WORKERS),
+            ): int,
+            vol.Optional(
+                CONF_INTERPOLATION_INTERVAL,
+                default=self.config_entry.options.get(CONF_INTERPOLATION_INTERVAL, DEFAULT_INTERPOLATION_INTERVAL),
             ): int,
+            vol.Optional(
+                CONF_BACKEND,
+                default=self.config_entry.options.get(CONF_BACKEND, DEFAULT_BACKEND),
+            ): vol.In(BACKENDS),
+            vol.Optional(
+                CONF_BACKEND_SOURCE,
+                description={"suggested_value": self.config_entry.options.get(CONF_BACKEND_SOURCE)},
+            ): str,
+            vol.Optional(
+                CONF_PLACES,
+                description={"suggested_value": self.config_entry.options.get(CONF_PLACES)},
+            ): str,
+            vol.Optional(
+                CONF_COMPACT,
+                default=self.config_entry.options.get(CONF_COMPACT, False),
+            ): bool,
         }
 
         return self.async_show_form(
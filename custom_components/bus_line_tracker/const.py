@@ -1,5 +1,7 @@
 """Constants for the Bus Line Tracker integration."""
 
+from datetime import time, timedelta
+
 DOMAIN = "bus_line_tracker"
 
 # Configuration
@@ -13,10 +15,98 @@ CONF_WALKING_TIME = "walking_time"
 CONF_TIME_WINDOWS = "time_windows"
 CONF_LAT = "lat"
 CONF_LON = "lon"
+CONF_STOP = "stop"
+CONF_EXECUTOR_WORKERS = "executor_workers"
+CONF_INTERPOLATION_INTERVAL = "interpolation_interval"
+CONF_ADD_ANOTHER = "add_another"
+CONF_BACKEND = "backend"
+CONF_BACKEND_SOURCE = "backend_source"
+CONF_PLACES = "places"
+CONF_COMPACT = "compact"
+# Unique id suffix of compact mode's summary sensor, the only entity it leaves enabled
+COMPACT_SUMMARY_SUFFIX = "_sensor.bus"
+
+# Backends
+BACKEND_STRIDE = "stride"
+BACKEND_SIRI_VM = "siri_vm"
+BACKEND_FILE = "file"
+BACKENDS = [BACKEND_STRIDE, BACKEND_SIRI_VM, BACKEND_FILE]
 
 # Defaults
 DEFAULT_UPDATE_INTERVAL = 30
 DEFAULT_WALKING_TIME = 7
+DEFAULT_EXECUTOR_WORKERS = 2
+DEFAULT_INTERPOLATION_INTERVAL = 0  # seconds, 0 disables
+DEFAULT_BACKEND = BACKEND_STRIDE
+
+# Dead-reckoned positions never move further than this from the last fix
+MAX_DEAD_RECKONING_DISTANCE = 500  # meters
+# Fixes recorded longer ago than this are not extrapolated at all
+MAX_DEAD_RECKONING_AGE = 120  # seconds
+
+# Speed and heading derived from each vehicle's latest fixes when SIRI reports none
+VEHICLE_INDEX_FIXES = 5
+VEHICLE_INDEX_MAX_AGE = timedelta(minutes=30)  # vehicles silent for longer are evicted
+MAX_PLAUSIBLE_SPEED = 120  # km/h; faster steps between fixes are GPS jumps
+MIN_HEADING_DISTANCE = 10  # meters moved before a heading is derived
+
+# Backoff for line_refs that return no vehicle locations
+NEGATIVE_CACHE_BASE_TTL = timedelta(seconds=60)
+NEGATIVE_CACHE_MAX_TTL = timedelta(minutes=10)
+
+# Arrival estimates, km/h; slower fixes use the fallback speed
+ETA_MIN_SPEED = 5
+ETA_FALLBACK_SPEED = 20
+
+# A bus arrives when it passes within ARRIVAL_RADIUS of the reference point; live
+# detection waits until it is ARRIVAL_HYSTERESIS further away again
+ARRIVAL_RADIUS = 150  # meters
+ARRIVAL_HYSTERESIS = 30  # meters
+
+# Every poll asks for the fixes of this long before it
+LOCATIONS_LOOKBACK = timedelta(minutes=30)
+
+# Historical punctuality analytics
+ANALYTICS_DIR = "analytics"  # under <config>/bus_line_tracker
+ANALYTICS_MAX_DAYS = 62
+ANALYTICS_MAX_WORKERS = 2  # processes
+
+# Consecutive buses of a route closer than this are bunched
+BUNCHING_HEADWAY = 120  # seconds
+
+# Position trails of the tracked buses, drawn from the fetched fixes
+TRAIL_MAX_POINTS = 120
+TRAIL_MIN_DISTANCE = 15  # meters between kept points
+
+# Frame tracing for diagnostics, in refreshes kept
+TRACE_DEFAULT_REFRESHES = 10
+TRACE_MAX_REFRESHES = 100
+
+# HTTP response cache, under <config>/.storage/bus_line_tracker
+HTTP_CACHE_DIR = "http_cache"
+HTTP_CACHE_MAX_DISK_SIZE = 256 * 1024 * 1024  # bytes
+HTTP_CACHE_MAX_MEMORY_SIZE = 16 * 1024 * 1024  # bytes of revalidatable responses
+# Pages of periods that ended this long ago are final
+HTTP_CACHE_IMMUTABLE_AGE = timedelta(days=1)
+
+# GTFS static store built from a local feed, under <config>/.storage/bus_line_tracker
+GTFS_STORE_DIR = "gtfs"
+
+# Next-day route prefetch, Israel time
+PREFETCH_START = time(23, 30)
+PREFETCH_WINDOW = timedelta(minutes=20)
+
+# Config flow stop suggestions
+STOP_SUGGESTIONS = 5
+STOP_SUGGESTION_RADIUS = 2000  # meters
+
+# hass.data keys shared across config entries
+DATA_STOP_CATALOG = "stop_catalog"
+DATA_ROUTE_CATALOG = "route_catalog"
+DATA_GTFS_STORE = "gtfs_store"
+
+# Config flow route suggestions
+ROUTE_SUGGESTIONS = 5
 
 # Sensor attributes
 ATTR_LOCATION = "location"
@@ -26,6 +116,22 @@ ATTR_DISTANCE_FROM_START = "distance_from_start"
 ATTR_DISTANCE_FROM_STATION = "distance_from_station"
 ATTR_VEHICLE_REF = "vehicle_ref"
 ATTR_LAST_UPDATE = "last_update"
+ATTR_ESTIMATED_ARRIVAL = "estimated_arrival"
+ATTR_LEAVE_AT = "leave_at"
+ATTR_LAST_ARRIVAL = "last_arrival"
+ATTR_TRAIL = "trail"
+ATTR_HEADWAY = "headway"
+ATTR_HEADWAY_GAPS = "headway_gaps"
+ATTR_BUNCHING = "bunching"
+ATTR_BUNCHED_VEHICLES = "bunched_vehicles"
+ATTR_PLACES = "places"
+
+# Events
+EVENT_LEAVE_NOW = f"{DOMAIN}_leave_now"
+EVENT_ARRIVAL = f"{DOMAIN}_arrival"
+
+# Dispatcher signal sent when an entry unloads, formatted with its entry_id
+SIGNAL_ENTRY_UNLOADED = f"{DOMAIN}_unloaded_{{}}"
 
 # Units
 SPEED_UNITS = "km/h"
@@ -2,10 +2,13 @@
 
 from __future__ import annotations
 
+from datetime import timedelta
+
 from homeassistant.components.device_tracker import SourceType, TrackerEntity
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.event import async_track_time_interval
 from homeassistant.helpers.update_coordinator import CoordinatorEntity
 
 from .const import (
@@ -17,10 +20,18 @@ from .const import (
     ATTR_DISTANCE_FROM_START, 
     ATTR_DISTANCE_FROM_STATION,
     ATTR_LAST_UPDATE,
+    ATTR_TRAIL,
     SPEED_UNITS,
     DISTANCE_UNITS,
-    BEARING_UNITS
+    BEARING_UNITS,
+    CONF_COMPACT,
+    CONF_INTERPOLATION_INTERVAL,
+    DEFAULT_INTERPOLATION_INTERVAL,
+    MAX_DEAD_RECKONING_AGE,
+    MAX_DEAD_RECKONING_DISTANCE,
 )
+from .interpolation import DeadReckoner
+from .route import RouteConfig, entry_routes, route_device_info, route_label, route_unique_id
 
 
 async def async_setup_entry(
@@ -31,32 +42,95 @@ async def async_setup_entry(
     """Set up Bus Line Tracker device tracker from a config entry."""
     coordinator = hass.data[DOMAIN][config_entry.entry_id]
 
-    trackers = [
-        BusPositionTracker(coordinator, config_entry),
-    ]
+    trackers = [BusPositionTracker(coordinator, config_entry, route) for route in entry_routes(config_entry)]
 
     async_add_entities(trackers, True)
 
 
 class BusPositionTracker(CoordinatorEntity, TrackerEntity):
-    """Bus position tracker."""
+    """Bus position tracker for one route of an entry."""
 
     _attr_has_entity_name = True
+    # The trail changes with every fix and is only useful live
+    _unrecorded_attributes = frozenset({ATTR_TRAIL})
 
-    def __init__(self, coordinator, config_entry):
-        """Initialize the tracker."""
+    def __init__(self, coordinator, config_entry, route: RouteConfig | None = None):
+        """Initialize the tracker, for the entry's first route unless one is given."""
         super().__init__(coordinator)
         self._config_entry = config_entry
-        route_mkt = config_entry.data.get("route_mkt", "")
-        self._attr_name = f"Bus {route_mkt} Position"
-        self._attr_unique_id = f"{config_entry.entry_id}_bus_position"
-        self._attr_device_info = {
-            "identifiers": {(DOMAIN, config_entry.entry_id)},
-            "name": f"Bus Line {route_mkt}",
-            "manufacturer": "Israeli Ministry of Transport",
-            "model": "SIRI API Bus Tracker",
-        }
+        self._route = route or entry_routes(config_entry)[0]
+        self._label = route_label(config_entry, self._route)
+        self._attr_name = f"Bus {self._label} Position"
+        self._attr_unique_id = f"{route_unique_id(config_entry, self._route)}_bus_position"
+        self._attr_device_info = route_device_info(config_entry, self._route)
         self._attr_icon = "mdi:bus"
+        # In compact mode the summary sensor carries the position; the tracker is opt-in
+        self._attr_entity_registry_enabled_default = not config_entry.options.get(CONF_COMPACT)
+        self._interpolation_interval = config_entry.options.get(
+            CONF_INTERPOLATION_INTERVAL, DEFAULT_INTERPOLATION_INTERVAL
+        )
+        self._reckoner = DeadReckoner(MAX_DEAD_RECKONING_DISTANCE, MAX_DEAD_RECKONING_AGE)
+        self._fix = None
+        self._position = None
+
+    async def async_added_to_hass(self) -> None:
+        """Start extrapolating between polls when interpolation is enabled."""
+        await super().async_added_to_hass()
+        self._update_fix()
+        if self._interpolation_interval:
+            self.async_on_remove(
+                async_track_time_interval(
+                    self.hass, self._async_interpolate, timedelta(seconds=self._interpolation_interval)
+                )
+            )
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Snap to the new fix."""
+        self._update_fix()
+        super()._handle_coordinator_update()
+
+    @callback
+    def _async_interpolate(self, now=None) -> None:
+        """Write an extrapolated position, without touching the API."""
+        if not self._reckoner.is_moving:
+            return
+        position = self._reckoner.position()
+        if position != self._position:
+            self._position = position
+            self.async_write_ha_state()
+
+    @property
+    def route_data(self) -> dict:
+        """Return the coordinator's data for this tracker's route."""
+        return (self.coordinator.data or {}).get(self._route.key) or {}
+
+    def _update_fix(self) -> None:
+        data = self.route_data
+        lat, lon = self._fix_location()
+        fix = (lat, lon, data.get(ATTR_SPEED), data.get(ATTR_BEARING), data.get(ATTR_LAST_UPDATE))
+        # A refresh that brings no new fix keeps extrapolating from the old one
+        if fix == self._fix:
+            return
+        self._fix = fix
+        recorded_at = fix[4].timestamp() if fix[4] is not None else None
+        self._reckoner.update(*fix[:4], recorded_at)
+        self._position = self._reckoner.position()
+
+    def _fix_location(self) -> tuple[float | None, float | None]:
+        """Return the coordinates of the coordinator's last fix."""
+        if ATTR_LOCATION not in self.route_data:
+            return None, None
+
+        try:
+            location = self.route_data.get(ATTR_LOCATION, "")
+            if location and "," in location:
+                lat_str, lon_str = location.split(",", 1)
+                return float(lat_str), float(lon_str)
+        except (ValueError, TypeError):
+            return None, None
+
+        return None, None
 
     @property
     def source_type(self) -> SourceType:
@@ -65,58 +139,43 @@ class BusPositionTracker(CoordinatorEntity, TrackerEntity):
 
     @property
     def latitude(self) -> float | None:
-        """Return latitude value of the device."""
-        if not self.coordinator.data or ATTR_LOCATION not in self.coordinator.data:
-            return None
-        
-        try:
-            location = self.coordinator.data.get(ATTR_LOCATION, "")
-            if location and "," in location:
-                lat_str, _ = location.split(",", 1)
-                return float(lat_str)
-        except (ValueError, TypeError):
-            return None
-        
-        return None
+        """Return latitude value of the device, extrapolated since the last fix."""
+        if self._position is None:
+            return self._fix_location()[0]
+        return self._position[0]
 
     @property
     def longitude(self) -> float | None:
-        """Return longitude value of the device."""
-        if not self.coordinator.data or ATTR_LOCATION not in self.coordinator.data:
-            return None
-        
-        try:
-            location = self.coordinator.data.get(ATTR_LOCATION, "")
-            if location and "," in location:
-                _, lon_str = location.split(",", 1)
-                return float(lon_str)
-        except (ValueError, TypeError):
-            return None
-        
-        return None
-    
+        """Return longitude value of the device, extrapolated since the last fix."""
+        if self._position is None:
+            return self._fix_location()[1]
+        return self._position[1]
+
     @property
     def extra_state_attributes(self):
         """Return the device state attributes."""
-        if not self.coordinator.data:
+        data = self.route_data
+        if not data:
             return {}
         
         # Format attributes for better display
-        speed = self.coordinator.data.get(ATTR_SPEED)
-        bearing = self.coordinator.data.get(ATTR_BEARING)
-        dist_start = self.coordinator.data.get(ATTR_DISTANCE_FROM_START)
-        dist_station = self.coordinator.data.get(ATTR_DISTANCE_FROM_STATION)
-        vehicle_ref = self.coordinator.data.get(ATTR_VEHICLE_REF)
-        last_update = self.coordinator.data.get(ATTR_LAST_UPDATE)
+        speed = data.get(ATTR_SPEED)
+        bearing = data.get(ATTR_BEARING)
+        dist_start = data.get(ATTR_DISTANCE_FROM_START)
+        dist_station = data.get(ATTR_DISTANCE_FROM_STATION)
+        vehicle_ref = data.get(ATTR_VEHICLE_REF)
+        last_update = data.get(ATTR_LAST_UPDATE)
         
         return {
-            "friendly_name": f"Bus {self._config_entry.data.get('route_mkt', '')}",
+            "friendly_name": f"Bus {self._label}",
             "vehicle_ref": vehicle_ref,
             "speed": f"{speed} {SPEED_UNITS}" if speed is not None else None,
             "bearing": f"{bearing} {BEARING_UNITS}" if bearing is not None else None,
             "distance_from_start": f"{dist_start} {DISTANCE_UNITS}" if dist_start is not None else None,
             "distance_from_station": f"{dist_station} {DISTANCE_UNITS}" if dist_station is not None else None,
             "last_update": last_update,
+            # Encoded polyline of the bus's recent fixes, oldest first
+            "trail": data.get(ATTR_TRAIL),
         }
 
     @property
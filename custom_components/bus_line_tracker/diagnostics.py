@@ -0,0 +1,27 @@
+"""Diagnostics support for Bus Line Tracker."""
+
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import CONF_BACKEND_SOURCE, CONF_LAT, CONF_LON, CONF_PLACES, DOMAIN
+
+# The user's stop, the coordinates of their places and the feed URL, which includes an access key
+TO_REDACT = {CONF_LAT, CONF_LON, CONF_PLACES, CONF_BACKEND_SOURCE}
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> dict[str, Any]:
+    """Return the entry's settings, latest data and, while tracing, the frames of its last refreshes."""
+    coordinator = hass.data[DOMAIN][entry.entry_id]
+    return {
+        "entry": {
+            "data": async_redact_data(entry.data, TO_REDACT),
+            "options": async_redact_data(entry.options, TO_REDACT),
+        },
+        "data": coordinator.data,
+        "trace": coordinator.tracer.as_dict(),
+    }
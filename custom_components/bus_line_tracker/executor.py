@@ -0,0 +1,79 @@
+"""Bounded worker pool for the Bus Line Tracker integration's blocking work."""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+
+
+class BoundedExecutor:
+    """A fixed-size thread pool owned by one config entry.
+
+    Stride requests and DataFrame processing run here instead of Home Assistant's
+    shared executor, so a slow API cannot hold up other integrations' jobs.
+    """
+
+    def __init__(self, hass: HomeAssistant, max_workers: int, name: str) -> None:
+        """Initialize the executor."""
+        self.hass = hass
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._listeners: list[CALLBACK_TYPE] = []
+        self._notify_scheduled = False
+
+    @property
+    def queue_depth(self) -> int:
+        """Return the number of jobs waiting for a free worker."""
+        return self._queued
+
+    @callback
+    def async_add_listener(self, update_callback: CALLBACK_TYPE) -> CALLBACK_TYPE:
+        """Call update_callback when the queue depth changes; return a function that removes it."""
+        self._listeners.append(update_callback)
+        return partial(self._listeners.remove, update_callback)
+
+    def _schedule_notify(self) -> None:
+        """Notify the listeners once per event loop iteration, however many jobs moved; thread-safe."""
+        with self._lock:
+            if not self._listeners or self._notify_scheduled:
+                return
+            self._notify_scheduled = True
+        self.hass.loop.call_soon_threadsafe(self._async_notify)
+
+    @callback
+    def _async_notify(self) -> None:
+        with self._lock:
+            self._notify_scheduled = False
+        for update_callback in list(self._listeners):
+            update_callback()
+
+    def _run(self, func, *args):
+        with self._lock:
+            self._queued -= 1
+        self._schedule_notify()
+        return func(*args)
+
+    async def async_add_executor_job(self, func, *args):
+        """Run a blocking function in the pool and return its result."""
+        with self._lock:
+            self._queued += 1
+        try:
+            future = self._pool.submit(self._run, func, *args)
+        except RuntimeError:
+            with self._lock:
+                self._queued -= 1
+            raise
+        self._schedule_notify()
+        return await asyncio.wrap_future(future)
+
+    async def async_shutdown(self) -> None:
+        """Cancel queued jobs and wait for running ones to finish."""
+        await self.hass.async_add_executor_job(partial(self._pool.shutdown, wait=True, cancel_futures=True))
+        with self._lock:
+            self._queued = 0
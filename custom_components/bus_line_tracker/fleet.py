@@ -0,0 +1,52 @@
+"""Snapshots of every active bus of a route, and the changes between them."""
+
+from __future__ import annotations
+
+from .locations import VehicleLocations
+
+# Fix fields sent for each vehicle, as named in the snapshot
+FLEET_FIELDS = {
+    "vehicle_ref": "siri_ride__vehicle_ref",
+    "line_ref": "siri_route__line_ref",
+    "lat": "lat",
+    "lon": "lon",
+    "speed": "velocity",
+    "bearing": "bearing",
+    "distance_from_start": "distance_from_journey_start",
+    "recorded_at": "recorded_at_time",
+}
+
+
+def fleet_state(locations: VehicleLocations) -> dict[str, dict]:
+    """Return the latest fix of every ride, keyed by ride id as a string."""
+    fleet = {}
+    for index in locations.latest_per_ride().tolist():
+        row = locations.row(index)
+        fleet[str(row["siri_ride__id"])] = {name: row[field] for name, field in FLEET_FIELDS.items()}
+    return fleet
+
+
+def diff_fleet(old: dict[str, dict[str, dict]], new: dict[str, dict[str, dict]]) -> dict:
+    """Return the vehicles of each route that appeared or changed, and the ones that are gone.
+
+    Both snapshots map route keys to fleet_state() results. Routes without
+    changes are left out, so an empty dict means nothing changed.
+    """
+    changed = {}
+    removed = {}
+    for route_key in new.keys() | old.keys():
+        old_fleet = old.get(route_key, {})
+        new_fleet = new.get(route_key, {})
+        route_changed = {ride: state for ride, state in new_fleet.items() if old_fleet.get(ride) != state}
+        route_removed = [ride for ride in old_fleet if ride not in new_fleet]
+        if route_changed:
+            changed[route_key] = route_changed
+        if route_removed:
+            removed[route_key] = route_removed
+
+    delta = {}
+    if changed:
+        delta["changed"] = changed
+    if removed:
+        delta["removed"] = removed
+    return delta
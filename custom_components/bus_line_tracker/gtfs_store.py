@@ -0,0 +1,254 @@
+"""A local GTFS static store of memory-mapped NumPy arrays.
+
+A GTFS zip is converted once into flat columns, one .npy file each, which are
+opened read-only with mmap on startup. Loading costs a few page table entries
+instead of parsing CSVs, and the pages are shared between processes and only
+read from disk when a stop or shape is actually looked up.
+
+Lookup columns (stop codes, route and trip ids) are fixed-width byte strings
+sorted for binary search; variable-length columns (stop names, shape points)
+are concatenated with an offsets array, so row i spans offsets[i]:offsets[i + 1].
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import zipfile
+from datetime import UTC, datetime
+
+import numpy as np
+import pandas as pd
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import STORAGE_DIR
+
+from .const import DATA_GTFS_STORE, DATA_STOP_CATALOG, DOMAIN, GTFS_STORE_DIR
+from .shape import RouteShape
+
+_LOGGER = logging.getLogger(__name__)
+
+GTFS_STORE_VERSION = 1
+META_FILE = "meta.json"
+
+
+def _keys(values) -> np.ndarray:
+    """Return values as a fixed-width byte string array."""
+    return np.array([str(value).encode() for value in values], dtype=bytes)
+
+
+def _sorted_keys(values) -> tuple[np.ndarray, np.ndarray]:
+    """Return values as a sorted key column and the order that sorts them."""
+    keys = _keys(values)
+    order = np.argsort(keys, kind="stable")
+    return keys[order], order
+
+
+def _positions(keys: np.ndarray, values) -> np.ndarray:
+    """Return the position of each value in a sorted key column, or -1 where it is missing."""
+    values = _keys(values)
+    positions = np.searchsorted(keys, values)
+    found = positions < len(keys)
+    found[found] = keys[positions[found]] == values[found]
+    return np.where(found, positions, -1).astype(np.int32)
+
+
+def _encode_strings(values) -> tuple[np.ndarray, np.ndarray]:
+    """Return UTF-8 strings concatenated into one byte array, with their offsets."""
+    encoded = [str(value).encode() for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(value) for value in encoded])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def _find(keys: np.ndarray, key) -> int | None:
+    """Return the position of key in a sorted key column, or None."""
+    key = str(key).encode()
+    if not len(keys) or len(key) > keys.dtype.itemsize:
+        return None
+    index = int(np.searchsorted(keys, key))
+    return index if index < len(keys) and keys[index] == key else None
+
+
+def build_gtfs_store(zip_path: str, directory: str) -> dict:
+    """Convert a GTFS zip into a store in `directory`, replacing any previous store, and return its metadata.
+
+    The store is written next to the target and swapped in when complete, so a
+    failed build leaves the previous store untouched.
+    """
+    with zipfile.ZipFile(zip_path) as feed:
+
+        def read(name, columns, dtype=str):
+            with feed.open(name) as file:
+                return pd.read_csv(file, usecols=columns, dtype=dtype, keep_default_na=False, encoding="utf-8-sig")
+
+        stops = read(
+            "stops.txt",
+            ["stop_code", "stop_name", "stop_lat", "stop_lon"],
+            {"stop_code": str, "stop_name": str, "stop_lat": np.float64, "stop_lon": np.float64},
+        )
+        trips = read("trips.txt", ["route_id", "trip_id", "shape_id"])
+        shapes = read(
+            "shapes.txt",
+            ["shape_id", "shape_pt_lat", "shape_pt_lon", "shape_pt_sequence"],
+            {"shape_id": str, "shape_pt_lat": np.float64, "shape_pt_lon": np.float64, "shape_pt_sequence": np.int64},
+        )
+
+    arrays = {}
+
+    # Stops, sorted by code; stations and entrances without a code are left out
+    stops = stops[stops["stop_code"] != ""]
+    arrays["stop_code"], order = _sorted_keys(stops["stop_code"])
+    arrays["stop_lat"] = stops["stop_lat"].to_numpy(np.float64)[order]
+    arrays["stop_lon"] = stops["stop_lon"].to_numpy(np.float64)[order]
+    arrays["stop_name"], arrays["stop_name_offsets"] = _encode_strings(stops["stop_name"].to_numpy()[order])
+
+    # Shapes, sorted by id, with their points in sequence
+    shapes = shapes.sort_values(["shape_id", "shape_pt_sequence"], kind="stable")
+    shape_ids, starts = np.unique(shapes["shape_id"].to_numpy(), return_index=True)
+    arrays["shape_id"] = _keys(shape_ids)
+    arrays["shape_offsets"] = np.append(starts, len(shapes)).astype(np.int64)
+    arrays["shape_lat"] = shapes["shape_pt_lat"].to_numpy(np.float64)
+    arrays["shape_lon"] = shapes["shape_pt_lon"].to_numpy(np.float64)
+
+    # Trips, sorted by id, pointing into the route and shape columns
+    arrays["route_id"] = np.unique(_keys(trips["route_id"]))
+    arrays["trip_id"], order = _sorted_keys(trips["trip_id"])
+    arrays["trip_route"] = _positions(arrays["route_id"], trips["route_id"].to_numpy()[order])
+    arrays["trip_shape"] = _positions(arrays["shape_id"], trips["shape_id"].to_numpy()[order])
+
+    # Each route's shape is the one most of its trips run on; sorted by count,
+    # the most common shape of each route is assigned last
+    has_shape = arrays["trip_shape"] >= 0
+    pairs, counts = np.unique(
+        np.stack((arrays["trip_route"][has_shape], arrays["trip_shape"][has_shape])), axis=1, return_counts=True
+    )
+    route_shape = np.full(len(arrays["route_id"]), -1, dtype=np.int32)
+    for route, shape in pairs[:, np.argsort(counts, kind="stable")].T.tolist():
+        route_shape[route] = shape
+    arrays["route_shape"] = route_shape
+
+    meta = {
+        "version": GTFS_STORE_VERSION,
+        "source": os.path.basename(zip_path),
+        "built_at": datetime.now(UTC).isoformat(),
+        "stops": len(arrays["stop_code"]),
+        "routes": len(arrays["route_id"]),
+        "trips": len(arrays["trip_id"]),
+        "shapes": len(arrays["shape_id"]),
+    }
+
+    tmp_directory = f"{directory}.tmp"
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_directory, f"{name}.npy"), array)
+    with open(os.path.join(tmp_directory, META_FILE), "w", encoding="utf-8") as file:
+        json.dump(meta, file)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_directory, directory)
+
+    _LOGGER.info("Built GTFS store from %s: %s", zip_path, meta)
+    return meta
+
+
+class GtfsStore:
+    """Read-only access to a store written by build_gtfs_store()."""
+
+    def __init__(self, directory: str, meta: dict, arrays: dict[str, np.ndarray]) -> None:
+        """Initialize from the store's metadata and its memory-mapped columns."""
+        self.directory = directory
+        self.meta = meta
+        self._arrays = arrays
+
+    @classmethod
+    def open(cls, directory: str) -> GtfsStore | None:
+        """Map a store's columns into memory, or return None if there is no usable store."""
+        try:
+            with open(os.path.join(directory, META_FILE), encoding="utf-8") as file:
+                meta = json.load(file)
+        except FileNotFoundError:
+            return None
+        if meta.get("version") != GTFS_STORE_VERSION:
+            _LOGGER.warning("Ignoring GTFS store %s of version %s", directory, meta.get("version"))
+            return None
+
+        arrays = {}
+        for filename in os.listdir(directory):
+            if filename.endswith(".npy"):
+                arrays[filename[:-4]] = np.load(os.path.join(directory, filename), mmap_mode="r")
+        return cls(directory, meta, arrays)
+
+    def __len__(self) -> int:
+        """Return the number of stops in the store."""
+        return len(self._arrays["stop_code"])
+
+    def stops(self):
+        """Yield every stop as (code, name, lat, lon), in code order."""
+        names = self._arrays["stop_name"].tobytes()
+        offsets = self._arrays["stop_name_offsets"].tolist()
+        codes = self._arrays["stop_code"].tolist()
+        lats = self._arrays["stop_lat"].tolist()
+        lons = self._arrays["stop_lon"].tolist()
+        for index, code in enumerate(codes):
+            name = names[offsets[index] : offsets[index + 1]].decode()
+            yield code.decode(), name, lats[index], lons[index]
+
+    def stop(self, code: str) -> tuple[str, float, float] | None:
+        """Return a stop's (name, lat, lon), or None for an unknown code."""
+        index = _find(self._arrays["stop_code"], code)
+        if index is None:
+            return None
+        offsets = self._arrays["stop_name_offsets"]
+        name = self._arrays["stop_name"][offsets[index] : offsets[index + 1]].tobytes().decode()
+        return name, float(self._arrays["stop_lat"][index]), float(self._arrays["stop_lon"][index])
+
+    def shape_points(self, route_id) -> tuple[np.ndarray, np.ndarray] | None:
+        """Return the (lats, lons) of a route's most common shape as views into the store."""
+        route = _find(self._arrays["route_id"], route_id)
+        if route is None:
+            return None
+        shape = int(self._arrays["route_shape"][route])
+        if shape < 0:
+            return None
+        start, end = self._arrays["shape_offsets"][shape : shape + 2].tolist()
+        return self._arrays["shape_lat"][start:end], self._arrays["shape_lon"][start:end]
+
+    def route_shape(self, route_id, date_str: str) -> RouteShape | None:
+        """Return a route's shape, or None if the store has no shape with at least two points for it."""
+        points = self.shape_points(route_id)
+        if points is None or len(points[0]) < 2:
+            return None
+        return RouteShape(date_str, *points)
+
+    def trip_route(self, trip_id) -> str | None:
+        """Return the route_id of a planned trip."""
+        index = _find(self._arrays["trip_id"], trip_id)
+        if index is None:
+            return None
+        return self._arrays["route_id"][self._arrays["trip_route"][index]].decode()
+
+
+def gtfs_store_path(hass: HomeAssistant) -> str:
+    """Return the directory of the GTFS store."""
+    return hass.config.path(STORAGE_DIR, DOMAIN, GTFS_STORE_DIR)
+
+
+async def async_get_gtfs_store(hass: HomeAssistant) -> GtfsStore | None:
+    """Return the GTFS store, opened once and shared by all entries, or None if none was built."""
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    if DATA_GTFS_STORE not in domain_data:
+        domain_data[DATA_GTFS_STORE] = await hass.async_add_executor_job(GtfsStore.open, gtfs_store_path(hass))
+    return domain_data[DATA_GTFS_STORE]
+
+
+async def async_build_gtfs_store(hass: HomeAssistant, zip_path: str) -> dict:
+    """Build the GTFS store from a zip and switch every user of the store to it."""
+    directory = gtfs_store_path(hass)
+    meta = await hass.async_add_executor_job(build_gtfs_store, zip_path, directory)
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    domain_data[DATA_GTFS_STORE] = await hass.async_add_executor_job(GtfsStore.open, directory)
+    # The stop catalog is rebuilt from the new store when next needed
+    domain_data.pop(DATA_STOP_CATALOG, None)
+    return meta
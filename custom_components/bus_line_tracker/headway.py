@@ -0,0 +1,85 @@
+"""Gaps between consecutive buses of a route, for headway and bunching."""
+
+from __future__ import annotations
+
+import numpy as np
+
+from .const import ATTR_BUNCHED_VEHICLES, ATTR_BUNCHING, ATTR_HEADWAY, ATTR_HEADWAY_GAPS
+from .locations import VehicleLocations
+
+
+def compute_gaps(locations: VehicleLocations) -> list[dict]:
+    """Return the gap from every bus to the one ahead of it on the same line_ref, leading pair first.
+
+    Buses are ordered by the distance_from_journey_start of their latest fix.
+    The time gap is how long ago the bus ahead was where the following bus is
+    now, read off its fixes; when they don't reach back that far, it is the
+    distance gap over the following bus's speed. Rides without a distance are
+    left out.
+    """
+    ride_ids = locations["siri_ride__id"]
+    times = locations["recorded_at_time"]
+    all_distances = locations["distance_from_journey_start"]
+
+    latest = locations.latest_per_ride()
+    latest = latest[~np.isnan(all_distances[latest])]
+    # Furthest along first within each line_ref
+    line_refs = locations["siri_route__line_ref"][latest]
+    latest = latest[np.lexsort((-all_distances[latest], line_refs))]
+    line_refs = locations["siri_route__line_ref"][latest]
+    same_line = line_refs[1:] == line_refs[:-1]
+    leaders, followers = latest[:-1][same_line], latest[1:][same_line]
+    if not len(leaders):
+        return []
+    distance_gaps = all_distances[leaders] - all_distances[followers]
+
+    # Each ride's fixes in time order, to look up when a bus passed a distance
+    order = np.lexsort((times, ride_ids))
+    sorted_rides = ride_ids[order]
+    starts = np.flatnonzero(np.r_[True, sorted_rides[1:] != sorted_rides[:-1]])
+    ends = np.r_[starts[1:], len(order)]
+    slices = zip(starts.tolist(), ends.tolist(), strict=True)
+    ride_slices = dict(zip(sorted_rides[starts].tolist(), slices, strict=True))
+
+    gaps = []
+    pairs = zip(leaders.tolist(), followers.tolist(), distance_gaps.tolist(), strict=True)
+    for leader, follower, distance_gap in pairs:
+        start, end = ride_slices[int(ride_ids[leader])]
+        track = order[start:end]
+        track = track[~np.isnan(all_distances[track])]
+        time_gap = np.nan
+        if len(track):
+            # Reported distances can briefly jitter backwards; interpolation needs them non-decreasing
+            passed = np.interp(
+                all_distances[follower],
+                np.maximum.accumulate(all_distances[track]),
+                times[track],
+                left=np.nan,
+                right=np.nan,
+            )
+            time_gap = times[follower] - passed
+        velocity = locations["velocity"][follower]
+        if np.isnan(time_gap) and velocity > 0:
+            time_gap = distance_gap / (velocity / 3.6)
+        gaps.append(
+            {
+                "vehicle_ref": locations["siri_ride__vehicle_ref"].item(follower) or None,
+                "ahead_vehicle_ref": locations["siri_ride__vehicle_ref"].item(leader) or None,
+                "distance": round(distance_gap, 1),
+                "time": None if np.isnan(time_gap) else round(float(time_gap), 1),
+            }
+        )
+    return gaps
+
+
+def summarize_gaps(gaps: list[dict], bunching_headway: float) -> dict:
+    """Return a route's headway in minutes and whether any pair is closer than bunching_headway seconds."""
+    time_gaps = np.array([gap["time"] for gap in gaps if gap["time"] is not None])
+    bunched = [gap for gap in gaps if gap["time"] is not None and gap["time"] < bunching_headway]
+    bunched_vehicles = {ref for gap in bunched for ref in (gap["vehicle_ref"], gap["ahead_vehicle_ref"]) if ref}
+    return {
+        ATTR_HEADWAY: round(float(np.median(time_gaps)) / 60, 1) if len(time_gaps) else None,
+        ATTR_HEADWAY_GAPS: gaps,
+        ATTR_BUNCHING: bool(bunched),
+        ATTR_BUNCHED_VEHICLES: sorted(bunched_vehicles),
+    }
@@ -0,0 +1,449 @@
+"""Conditional requests, compression and an on-disk cache for stride's HTTP responses."""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Callable
+from datetime import date, datetime, time, timedelta
+from functools import partial
+from urllib.parse import parse_qsl, urlsplit
+from zoneinfo import ZoneInfo
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from urllib3.util.request import ACCEPT_ENCODING
+
+from .const import HTTP_CACHE_IMMUTABLE_AGE, HTTP_CACHE_MAX_DISK_SIZE, HTTP_CACHE_MAX_MEMORY_SIZE
+
+_LOGGER = logging.getLogger(__name__)
+
+# Query parameters that end the period a stride page covers; pages of periods that
+# ended long enough ago no longer change
+PERIOD_END_PARAMS = ("recorded_at_time_to", "date_to")
+
+# Response headers kept with a revalidatable body
+_VALIDATOR_HEADERS = ("etag", "last-modified")
+_KEPT_HEADERS = (*_VALIDATOR_HEADERS, "content-type")
+
+# Headers that no longer apply once a body has been decoded and buffered
+_ENCODING_HEADERS = ("content-encoding", "content-length", "transfer-encoding")
+
+# Bytes of the decoded body pulled from the network at a time while teeing it into the caches
+_TEE_CHUNK_SIZE = 64 * 1024
+
+
+def period_end(url: str) -> datetime | None:
+    """Return when the period queried by a stride URL ends, or None if it is open-ended."""
+    ends = []
+    for key, value in parse_qsl(urlsplit(url).query):
+        if key not in PERIOD_END_PARAMS:
+            continue
+        try:
+            if len(value) == 10:
+                # A date covers the whole service day
+                day_after = date.fromisoformat(value) + timedelta(days=1)
+                ends.append(datetime.combine(day_after, time.min, ZoneInfo("Israel")))
+            else:
+                ends.append(datetime.fromisoformat(value))
+        except ValueError:
+            return None
+    return max(ends) if ends else None
+
+
+def is_immutable(url: str, now: datetime | None = None) -> bool:
+    """Return True if the page of a stride URL covers a period that ended HTTP_CACHE_IMMUTABLE_AGE ago."""
+    end = period_end(url)
+    if end is None or end.tzinfo is None:
+        return False
+    now = now or datetime.now(ZoneInfo("Israel"))
+    return end <= now - HTTP_CACHE_IMMUTABLE_AGE
+
+
+class DiskCache:
+    """Response bodies stored as files, evicting the least recently used beyond max_size bytes.
+
+    Files are written atomically, so several processes (such as the analytics
+    workers) can share a directory. The total size is counted up as bodies are
+    stored, and the directory is only scanned once it goes over max_size, which
+    also catches up with what other processes stored.
+    """
+
+    def __init__(self, directory: str, max_size: int = HTTP_CACHE_MAX_DISK_SIZE) -> None:
+        """Initialize the cache; the directory is created on the first write."""
+        self.directory = directory
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._size: int | None = None  # bytes stored, counted on the first write
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest())
+
+    def get(self, key: str) -> bytes | None:
+        """Return the body stored for a key and mark it as recently used."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as file:
+                body = file.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return body
+
+    def put(self, key: str, body: bytes) -> None:
+        """Store a body, then evict the least recently used files over the size limit."""
+        writer = self.writer(key)
+        writer.write(body)
+        writer.commit()
+
+    def writer(self, key: str) -> DiskCacheWriter:
+        """Return a writer that stores a body for a key piece by piece."""
+        return DiskCacheWriter(self, key)
+
+    def _stored(self, path: str, tmp_path: str, size: int) -> None:
+        """Move a written body into place and count it, evicting files over the size limit."""
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            try:
+                self._size -= os.stat(path).st_size
+            except FileNotFoundError:
+                pass
+            os.replace(tmp_path, path)
+            self._size += size
+            if self._size > self.max_size:
+                self._evict()
+
+    def _scan_size(self) -> int:
+        size = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".tmp"):
+                try:
+                    size += entry.stat().st_size
+                except FileNotFoundError:
+                    pass
+        return size
+
+    def _evict(self) -> None:
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".tmp"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        size = sum(entry[1] for entry in entries)
+        for _, file_size, path in sorted(entries):
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= file_size
+        self._size = size
+
+
+class DiskCacheWriter:
+    """A body being written to a DiskCache, stored on commit() and dropped on abort().
+
+    Bodies that grow beyond the cache's max_size are dropped as soon as they do.
+    """
+
+    def __init__(self, cache: DiskCache, key: str) -> None:
+        """Initialize the writer; the file is created on the first write."""
+        self._cache = cache
+        self._path = cache._path(key)
+        self._tmp_path = f"{self._path}.{os.getpid()}.{threading.get_ident()}.{id(self)}.tmp"
+        self._file = None
+        self._size = 0
+        self._closed = False
+
+    def write(self, data: bytes) -> None:
+        """Append data to the body."""
+        if self._closed:
+            return
+        self._size += len(data)
+        if self._size > self._cache.max_size:
+            self.abort()
+            return
+        if self._file is None:
+            os.makedirs(self._cache.directory, exist_ok=True)
+            self._file = open(self._tmp_path, "wb")
+        self._file.write(data)
+
+    def commit(self) -> None:
+        """Store the body written so far."""
+        if self._closed:
+            return
+        if self._file is None:
+            self.write(b"")
+        self._file.close()
+        self._closed = True
+        self._cache._stored(self._path, self._tmp_path, self._size)
+
+    def abort(self) -> None:
+        """Drop the body."""
+        self._closed = True
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            try:
+                os.remove(self._tmp_path)
+            except FileNotFoundError:
+                pass
+
+
+class _TeeReader(io.RawIOBase):
+    """The decoded body of a response, copied into the caches as the caller reads it.
+
+    Nothing is buffered beyond one chunk: the disk copy is written as it goes and
+    the memory copy is given up once it outgrows the memory cache. The copies
+    are only stored once the body has been read to the end.
+    """
+
+    def __init__(
+        self,
+        response: requests.Response,
+        disk_writer: DiskCacheWriter | None,
+        remember: Callable[[bytes], None] | None,
+        max_memory_size: int,
+    ) -> None:
+        """Initialize with the network response, the disk copy's writer and where the memory copy goes."""
+        super().__init__()
+        self._response = response
+        self._chunks = response.iter_content(_TEE_CHUNK_SIZE)
+        self._pending = b""
+        self._disk_writer = disk_writer
+        self._remember = remember
+        self._max_memory_size = max_memory_size
+        self._memory: list[bytes] | None = [] if remember is not None else None
+        self._memory_size = 0
+        self._done = False
+
+    def readable(self) -> bool:
+        """Return True; the body can be read."""
+        return True
+
+    def readinto(self, buffer) -> int:
+        """Read decoded bytes into a buffer, returning 0 at the end of the body."""
+        while not self._pending and not self._done:
+            try:
+                chunk = next(self._chunks)
+            except StopIteration:
+                self._finish()
+                break
+            self._tee(chunk)
+            self._pending = chunk
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+    def _tee(self, chunk: bytes) -> None:
+        if self._disk_writer is not None:
+            self._disk_writer.write(chunk)
+        if self._memory is not None:
+            self._memory_size += len(chunk)
+            if self._memory_size > self._max_memory_size:
+                self._memory = None
+            else:
+                self._memory.append(chunk)
+
+    def _finish(self) -> None:
+        self._done = True
+        if self._disk_writer is not None:
+            self._disk_writer.commit()
+        if self._memory is not None:
+            self._remember(b"".join(self._memory))
+
+    def close(self) -> None:
+        """Close the network response, dropping the copies of a body that wasn't read to the end.
+
+        Parsers stop at the end of the document, so up to a chunk left unread
+        (such as a trailing newline) is still read to complete the copies.
+        """
+        if not self._done:
+            self._drain()
+        if not self._done:
+            self._done = True
+            if self._disk_writer is not None:
+                self._disk_writer.abort()
+        self._response.close()
+        super().close()
+
+    def _drain(self) -> None:
+        drained = 0
+        try:
+            for chunk in self._chunks:
+                drained += len(chunk)
+                if drained > _TEE_CHUNK_SIZE:
+                    return
+                self._tee(chunk)
+        except (OSError, requests.RequestException):
+            return
+        self._finish()
+
+
+class CachingAdapter(HTTPAdapter):
+    """A transport adapter that avoids re-downloading stride pages.
+
+    - Pages of periods that ended long ago are served from the disk cache.
+    - Responses with an ETag or Last-Modified are kept in memory, up to
+      max_memory_size bytes, and revalidated with If-None-Match or
+      If-Modified-Since; a 304 is answered from memory.
+    - Anything else streams through untouched.
+
+    Cacheable bodies still stream to the caller; they are copied into the
+    caches as they are read, never buffered whole.
+    """
+
+    def __init__(self, disk_cache: DiskCache | None = None, max_memory_size: int = HTTP_CACHE_MAX_MEMORY_SIZE):
+        """Initialize the adapter."""
+        super().__init__()
+        self.disk_cache = disk_cache
+        self.max_memory_size = max_memory_size
+        # url -> (validator and content type headers, decoded body), least recently used first
+        self._validated: OrderedDict[str, tuple[dict[str, str], bytes]] = OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+
+    def send(self, request, stream=False, **kwargs):
+        """Send a request, answering it from the caches where possible."""
+        if request.method != "GET":
+            return super().send(request, stream=stream, **kwargs)
+
+        url = request.url
+        immutable = self.disk_cache is not None and is_immutable(url)
+        if immutable:
+            body = self.disk_cache.get(url)
+            if body is not None:
+                _LOGGER.debug("Serving %s from the disk cache", url)
+                return self._buffered_response(request, body, {"content-type": "application/json"})
+
+        with self._lock:
+            cached = self._validated.get(url)
+            if cached is not None:
+                self._validated.move_to_end(url)
+        if cached is not None:
+            headers, _ = cached
+            if "etag" in headers:
+                request.headers["If-None-Match"] = headers["etag"]
+            if "last-modified" in headers:
+                request.headers["If-Modified-Since"] = headers["last-modified"]
+
+        response = super().send(request, stream=stream, **kwargs)
+        if response.status_code == 304 and cached is not None:
+            _LOGGER.debug("%s not modified, serving it from memory", url)
+            response.close()
+            return self._buffered_response(request, cached[1], cached[0])
+        if response.status_code != 200:
+            return response
+
+        revalidatable = any(name in response.headers for name in _VALIDATOR_HEADERS)
+        if not revalidatable and not immutable:
+            return response
+
+        # Cacheable: hand out the decoded body, copying it into the caches as it is read
+        disk_writer = self.disk_cache.writer(url) if immutable else None
+        remember = None
+        if revalidatable:
+            headers = {name: response.headers[name] for name in _KEPT_HEADERS if name in response.headers}
+            remember = partial(self._remember, url, headers)
+        raw = _TeeReader(response, disk_writer, remember, self.max_memory_size)
+        return self._decoded_response(request, raw, response.headers)
+
+    def _remember(self, url: str, headers: dict[str, str], body: bytes) -> None:
+        """Keep a validated body in memory, evicting the least recently used ones."""
+        if len(body) > self.max_memory_size:
+            return
+        with self._lock:
+            previous = self._validated.pop(url, None)
+            if previous is not None:
+                self._memory_size -= len(previous[1])
+            self._validated[url] = (headers, body)
+            self._memory_size += len(body)
+            while self._memory_size > self.max_memory_size:
+                _, (_, evicted) = self._validated.popitem(last=False)
+                self._memory_size -= len(evicted)
+
+    @classmethod
+    def _buffered_response(cls, request, body: bytes, headers) -> requests.Response:
+        """Return a 200 response whose raw stream is a decoded body held in memory."""
+        return cls._decoded_response(request, io.BytesIO(body), headers)
+
+    @staticmethod
+    def _decoded_response(request, raw, headers) -> requests.Response:
+        """Return a 200 response whose raw stream is the decoded body."""
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response.headers = CaseInsensitiveDict(
+            {name: value for name, value in headers.items() if name.lower() not in _ENCODING_HEADERS}
+        )
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = raw
+        response.url = request.url
+        response.request = request
+        return response
+
+
+class _UnverifiedSession(requests.Session):
+    """A session that doesn't verify certificates, as stride's chain doesn't verify everywhere.
+
+    Session.verify alone would be overridden by a REQUESTS_CA_BUNDLE in the
+    environment; a verify passed with the request is not.
+    """
+
+    def request(self, method, url, *args, **kwargs):
+        """Send a request without certificate verification unless asked for."""
+        kwargs.setdefault("verify", False)
+        return super().request(method, url, *args, **kwargs)
+
+
+def create_session(disk_cache: DiskCache | None = None) -> requests.Session:
+    """Return a session for stride requests that goes through a CachingAdapter."""
+    session = _UnverifiedSession()
+    # urllib3 adds br when a brotli package is installed
+    session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+    adapter = CachingAdapter(disk_cache)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Return the process-wide stride session, shared by every entry and route."""
+    global _session  # pylint: disable=global-statement
+    with _session_lock:
+        if _session is None:
+            _session = create_session()
+        return _session
+
+
+def enable_disk_cache(directory: str) -> None:
+    """Let the process-wide session keep pages of past periods under a directory."""
+    adapter = get_session().get_adapter("https://")
+    if adapter.disk_cache is None or adapter.disk_cache.directory != directory:
+        adapter.disk_cache = DiskCache(directory)
+
+
+class StrideRequests:
+    """Stands in for the requests module inside stride.common, which only calls requests.get."""
+
+    def get(self, *args, **kwargs) -> requests.Response:
+        """Send a GET through the process-wide stride session."""
+        return get_session().get(*args, **kwargs)
@@ -0,0 +1,61 @@
+"""Dead-reckoning of bus positions between coordinator polls."""
+
+from __future__ import annotations
+
+import time
+
+from .geo import destination_point
+
+
+class DeadReckoner:
+    """Extrapolates a position from the last fix's speed and bearing.
+
+    Every real fix resets the extrapolation to the fix itself. Time is
+    measured from when the fix was recorded, not from when it arrived, and the
+    extrapolated distance is capped so a stalled feed can't carry the bus off.
+    A fix older than max_age is shown as is: an archived fix, or one of a bus
+    that has stopped reporting, says nothing about where the bus is now.
+    """
+
+    def __init__(self, max_distance: float, max_age: float) -> None:
+        """Initialize the reckoner."""
+        self.max_distance = max_distance
+        self.max_age = max_age
+        self._fix: tuple[float, float] | None = None
+        self._speed = 0.0  # m/s
+        self._bearing: float | None = None
+        self._fix_time = 0.0
+
+    @property
+    def has_fix(self) -> bool:
+        """Return True if a fix is available."""
+        return self._fix is not None
+
+    @property
+    def is_moving(self) -> bool:
+        """Return True if the last fix can be extrapolated."""
+        return self._fix is not None and self._bearing is not None and self._speed > 0
+
+    def update(
+        self,
+        lat: float | None,
+        lon: float | None,
+        speed: float | None,
+        bearing: float | None,
+        recorded_at: float | None = None,
+    ) -> None:
+        """Snap to a new fix recorded at POSIX time `recorded_at`; speed is in km/h and bearing in degrees."""
+        self._fix = (lat, lon) if lat is not None and lon is not None else None
+        self._speed = speed / 3.6 if speed else 0.0
+        self._bearing = bearing
+        self._fix_time = time.time() if recorded_at is None else recorded_at
+
+    def position(self, now: float | None = None) -> tuple[float, float] | None:
+        """Return the estimated position at POSIX time `now`."""
+        if not self.is_moving:
+            return self._fix
+        elapsed = max((time.time() if now is None else now) - self._fix_time, 0.0)
+        if elapsed > self.max_age:
+            return self._fix
+        distance = min(self._speed * elapsed, self.max_distance)
+        return destination_point(self._fix[0], self._fix[1], self._bearing, distance)
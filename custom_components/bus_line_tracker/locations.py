@@ -0,0 +1,215 @@
+"""Streaming fetch of SIRI vehicle locations into typed arrays."""
+
+from __future__ import annotations
+
+import logging
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import json_stream
+import numpy as np
+import requests
+from stride import StrideRequestFailedException, config
+from stride.common import parse_params
+
+_LOGGER = logging.getLogger(__name__)
+
+VEHICLE_LOCATIONS_PATH = "/siri_vehicle_locations/list"
+PAGE_SIZE = 5000
+# Newest fixes first, so the first fix seen for a ride is its latest one
+LOCATIONS_ORDER_BY = "recorded_at_time desc"
+REQUEST_TIMEOUT = 60  # seconds
+
+# The only fields the coordinator reads, and the array type each one is stored in;
+# vehicle refs have no fixed length, so they are kept as Python strings
+LOCATION_FIELDS = {
+    "siri_ride__id": np.int64,
+    "siri_ride__vehicle_ref": object,
+    "siri_route__line_ref": np.int64,
+    "lat": np.float64,
+    "lon": np.float64,
+    "velocity": np.float64,
+    "bearing": np.float64,
+    "distance_from_journey_start": np.float64,
+    "recorded_at_time": np.float64,  # POSIX timestamp
+    "siri_ride__scheduled_start_time": np.float64,  # POSIX timestamp
+}
+_TIMESTAMP_FIELDS = ("recorded_at_time", "siri_ride__scheduled_start_time")
+_MISSING = {np.int64: -1, object: "", np.float64: np.nan}
+
+
+def _parse_timestamp(value) -> float:
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return datetime.fromisoformat(value).timestamp()
+
+
+class VehicleLocations:
+    """Vehicle location fixes stored as one numpy array per field.
+
+    `newest_first` marks fixes whose rides are each ordered by recorded_at_time
+    descending, as returned by stride with LOCATIONS_ORDER_BY.
+    """
+
+    def __init__(self, columns: dict[str, np.ndarray], newest_first: bool = False) -> None:
+        """Initialize from equally sized column arrays."""
+        self.columns = columns
+        self.newest_first = newest_first
+
+    @classmethod
+    def empty(cls, capacity: int = 0) -> VehicleLocations:
+        """Return preallocated columns for `capacity` fixes."""
+        return cls({field: np.empty(capacity, dtype=dtype) for field, dtype in LOCATION_FIELDS.items()})
+
+    @classmethod
+    def concat(cls, parts: list[VehicleLocations]) -> VehicleLocations:
+        """Concatenate several sets of fixes.
+
+        Ordering per ride survives as long as each ride's fixes come from a single
+        part (or consecutive pages of one query).
+        """
+        if not parts:
+            return cls.empty()
+        return cls(
+            {field: np.concatenate([part.columns[field] for part in parts]) for field in LOCATION_FIELDS},
+            newest_first=all(part.newest_first for part in parts),
+        )
+
+    def __len__(self) -> int:
+        """Return the number of fixes."""
+        return len(self.columns["siri_ride__id"])
+
+    def __getitem__(self, field: str) -> np.ndarray:
+        """Return the array for a field."""
+        return self.columns[field]
+
+    @property
+    def is_empty(self) -> bool:
+        """Return True if there are no fixes."""
+        return len(self) == 0
+
+    def take(self, indices) -> VehicleLocations:
+        """Return the fixes at the given indices (or boolean mask)."""
+        return VehicleLocations({field: column[indices] for field, column in self.columns.items()})
+
+    def latest_per_ride(self) -> np.ndarray:
+        """Return the index of the most recent fix of every ride."""
+        if self.is_empty:
+            return np.empty(0, dtype=np.intp)
+        if self.newest_first:
+            # The first occurrence of each ride is its latest fix, no sorting by time needed
+            _, first = np.unique(self.columns["siri_ride__id"], return_index=True)
+            return first
+        order = np.lexsort((self.columns["recorded_at_time"], self.columns["siri_ride__id"]))
+        ride_ids = self.columns["siri_ride__id"][order]
+        is_last = np.append(ride_ids[1:] != ride_ids[:-1], True)
+        return order[is_last]
+
+    def split_by_line_ref(self) -> dict[int, VehicleLocations]:
+        """Split the fixes of a batched query into one set per line_ref."""
+        line_refs = self.columns["siri_route__line_ref"]
+        return {
+            int(line_ref): VehicleLocations(
+                {field: column[line_refs == line_ref] for field, column in self.columns.items()},
+                newest_first=self.newest_first,
+            )
+            for line_ref in np.unique(line_refs)
+        }
+
+    def select_line_refs(self, line_refs: list[int]) -> VehicleLocations:
+        """Return the fixes of the given line_refs, keeping their order."""
+        mask = np.isin(self.columns["siri_route__line_ref"], line_refs)
+        return VehicleLocations(
+            {field: column[mask] for field, column in self.columns.items()}, newest_first=self.newest_first
+        )
+
+    def row(self, index: int) -> dict:
+        """Return a single fix as a dict of Python values, with None for missing values."""
+        row = {}
+        for field, column in self.columns.items():
+            value = column.item(index)
+            row[field] = None if value == _MISSING[LOCATION_FIELDS[field]] or value != value else value
+        for field in _TIMESTAMP_FIELDS:
+            if row[field] is not None:
+                row[field] = datetime.fromtimestamp(row[field], ZoneInfo("Israel"))
+        return row
+
+
+def parse_locations(items, capacity: int, line_ref: int | None = None, newest_first: bool = False) -> VehicleLocations:
+    """Write the needed fields of up to `capacity` location objects into typed arrays.
+
+    `items` may be plain dicts or json_stream transient objects; in the latter case
+    every other field is skipped while decoding and never materialised.
+    """
+    locations = VehicleLocations.empty(capacity)
+    columns = locations.columns
+    count = 0
+    for item in items:
+        if count >= capacity:
+            break
+        for field, dtype in LOCATION_FIELDS.items():
+            columns[field][count] = _MISSING[dtype]
+        if line_ref is not None:
+            columns["siri_route__line_ref"][count] = line_ref
+        for key, value in item.items():
+            if key not in columns or value is None:
+                continue
+            if key in _TIMESTAMP_FIELDS:
+                value = _parse_timestamp(value)
+            columns[key][count] = value
+        count += 1
+    # Copy out the filled rows so the preallocated buffer can be freed
+    locations = locations.take(np.arange(count))
+    locations.newest_first = newest_first
+    return locations
+
+
+def build_locations_query(line_refs: list[int], start_time: datetime, end_time: datetime, offset: int = 0) -> dict:
+    """Return the stride query for one page of the line_refs' fixes, newest first.
+
+    Stride's list endpoints have no field projection parameter; unused fields are
+    dropped while streaming instead (see parse_locations).
+    """
+    return {
+        "siri_routes__line_ref": ",".join(str(line_ref) for line_ref in line_refs),
+        "recorded_at_time_from": start_time,
+        "recorded_at_time_to": end_time,
+        "order_by": LOCATIONS_ORDER_BY,
+        "limit": PAGE_SIZE,
+        "offset": offset,
+    }
+
+
+def _fetch_page(params: dict, line_ref: int | None, session: requests.Session | None = None) -> VehicleLocations:
+    """Stream one page of vehicle locations from stride."""
+    url = config.STRIDE_API_BASE_URL + VEHICLE_LOCATIONS_PATH
+    with (session or requests).get(url, params=parse_params(params), stream=True, timeout=REQUEST_TIMEOUT) as res:
+        if res.status_code != 200:
+            raise StrideRequestFailedException(res.status_code, res.text)
+        res.raw.decode_content = True
+        newest_first = params.get("order_by") == LOCATIONS_ORDER_BY
+        return parse_locations(json_stream.load(res.raw), params["limit"], line_ref, newest_first)
+
+
+def fetch_vehicle_locations(
+    line_refs: list[int], start_time: datetime, end_time: datetime, session: requests.Session | None = None
+) -> VehicleLocations:
+    """Fetch all fixes of the given line_refs between start_time and end_time in one paginated query.
+
+    Pass a session to reuse its connections across polls.
+    """
+    line_refs = list(line_refs)
+    # Rows carry their own line_ref; only a single-line query can fill it in when missing
+    default_line_ref = line_refs[0] if len(line_refs) == 1 else None
+    pages = []
+    offset = 0
+    while True:
+        page = _fetch_page(build_locations_query(line_refs, start_time, end_time, offset), default_line_ref, session)
+        pages.append(page)
+        if len(page) < PAGE_SIZE:
+            break
+        offset += PAGE_SIZE
+
+    locations = VehicleLocations.concat(pages)
+    _LOGGER.debug("Fetched %d locations for line_refs=%s in %d pages", len(locations), line_refs, len(pages))
+    return locations
@@ -0,0 +1,47 @@
+"""Negative result cache for line_refs that keep returning no vehicle locations."""
+
+from __future__ import annotations
+
+from datetime import timedelta
+
+
+class NegativeCache:
+    """Skips line_refs that recently returned nothing, backing off exponentially.
+
+    After the n-th consecutive empty result a line_ref is skipped for
+    base_ttl * 2**(n-1), capped at max_ttl. Any data clears its entry, and the
+    whole cache is dropped when the service date rolls over.
+    """
+
+    def __init__(self, base_ttl: timedelta, max_ttl: timedelta) -> None:
+        """Initialize the cache."""
+        self._base_ttl = base_ttl.total_seconds()
+        self._max_ttl = max_ttl.total_seconds()
+        self._date_str: str | None = None
+        # line_ref -> (consecutive empty results, monotonic time to retry at)
+        self._entries: dict[int, tuple[int, float]] = {}
+
+    def __len__(self) -> int:
+        """Return the number of line_refs with a negative entry."""
+        return len(self._entries)
+
+    def start_day(self, date_str: str) -> None:
+        """Invalidate every entry when the service date changes."""
+        if date_str != self._date_str:
+            self._date_str = date_str
+            self._entries.clear()
+
+    def is_suppressed(self, line_ref: int, now: float) -> bool:
+        """Return True if the line_ref should be skipped at monotonic time `now`."""
+        entry = self._entries.get(line_ref)
+        return entry is not None and now < entry[1]
+
+    def record_empty(self, line_ref: int, now: float) -> None:
+        """Record an empty or failed result for a line_ref."""
+        misses = self._entries.get(line_ref, (0, 0.0))[0] + 1
+        ttl = min(self._base_ttl * 2 ** (misses - 1), self._max_ttl)
+        self._entries[line_ref] = (misses, now + ttl)
+
+    def record_hit(self, line_ref: int) -> None:
+        """Record that a line_ref returned data."""
+        self._entries.pop(line_ref, None)
@@ -0,0 +1,180 @@
+"""Routes tracked by a config entry and the state kept for each across polls."""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+import pandas as pd
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.util import slugify
+
+from .arrival import Arrival, ArrivalDetector
+from .const import (
+    CONF_DIRECTION,
+    CONF_FILTER_NAME,
+    CONF_LAT,
+    CONF_LON,
+    CONF_PLACES,
+    CONF_ROUTE_MKT,
+    CONF_ROUTES,
+    CONF_STOP,
+    CONF_WALKING_TIME,
+    DEFAULT_WALKING_TIME,
+    DOMAIN,
+    TRAIL_MAX_POINTS,
+    TRAIL_MIN_DISTANCE,
+)
+from .shape import ShapeMatcher
+from .trail import RideTrails
+
+
+@dataclass(frozen=True)
+class RouteConfig:
+    """One route of a config entry: a route_mkt, its variant filters and the user's stop."""
+
+    route_mkt: str
+    filter_name: str | None = None
+    direction: str | None = None
+    stop: str | None = None
+    ref_point: tuple[float, float] | None = None
+    walking_time: int | None = None  # minutes
+
+    @classmethod
+    def from_dict(cls, data) -> RouteConfig:
+        """Build a route from config entry data or one item of its CONF_ROUTES."""
+        ref_point = None
+        if data.get(CONF_LAT) is not None and data.get(CONF_LON) is not None:
+            ref_point = (data[CONF_LAT], data[CONF_LON])
+        return cls(
+            route_mkt=str(data[CONF_ROUTE_MKT]),
+            filter_name=data.get(CONF_FILTER_NAME) or None,
+            direction=data.get(CONF_DIRECTION) or None,
+            stop=data.get(CONF_STOP) or None,
+            ref_point=ref_point,
+            walking_time=data.get(CONF_WALKING_TIME),
+        )
+
+    @property
+    def key(self) -> str:
+        """Return the key of the route's data, unique within its entry."""
+        return "_".join(part for part in (self.route_mkt, self.direction, self.filter_name, self.stop) if part)
+
+    @property
+    def query(self) -> tuple[str, str | None, str | None]:
+        """Return the route metadata query, shared by routes that only differ in their stop."""
+        return self.route_mkt, self.filter_name, self.direction
+
+
+@dataclass(frozen=True)
+class Place:
+    """A named point the distance and arrival of each route's bus are also reported for."""
+
+    name: str
+    lat: float
+    lon: float
+
+    @property
+    def slug(self) -> str:
+        """Return the place's name as used in unique ids."""
+        return slugify(self.name)
+
+
+def parse_places(text: str | None) -> list[Place]:
+    """Parse places given one per line (or separated by ';') as "Name: lat, lon".
+
+    Raises ValueError on a malformed line or a name used twice.
+    """
+    places = []
+    for line in (text or "").replace(";", "\n").splitlines():
+        if not line.strip():
+            continue
+        name, sep, coordinates = line.rpartition(":")
+        parts = coordinates.split(",")
+        if not sep or not slugify(name) or len(parts) != 2:
+            raise ValueError(f"Expected 'Name: lat, lon', got {line.strip()!r}")
+        place = Place(name.strip(), float(parts[0]), float(parts[1]))
+        if any(other.slug == place.slug for other in places):
+            raise ValueError(f"Place {place.name!r} is given twice")
+        places.append(place)
+    return places
+
+
+def entry_places(entry: ConfigEntry) -> list[Place]:
+    """Return the places of an entry, shared by all of its routes."""
+    return parse_places(entry.options.get(CONF_PLACES))
+
+
+def entry_routes(entry: ConfigEntry) -> list[RouteConfig]:
+    """Return the routes of an entry; entries created before CONF_ROUTES hold a single route."""
+    if CONF_ROUTES in entry.data:
+        return [RouteConfig.from_dict(route) for route in entry.data[CONF_ROUTES]]
+    return [RouteConfig.from_dict(entry.data)]
+
+
+def route_unique_id(entry: ConfigEntry, route: RouteConfig) -> str:
+    """Return the id a route's device and entities are keyed by.
+
+    Single-route entries keep their entry_id, so existing entities survive.
+    """
+    if CONF_ROUTES not in entry.data:
+        return entry.entry_id
+    return f"{entry.entry_id}_{route.key}"
+
+
+def route_label(entry: ConfigEntry, route: RouteConfig) -> str:
+    """Return the route's name in entity names, distinct within its entry."""
+    return route.key if CONF_ROUTES in entry.data else route.route_mkt
+
+
+def route_device_info(entry: ConfigEntry, route: RouteConfig) -> dict:
+    """Return the device that groups a route's entities."""
+    return {
+        "identifiers": {(DOMAIN, route_unique_id(entry, route))},
+        "name": f"Bus Line {route_label(entry, route)}",
+        "manufacturer": "Israeli Ministry of Transport",
+        "model": "SIRI API Bus Tracker",
+        "sw_version": "1.0.0",
+    }
+
+
+class RouteTracker:
+    """What the coordinator remembers about one route between polls."""
+
+    def __init__(self, route: RouteConfig, walking_time: int | None = None, places: list[Place] | None = None) -> None:
+        """Initialize; an entry-wide walking time option overrides the route's own."""
+        self.route = route
+        self.places = places or []
+        self.walking_time = timedelta(minutes=walking_time or route.walking_time or DEFAULT_WALKING_TIME)
+
+        # Passes of the reference point, detected incrementally across polls
+        self.arrival_detector = ArrivalDetector(route.ref_point) if route.ref_point else None
+        self.last_arrival: Arrival | None = None
+
+        # The latest fix of each reporting ride, keyed by ride id
+        self.fleet: dict[str, dict] = {}
+
+        # Recent positions of each reporting ride, for drawing on the map
+        self.trails = RideTrails(TRAIL_MAX_POINTS, TRAIL_MIN_DISTANCE)
+
+        # The latest leave_at, and the last one a leave-now event was fired for
+        self.leave_at: datetime | None = None
+        self.notified_leave_at: datetime | None = None
+
+        # line_refs of the cached routes, so the DataFrame isn't indexed on every poll
+        self._line_refs: tuple[pd.DataFrame, list[int]] | None = None
+
+        # Shape matchers are kept per route as they depend on its reference point and places
+        self.shapes_date: str | None = None
+        self.shape_matchers: dict[int, ShapeMatcher | None] = {}
+
+    def get_line_refs(self, routes_df: pd.DataFrame) -> list[int]:
+        """Return the line_refs of a routes DataFrame, computed once per DataFrame.
+
+        Selecting a column of a cached DataFrame on every poll leaves a reference
+        behind in pandas' copy-on-write tracking, which grows for the lifetime of
+        the routes.
+        """
+        if self._line_refs is None or self._line_refs[0] is not routes_df:
+            self._line_refs = (routes_df, [int(line_ref) for line_ref in routes_df["line_ref"]])
+        return self._line_refs[1]
@@ -9,6 +9,7 @@ from homeassistant.components.sensor import (
     SensorStateClass,
 )
 from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import EntityCategory, UnitOfTime
 from homeassistant.core import HomeAssistant
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.update_coordinator import (
@@ -17,15 +18,27 @@ from homeassistant.helpers.update_coordinator import (
 
 from .const import (
     ATTR_BEARING,
+    ATTR_BUNCHING,
     ATTR_DISTANCE_FROM_START,
     ATTR_DISTANCE_FROM_STATION,
+    ATTR_ESTIMATED_ARRIVAL,
+    ATTR_HEADWAY,
+    ATTR_HEADWAY_GAPS,
+    ATTR_LAST_ARRIVAL,
+    ATTR_LAST_UPDATE,
+    ATTR_LEAVE_AT,
     ATTR_LOCATION,
+    ATTR_PLACES,
     ATTR_SPEED,
+    ATTR_VEHICLE_REF,
     BEARING_UNITS,
+    CONF_COMPACT,
+    CONF_ROUTES,
     DISTANCE_UNITS,
     DOMAIN,
     SPEED_UNITS,
 )
+from .route import Place, RouteConfig, entry_places, entry_routes, route_device_info, route_label, route_unique_id
 
 
 async def async_setup_entry(
@@ -36,39 +49,59 @@ async def async_setup_entry(
     """Set up the Bus Line Tracker sensors."""
     coordinator = hass.data[DOMAIN][config_entry.entry_id]
 
-    sensors = [
-        BusLocationSensor(coordinator, config_entry),
-        BusSpeedSensor(coordinator, config_entry),
-        BusBearingSensor(coordinator, config_entry),
-        BusDistanceFromStartSensor(coordinator, config_entry),
-        BusDistanceFromStationSensor(coordinator, config_entry),
-    ]
+    sensors = []
+    for route in entry_routes(config_entry):
+        sensors += [
+            BusLocationSensor(coordinator, config_entry, route),
+            BusSpeedSensor(coordinator, config_entry, route),
+            BusBearingSensor(coordinator, config_entry, route),
+            BusDistanceFromStartSensor(coordinator, config_entry, route),
+            BusDistanceFromStationSensor(coordinator, config_entry, route),
+            BusLeaveAtSensor(coordinator, config_entry, route),
+            BusLastArrivalSensor(coordinator, config_entry, route),
+            BusHeadwaySensor(coordinator, config_entry, route),
+        ]
+        for place in entry_places(config_entry):
+            sensors += [
+                BusPlaceDistanceSensor(coordinator, config_entry, route, place),
+                BusPlaceArrivalSensor(coordinator, config_entry, route, place),
+            ]
+        if config_entry.options.get(CONF_COMPACT):
+            sensors.append(BusSummarySensor(coordinator, config_entry, route))
+    # The worker pool is shared by the entry's routes, so it is reported on the first route's device
+    sensors.append(BusExecutorQueueDepthSensor(coordinator, config_entry, entry_routes(config_entry)[0]))
 
     async_add_entities(sensors, True)
 
 
 class BusLineSensorBase(CoordinatorEntity, SensorEntity):
-    """Base class for bus line sensors."""
+    """Base class for bus line sensors of one route of an entry."""
 
-    def __init__(self, coordinator, config_entry):
-        """Initialize the sensor."""
+    def __init__(self, coordinator, config_entry, route: RouteConfig | None = None):
+        """Initialize the sensor, for the entry's first route unless one is given."""
         super().__init__(coordinator)
         self._config_entry = config_entry
+        self._route = route or entry_routes(config_entry)[0]
+        name = self._attr_name
+        if CONF_ROUTES in config_entry.data:
+            name = f"{route_label(config_entry, self._route)} {name}"
         self.entity_description = SensorEntityDescription(
             key=f"sensor.{self._attr_name.lower().replace(' ', '_')}",
-            name=self._attr_name,
+            name=name,
             native_unit_of_measurement=self._attr_native_unit_of_measurement,
             device_class=self._attr_device_class,
             state_class=self._attr_state_class,
         )
-        self._attr_unique_id = f"{config_entry.entry_id}_{self.entity_description.key}"
-        self._attr_device_info = {
-            "identifiers": {(DOMAIN, config_entry.entry_id)},
-            "name": f"Bus Line {config_entry.data.get('route_mkt', '')}",
-            "manufacturer": "Israeli Ministry of Transport",
-            "model": "SIRI API Bus Tracker",
-            "sw_version": "1.0.0",
-        }
+        self._attr_name = name
+        self._attr_unique_id = f"{route_unique_id(config_entry, self._route)}_{self.entity_description.key}"
+        self._attr_device_info = route_device_info(config_entry, self._route)
+        # In compact mode only the summary sensor is enabled, the others can be enabled one by one
+        self._attr_entity_registry_enabled_default = not config_entry.options.get(CONF_COMPACT)
+
+    @property
+    def route_data(self) -> dict:
+        """Return the coordinator's data for this sensor's route."""
+        return (self.coordinator.data or {}).get(self._route.key) or {}
 
 
 class BusLocationSensor(BusLineSensorBase):
@@ -82,9 +115,7 @@ class BusLocationSensor(BusLineSensorBase):
     @property
     def state(self):
         """Return the state of the sensor."""
-        if self.coordinator.data:
-            return self.coordinator.data.get(ATTR_LOCATION)
-        return None
+        return self.route_data.get(ATTR_LOCATION)
 
 
 class BusSpeedSensor(BusLineSensorBase):
@@ -98,9 +129,7 @@ class BusSpeedSensor(BusLineSensorBase):
     @property
     def state(self):
         """Return the state of the sensor."""
-        if self.coordinator.data:
-            return self.coordinator.data.get(ATTR_SPEED)
-        return None
+        return self.route_data.get(ATTR_SPEED)
 
 
 class BusBearingSensor(BusLineSensorBase):
@@ -114,9 +143,7 @@ class BusBearingSensor(BusLineSensorBase):
     @property
     def state(self):
         """Return the state of the sensor."""
-        if self.coordinator.data:
-            return self.coordinator.data.get(ATTR_BEARING)
-        return None
+        return self.route_data.get(ATTR_BEARING)
 
 
 class BusDistanceFromStartSensor(BusLineSensorBase):
@@ -130,13 +157,16 @@ class BusDistanceFromStartSensor(BusLineSensorBase):
     @property
     def state(self):
         """Return the state of the sensor."""
-        if self.coordinator.data:
-            return self.coordinator.data.get(ATTR_DISTANCE_FROM_START)
-        return None
+        return self.route_data.get(ATTR_DISTANCE_FROM_START)
 
 
 class BusDistanceFromStationSensor(BusLineSensorBase):
-    """Sensor for distance from configured station."""
+    """Sensor for distance from configured station.
+
+    Measured along the route shape where the bus can be matched to it, and then
+    signed: negative once the bus has passed the station. Buses that can't be
+    matched report the straight-line distance, which is never negative.
+    """
 
     _attr_name = "Distance from Station"
     _attr_native_unit_of_measurement = DISTANCE_UNITS
@@ -146,6 +176,193 @@ class BusDistanceFromStationSensor(BusLineSensorBase):
     @property
     def state(self):
         """Return the state of the sensor."""
-        if self.coordinator.data:
-            return self.coordinator.data.get(ATTR_DISTANCE_FROM_STATION)
-        return None
+        return self.route_data.get(ATTR_DISTANCE_FROM_STATION)
+
+
+class BusLeaveAtSensor(BusLineSensorBase):
+    """Sensor for when to leave to catch the bus, given the walking time to the station."""
+
+    _attr_name = "Leave At"
+    _attr_native_unit_of_measurement = None
+    _attr_device_class = SensorDeviceClass.TIMESTAMP
+    _attr_state_class = None
+
+    @property
+    def native_value(self):
+        """Return the time to leave."""
+        return self.route_data.get(ATTR_LEAVE_AT)
+
+    @property
+    def extra_state_attributes(self):
+        """Return the estimated arrival at the station."""
+        if self.route_data:
+            return {ATTR_ESTIMATED_ARRIVAL: self.route_data.get(ATTR_ESTIMATED_ARRIVAL)}
+        return {}
+
+
+class BusLastArrivalSensor(BusLineSensorBase):
+    """Sensor for when a bus last passed the configured station."""
+
+    _attr_name = "Last Arrival"
+    _attr_native_unit_of_measurement = None
+    _attr_device_class = SensorDeviceClass.TIMESTAMP
+    _attr_state_class = None
+
+    @property
+    def native_value(self):
+        """Return the time of the last arrival."""
+        arrival = self.coordinator.trackers[self._route.key].last_arrival
+        return arrival.time if arrival else None
+
+    @property
+    def extra_state_attributes(self):
+        """Return the ride that arrived."""
+        arrival = self.coordinator.trackers[self._route.key].last_arrival
+        if not arrival:
+            return {}
+        return {
+            "ride_id": arrival.ride_id,
+            "vehicle_ref": arrival.vehicle_ref,
+            "distance": round(arrival.distance, 1),
+        }
+
+
+class BusHeadwaySensor(BusLineSensorBase):
+    """Sensor for the median time between consecutive buses of the route."""
+
+    _attr_name = "Headway"
+    _attr_native_unit_of_measurement = UnitOfTime.MINUTES
+    _attr_device_class = SensorDeviceClass.DURATION
+    _attr_state_class = SensorStateClass.MEASUREMENT
+
+    @property
+    def state(self):
+        """Return the state of the sensor."""
+        return self.route_data.get(ATTR_HEADWAY)
+
+    @property
+    def extra_state_attributes(self):
+        """Return the gap between each pair of consecutive buses, leading pair first."""
+        if ATTR_HEADWAY_GAPS not in self.route_data:
+            return {}
+        return {"gaps": self.route_data[ATTR_HEADWAY_GAPS]}
+
+
+class BusPlaceSensorBase(BusLineSensorBase):
+    """Base class for the sensors of one of the entry's places."""
+
+    _name_format: str
+
+    def __init__(self, coordinator, config_entry, route: RouteConfig, place: Place):
+        """Initialize the sensor, named and keyed after the place."""
+        self._place = place
+        self._attr_name = self._name_format.format(place.name)
+        super().__init__(coordinator, config_entry, route)
+        key = self._name_format.format(place.slug).lower().replace(" ", "_")
+        self._attr_unique_id = f"{route_unique_id(config_entry, route)}_sensor.{key}"
+
+    @property
+    def place_data(self) -> dict:
+        """Return the coordinator's data for this sensor's place."""
+        return self.route_data.get(ATTR_PLACES, {}).get(self._place.name) or {}
+
+
+class BusPlaceDistanceSensor(BusPlaceSensorBase):
+    """Sensor for the distance from the tracked bus to a place."""
+
+    _name_format = "Distance to {}"
+    _attr_native_unit_of_measurement = DISTANCE_UNITS
+    _attr_device_class = SensorDeviceClass.DISTANCE
+    _attr_state_class = SensorStateClass.MEASUREMENT
+
+    @property
+    def state(self):
+        """Return the state of the sensor."""
+        return self.place_data.get("distance")
+
+
+class BusPlaceArrivalSensor(BusPlaceSensorBase):
+    """Sensor for when the tracked bus reaches a place."""
+
+    _name_format = "Arrival at {}"
+    _attr_native_unit_of_measurement = None
+    _attr_device_class = SensorDeviceClass.TIMESTAMP
+    _attr_state_class = None
+
+    @property
+    def native_value(self):
+        """Return the estimated arrival at the place."""
+        return self.place_data.get(ATTR_ESTIMATED_ARRIVAL)
+
+
+class BusSummarySensor(BusLineSensorBase):
+    """Compact mode sensor with every value of the tracked bus as typed attributes.
+
+    Its state is the estimated arrival at the station, so a refresh writes a
+    single state instead of one per sensor.
+    """
+
+    _attr_name = "Bus"
+    _attr_native_unit_of_measurement = None
+    _attr_device_class = SensorDeviceClass.TIMESTAMP
+    _attr_state_class = None
+    _unrecorded_attributes = frozenset({ATTR_PLACES})
+
+    def __init__(self, coordinator, config_entry, route: RouteConfig | None = None):
+        """Initialize the sensor, enabled even though the entry is in compact mode."""
+        super().__init__(coordinator, config_entry, route)
+        self._attr_entity_registry_enabled_default = True
+
+    @property
+    def native_value(self):
+        """Return the estimated arrival at the station."""
+        return self.route_data.get(ATTR_ESTIMATED_ARRIVAL)
+
+    @property
+    def extra_state_attributes(self):
+        """Return the bus's position, motion and timing, with numbers and times kept as such."""
+        data = self.route_data
+        arrival = self.coordinator.trackers[self._route.key].last_arrival
+        attributes = {ATTR_LAST_ARRIVAL: arrival.time if arrival else None}
+        if not data:
+            return attributes
+
+        latitude, longitude = (float(value) for value in data[ATTR_LOCATION].split(","))
+        attributes.update(
+            {
+                "latitude": latitude,
+                "longitude": longitude,
+                ATTR_SPEED: data.get(ATTR_SPEED),
+                ATTR_BEARING: data.get(ATTR_BEARING),
+                ATTR_DISTANCE_FROM_START: data.get(ATTR_DISTANCE_FROM_START),
+                ATTR_DISTANCE_FROM_STATION: data.get(ATTR_DISTANCE_FROM_STATION),
+                ATTR_VEHICLE_REF: data.get(ATTR_VEHICLE_REF),
+                ATTR_LAST_UPDATE: data.get(ATTR_LAST_UPDATE),
+                ATTR_LEAVE_AT: data.get(ATTR_LEAVE_AT),
+                ATTR_HEADWAY: data.get(ATTR_HEADWAY),
+                ATTR_BUNCHING: data.get(ATTR_BUNCHING),
+            }
+        )
+        if data.get(ATTR_PLACES):
+            attributes[ATTR_PLACES] = data[ATTR_PLACES]
+        return attributes
+
+
+class BusExecutorQueueDepthSensor(BusLineSensorBase):
+    """Diagnostic sensor for jobs waiting on the integration's worker pool."""
+
+    _attr_name = "Executor Queue Depth"
+    _attr_native_unit_of_measurement = None
+    _attr_device_class = None
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+
+    async def async_added_to_hass(self) -> None:
+        """Write the depth as jobs queue and start, not only when the coordinator refreshes."""
+        await super().async_added_to_hass()
+        self.async_on_remove(self.coordinator.executor.async_add_listener(self.async_write_ha_state))
+
+    @property
+    def state(self):
+        """Return the state of the sensor."""
+        return self.coordinator.executor.queue_depth
@@ -0,0 +1,164 @@
+"""Services for the Bus Line Tracker integration."""
+
+from __future__ import annotations
+
+import logging
+import os
+import zipfile
+
+import voluptuous as vol
+from homeassistant.core import HomeAssistant, ServiceCall, ServiceResponse, SupportsResponse, callback
+from homeassistant.exceptions import HomeAssistantError, ServiceValidationError
+from homeassistant.helpers import config_validation as cv
+
+from .analytics import async_analyze_punctuality
+from .const import ANALYTICS_MAX_DAYS, CONF_ROUTE_MKT, DOMAIN, TRACE_DEFAULT_REFRESHES, TRACE_MAX_REFRESHES
+from .gtfs_store import async_build_gtfs_store
+from .route import entry_routes
+
+_LOGGER = logging.getLogger(__name__)
+
+SERVICE_ANALYZE_PUNCTUALITY = "analyze_punctuality"
+SERVICE_START_TRACE = "start_trace"
+SERVICE_STOP_TRACE = "stop_trace"
+SERVICE_BUILD_GTFS_STORE = "build_gtfs_store"
+
+ATTR_CONFIG_ENTRY_ID = "config_entry_id"
+ATTR_START_DATE = "start_date"
+ATTR_END_DATE = "end_date"
+ATTR_REFRESHES = "refreshes"
+ATTR_PATH = "path"
+
+ANALYZE_PUNCTUALITY_SCHEMA = vol.Schema(
+    {
+        vol.Required(ATTR_CONFIG_ENTRY_ID): cv.string,
+        vol.Required(ATTR_START_DATE): cv.date,
+        vol.Required(ATTR_END_DATE): cv.date,
+        vol.Optional(CONF_ROUTE_MKT): cv.string,
+    }
+)
+
+START_TRACE_SCHEMA = vol.Schema(
+    {
+        vol.Required(ATTR_CONFIG_ENTRY_ID): cv.string,
+        vol.Optional(ATTR_REFRESHES, default=TRACE_DEFAULT_REFRESHES): vol.All(
+            vol.Coerce(int), vol.Range(min=1, max=TRACE_MAX_REFRESHES)
+        ),
+    }
+)
+
+STOP_TRACE_SCHEMA = vol.Schema({vol.Required(ATTR_CONFIG_ENTRY_ID): cv.string})
+
+BUILD_GTFS_STORE_SCHEMA = vol.Schema({vol.Required(ATTR_PATH): cv.string})
+
+
+async def _async_analyze_punctuality(hass: HomeAssistant, call: ServiceCall) -> ServiceResponse:
+    """Analyse a tracked line's history over a date range."""
+    entry = hass.config_entries.async_get_entry(call.data[ATTR_CONFIG_ENTRY_ID])
+    if entry is None or entry.domain != DOMAIN:
+        raise ServiceValidationError(f"{call.data[ATTR_CONFIG_ENTRY_ID]} is not a Bus Line Tracker entry")
+
+    start = call.data[ATTR_START_DATE]
+    end = call.data[ATTR_END_DATE]
+    if not 0 <= (end - start).days < ANALYTICS_MAX_DAYS:
+        raise ServiceValidationError(f"The date range must run forwards and span at most {ANALYTICS_MAX_DAYS} days")
+
+    # Entries with several routes need the route to be named
+    routes = entry_routes(entry)
+    if CONF_ROUTE_MKT in call.data:
+        routes = [route for route in routes if route.route_mkt == call.data[CONF_ROUTE_MKT]]
+    if len(routes) != 1:
+        raise ServiceValidationError(f"Pick one of the routes of {entry.title} with {CONF_ROUTE_MKT}")
+    route = routes[0]
+
+    return await async_analyze_punctuality(
+        hass,
+        route.route_mkt,
+        route.filter_name,
+        route.direction,
+        route.ref_point,
+        start,
+        end,
+    )
+
+
+def _get_coordinator(hass: HomeAssistant, call: ServiceCall):
+    """Return the coordinator of the loaded entry a service call names."""
+    from . import BusLineDataCoordinator  # the package imports this module
+
+    coordinator = hass.data.get(DOMAIN, {}).get(call.data[ATTR_CONFIG_ENTRY_ID])
+    if not isinstance(coordinator, BusLineDataCoordinator):
+        raise ServiceValidationError(f"{call.data[ATTR_CONFIG_ENTRY_ID]} is not a loaded Bus Line Tracker entry")
+    return coordinator
+
+
+def _start_trace(hass: HomeAssistant, call: ServiceCall) -> None:
+    """Start capturing the frames of an entry's refreshes for its diagnostics."""
+    coordinator = _get_coordinator(hass, call)
+    coordinator.tracer.start(call.data[ATTR_REFRESHES])
+    _LOGGER.info("Tracing the last %d refreshes of %s", call.data[ATTR_REFRESHES], call.data[ATTR_CONFIG_ENTRY_ID])
+
+
+def _stop_trace(hass: HomeAssistant, call: ServiceCall) -> None:
+    """Stop capturing an entry's refreshes and drop its trace."""
+    _get_coordinator(hass, call).tracer.stop()
+
+
+async def _async_build_gtfs_store(hass: HomeAssistant, call: ServiceCall) -> ServiceResponse:
+    """Convert a local GTFS zip into the memory-mapped store used for stops and shapes."""
+    path = os.path.realpath(hass.config.path(call.data[ATTR_PATH]))
+    config_dir = os.path.realpath(hass.config.config_dir)
+    if os.path.commonpath([path, config_dir]) != config_dir and not hass.config.is_allowed_path(path):
+        raise ServiceValidationError(f"{path} is outside the configuration directory and allowlist_external_dirs")
+
+    try:
+        return await async_build_gtfs_store(hass, path)
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+        raise HomeAssistantError(f"Failed to build the GTFS store from {path}: {e}") from e
+
+
+def async_register_services(hass: HomeAssistant) -> None:
+    """Register the integration's services, once for all entries."""
+    if hass.services.has_service(DOMAIN, SERVICE_ANALYZE_PUNCTUALITY):
+        return
+
+    async def async_analyze_punctuality_service(call: ServiceCall) -> ServiceResponse:
+        return await _async_analyze_punctuality(hass, call)
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_ANALYZE_PUNCTUALITY,
+        async_analyze_punctuality_service,
+        schema=ANALYZE_PUNCTUALITY_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
+
+    @callback
+    def async_start_trace_service(call: ServiceCall) -> None:
+        _start_trace(hass, call)
+
+    @callback
+    def async_stop_trace_service(call: ServiceCall) -> None:
+        _stop_trace(hass, call)
+
+    hass.services.async_register(DOMAIN, SERVICE_START_TRACE, async_start_trace_service, schema=START_TRACE_SCHEMA)
+    hass.services.async_register(DOMAIN, SERVICE_STOP_TRACE, async_stop_trace_service, schema=STOP_TRACE_SCHEMA)
+
+    async def async_build_gtfs_store_service(call: ServiceCall) -> ServiceResponse:
+        return await _async_build_gtfs_store(hass, call)
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_BUILD_GTFS_STORE,
+        async_build_gtfs_store_service,
+        schema=BUILD_GTFS_STORE_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+
+
+def async_unregister_services(hass: HomeAssistant) -> None:
+    """Remove the integration's services when its last entry is unloaded."""
+    hass.services.async_remove(DOMAIN, SERVICE_ANALYZE_PUNCTUALITY)
+    hass.services.async_remove(DOMAIN, SERVICE_START_TRACE)
+    hass.services.async_remove(DOMAIN, SERVICE_STOP_TRACE)
+    hass.services.async_remove(DOMAIN, SERVICE_BUILD_GTFS_STORE)
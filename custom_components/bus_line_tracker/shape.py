@@ -0,0 +1,181 @@
+"""Route shapes for along-route distance calculations."""
+
+from __future__ import annotations
+
+import logging
+import math
+
+import numpy as np
+import stride
+
+from .geo import EARTH_RADIUS, haversine_distances
+
+_LOGGER = logging.getLogger(__name__)
+
+SHAPE_SEARCH_WINDOW = 4  # segments on each side of the expected segment
+MAX_SHAPE_OFFSET = 300  # meters a point may be off the shape and still be matched
+
+
+class RouteShape:
+    """A route polyline with a precomputed cumulative distance array.
+
+    Points are projected onto the polyline in a local equirectangular plane, which
+    is accurate to well under a meter at the scale of a bus route. Shapes built
+    from a ride's stops also know the stop code of each vertex.
+    """
+
+    def __init__(self, date_str: str, lats, lons, stop_codes=None) -> None:
+        """Initialize the shape from ordered polyline vertices and, optionally, their stop codes."""
+        self.date_str = date_str
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        if len(self.lats) < 2:
+            raise ValueError("A route shape needs at least two points")
+        self.stop_codes = [str(code) for code in stop_codes] if stop_codes is not None else None
+
+        self.cumulative = np.concatenate(
+            ([0.0], np.cumsum(haversine_distances(self.lats[:-1], self.lons[:-1], self.lats[1:], self.lons[1:])))
+        )
+        self._lon_scale = math.cos(math.radians(float(self.lats.mean())))
+        self._x = np.radians(self.lons) * self._lon_scale * EARTH_RADIUS
+        self._y = np.radians(self.lats) * EARTH_RADIUS
+
+    @property
+    def length(self) -> float:
+        """Return the total length of the shape in meters."""
+        return float(self.cumulative[-1])
+
+    @property
+    def segments(self) -> int:
+        """Return the number of polyline segments."""
+        return len(self.lats) - 1
+
+    def segment_at(self, distance: float) -> int:
+        """Return the segment containing the given along-route distance (binary search)."""
+        index = int(np.searchsorted(self.cumulative, distance, side="right")) - 1
+        return min(max(index, 0), self.segments - 1)
+
+    def stop_segment(self, stop_code: str) -> int | None:
+        """Return the segment starting at a stop's first visit, or None if the shape doesn't know the stop."""
+        if self.stop_codes is None or stop_code not in self.stop_codes:
+            return None
+        return min(self.stop_codes.index(stop_code), self.segments - 1)
+
+    def project(self, lat: float, lon: float, hint: int | None = None, window: int = SHAPE_SEARCH_WINDOW):
+        """Project a point onto the shape.
+
+        Only the segments within `window` of `hint` are searched; without a hint the
+        whole polyline is scanned. Returns (along_distance, segment, offset) where
+        offset is the distance in meters from the point to the shape.
+        """
+        if hint is None:
+            start, end = 0, self.segments
+        else:
+            start, end = max(hint - window, 0), min(hint + window + 1, self.segments)
+
+        x = math.radians(lon) * self._lon_scale * EARTH_RADIUS
+        y = math.radians(lat) * EARTH_RADIUS
+        ax, ay = self._x[start:end], self._y[start:end]
+        dx, dy = self._x[start + 1 : end + 1] - ax, self._y[start + 1 : end + 1] - ay
+        length_sq = dx * dx + dy * dy
+        with np.errstate(invalid="ignore", divide="ignore"):
+            t = np.where(length_sq > 0, ((x - ax) * dx + (y - ay) * dy) / length_sq, 0.0)
+        t = np.clip(t, 0.0, 1.0)
+        offsets = np.hypot(ax + t * dx - x, ay + t * dy - y)
+
+        best = int(np.argmin(offsets))
+        segment = start + best
+        seg_length = self.cumulative[segment + 1] - self.cumulative[segment]
+        along = float(self.cumulative[segment] + t[best] * seg_length)
+        return along, segment, float(offsets[best])
+
+
+def build_route_shape(gtfs_route_id: int, date_str: str) -> RouteShape:
+    """Build a route's shape from the stops of one of its planned rides on the given date."""
+    rides = stride.get(
+        "/gtfs_rides/list",
+        {"gtfs_route_id": gtfs_route_id, "limit": 1},
+    )
+    if not rides:
+        raise ValueError(f"No planned rides for gtfs_route_id {gtfs_route_id}")
+
+    lats, lons, stop_codes = [], [], []
+    for ride_stop in stride.iterate(
+        "/gtfs_ride_stops/list",
+        {"gtfs_ride_ids": rides[0]["id"], "order_by": "stop_sequence asc"},
+    ):
+        lats.append(ride_stop["gtfs_stop__lat"])
+        lons.append(ride_stop["gtfs_stop__lon"])
+        stop_codes.append(ride_stop.get("gtfs_stop__code"))
+
+    _LOGGER.debug("Built shape for gtfs_route_id %s with %d points", gtfs_route_id, len(lats))
+    return RouteShape(date_str, lats, lons, stop_codes)
+
+
+class ShapeMatcher:
+    """Tracks each ride's last matched segment so updates only search a small window."""
+
+    def __init__(
+        self, shape: RouteShape, ref_point: tuple[float, float] | None, places=(), stop: str | None = None
+    ) -> None:
+        """Initialize the matcher and project the reference point and any named places once.
+
+        `places` are (lat, lon) pairs; distances_along() returns them in order,
+        after the reference point when there is one. On a loop or out-and-back
+        route the reference point can be as close to another leg as to its own,
+        so when the shape knows the code of the station's `stop` the point is
+        projected near that stop's place in the ride instead of anywhere.
+        """
+        self.shape = shape
+        projected = [shape.project(lat, lon) for lat, lon in places]
+        if ref_point:
+            hint = shape.stop_segment(stop) if stop is not None else None
+            station = shape.project(*ref_point, hint) if hint is not None else None
+            if station is None or station[2] > MAX_SHAPE_OFFSET:
+                station = shape.project(*ref_point)
+            projected.insert(0, station)
+        self.points_along = np.array([along for along, _, _ in projected], dtype=np.float64)
+        self.points_offset = np.array([offset for _, _, offset in projected], dtype=np.float64)
+        self.has_station = ref_point is not None
+        if self.has_station:
+            self.station_along, self.station_offset = float(self.points_along[0]), float(self.points_offset[0])
+        self._last_segment: dict[str, int] = {}
+
+    def distance_to_station(self, ride_id, lat, lon, distance_from_start=None):
+        """Return the along-route distance from the vehicle to the station.
+
+        Positive values mean the station is still ahead of the vehicle. Returns None
+        when the station or vehicle is too far from the shape to be matched.
+        """
+        if not self.has_station or self.station_offset > MAX_SHAPE_OFFSET:
+            return None
+        distances = self.distances_along(ride_id, lat, lon, distance_from_start)
+        return None if distances is None else float(distances[0])
+
+    def distances_along(self, ride_id, lat, lon, distance_from_start=None) -> np.ndarray | None:
+        """Return the along-route distances from the vehicle to every projected point.
+
+        The vehicle is matched once for all points. Points too far from the shape
+        are NaN; returns None when the vehicle itself can't be matched.
+        """
+        hint = self._last_segment.get(ride_id)
+        if hint is None and distance_from_start is not None and not math.isnan(distance_from_start):
+            hint = self.shape.segment_at(distance_from_start)
+
+        along, segment, offset = self.shape.project(lat, lon, hint)
+        if offset > MAX_SHAPE_OFFSET and hint is not None:
+            # Lost track of the ride (e.g. a detour), rescan the whole shape
+            along, segment, offset = self.shape.project(lat, lon)
+        if offset > MAX_SHAPE_OFFSET:
+            self._last_segment.pop(ride_id, None)
+            return None
+
+        self._last_segment[ride_id] = segment
+        return np.where(self.points_offset > MAX_SHAPE_OFFSET, np.nan, self.points_along - along)
+
+    def prune(self, active_ride_ids) -> None:
+        """Forget rides that are no longer active."""
+        active = set(active_ride_ids)
+        for ride_id in list(self._last_segment):
+            if ride_id not in active:
+                del self._last_segment[ride_id]
@@ -0,0 +1,84 @@
+"""On-demand capture of the frames behind the latest refreshes, for diagnostics."""
+
+from __future__ import annotations
+
+import json
+from collections import deque
+from datetime import datetime
+
+import pandas as pd
+
+from .locations import VehicleLocations
+
+
+class FrameTracer:
+    """A ring buffer of the raw frames of the last refreshes, off unless started.
+
+    Frames are kept by reference, as the routes DataFrames are cached and the
+    vehicle locations are never modified after a poll, and only converted to
+    plain data when the trace is downloaded. A disabled tracer costs a single
+    attribute check per refresh.
+    """
+
+    def __init__(self) -> None:
+        """Initialize a stopped tracer."""
+        self._frames: deque[dict] | None = None
+
+    @property
+    def enabled(self) -> bool:
+        """Return True while refreshes are being captured."""
+        return self._frames is not None
+
+    def start(self, refreshes: int) -> None:
+        """Start keeping the frames of the last `refreshes` refreshes, dropping any earlier trace."""
+        self._frames = deque(maxlen=refreshes)
+
+    def stop(self) -> None:
+        """Stop capturing and drop the trace."""
+        self._frames = None
+
+    def capture(
+        self,
+        time: datetime,
+        routes: dict[str, pd.DataFrame | None],
+        line_refs: list[int],
+        start_time: datetime,
+        end_time: datetime,
+        locations: VehicleLocations,
+    ) -> None:
+        """Record the frames of one refresh; callers check `enabled` first."""
+        self._frames.append(
+            {
+                "time": time,
+                "routes": routes,
+                "line_refs": line_refs,
+                "start_time": start_time,
+                "end_time": end_time,
+                "locations": locations,
+            }
+        )
+
+    def as_dict(self) -> dict:
+        """Return the trace as JSON-serializable data, oldest refresh first."""
+        if self._frames is None:
+            return {"enabled": False, "refreshes": []}
+        return {
+            "enabled": True,
+            "max_refreshes": self._frames.maxlen,
+            "refreshes": [_serialize(frames) for frames in self._frames],
+        }
+
+
+def _serialize(frames: dict) -> dict:
+    return {
+        "time": frames["time"].isoformat(),
+        "routes": {
+            key: json.loads(routes_df.to_json(orient="records", date_format="iso")) if routes_df is not None else None
+            for key, routes_df in frames["routes"].items()
+        },
+        "line_refs": list(frames["line_refs"]),
+        "start_time": frames["start_time"].isoformat(),
+        "end_time": frames["end_time"].isoformat(),
+        # NaNs are written as null by Home Assistant's JSON encoder
+        "locations": {field: column.tolist() for field, column in frames["locations"].columns.items()},
+    }
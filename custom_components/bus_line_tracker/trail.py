@@ -0,0 +1,110 @@
+"""Bounded per-ride position trails, exposed as encoded polylines."""
+
+from __future__ import annotations
+
+import numpy as np
+
+from .geo import haversine_distance
+from .locations import VehicleLocations
+
+
+def encode_polyline(lats, lons, precision: int = 5) -> str:
+    """Encode coordinates with Google's encoded polyline algorithm."""
+    factor = 10**precision
+    coords = np.round(np.column_stack((lats, lons)) * factor).astype(np.int64)
+    deltas = np.diff(coords, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    values = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+
+    chunks = []
+    for value in values.tolist():
+        while value >= 0x20:
+            chunks.append(chr((0x20 | (value & 0x1F)) + 63))
+            value >>= 5
+        chunks.append(chr(value + 63))
+    return "".join(chunks)
+
+
+class RideTrail:
+    """The latest fixes of one ride in a fixed-size ring, oldest overwritten first.
+
+    Fixes closer than min_distance to the previous kept one are skipped, so a bus
+    waiting at a terminal doesn't fill the ring with a single spot.
+    """
+
+    def __init__(self, size: int, min_distance: float) -> None:
+        """Initialize an empty trail of at most `size` points."""
+        self.min_distance = min_distance
+        self._lat = np.empty(size)
+        self._lon = np.empty(size)
+        self._next = 0  # slot the next point is written to
+        self._count = 0
+        self._last_time = -np.inf
+
+    def __len__(self) -> int:
+        """Return the number of points on the trail."""
+        return self._count
+
+    def extend(self, times: np.ndarray, lats: np.ndarray, lons: np.ndarray) -> None:
+        """Add the fixes recorded after the latest one on the trail."""
+        new = (times > self._last_time) & ~np.isnan(lats) & ~np.isnan(lons)
+        if not new.any():
+            return
+        order = np.argsort(times[new], kind="stable")
+        times, lats, lons = times[new][order], lats[new][order], lons[new][order]
+        self._last_time = times[-1]
+
+        size = len(self._lat)
+        for lat, lon in zip(lats.tolist(), lons.tolist(), strict=True):
+            if self._count:
+                last = (self._next - 1) % size
+                if haversine_distance(self._lat[last], self._lon[last], lat, lon) < self.min_distance:
+                    continue
+            self._lat[self._next] = lat
+            self._lon[self._next] = lon
+            self._next = (self._next + 1) % size
+            self._count = min(self._count + 1, size)
+
+    def points(self) -> tuple[np.ndarray, np.ndarray]:
+        """Return the latitudes and longitudes of the trail, oldest first."""
+        indices = (self._next - self._count + np.arange(self._count)) % len(self._lat)
+        return self._lat[indices], self._lon[indices]
+
+    def encoded(self) -> str:
+        """Return the trail as an encoded polyline."""
+        return encode_polyline(*self.points())
+
+
+class RideTrails:
+    """The trails of the rides of one route, kept for as long as the rides report."""
+
+    def __init__(self, size: int, min_distance: float) -> None:
+        """Initialize; each ride's trail holds at most `size` points."""
+        self.size = size
+        self.min_distance = min_distance
+        self._trails: dict[int, RideTrail] = {}
+
+    def __len__(self) -> int:
+        """Return the number of rides with a trail."""
+        return len(self._trails)
+
+    def update(self, locations: VehicleLocations) -> None:
+        """Extend each ride's trail with its new fixes and drop rides that stopped reporting."""
+        ride_ids = locations["siri_ride__id"]
+        order = np.argsort(ride_ids, kind="stable")
+        sorted_rides = ride_ids[order]
+        starts = np.flatnonzero(np.r_[True, sorted_rides[1:] != sorted_rides[:-1]]) if len(order) else []
+        ends = np.r_[starts[1:], len(order)] if len(order) else []
+
+        trails = {}
+        for start, end in zip(starts, ends, strict=True):
+            ride_id = int(sorted_rides[start])
+            indices = order[start:end]
+            trail = self._trails.get(ride_id) or RideTrail(self.size, self.min_distance)
+            trail.extend(locations["recorded_at_time"][indices], locations["lat"][indices], locations["lon"][indices])
+            trails[ride_id] = trail
+        self._trails = trails
+
+    def encoded(self, ride_id: int) -> str | None:
+        """Return a ride's trail as an encoded polyline, or None without one."""
+        trail = self._trails.get(int(ride_id))
+        return trail.encoded() if trail is not None and len(trail) else None
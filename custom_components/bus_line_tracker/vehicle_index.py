@@ -0,0 +1,96 @@
+"""Recent fixes of each vehicle across polls, to derive speed and heading from positions."""
+
+from __future__ import annotations
+
+from collections import OrderedDict, deque
+
+import numpy as np
+
+from .geo import haversine_distance, initial_bearing
+from .locations import VehicleLocations
+
+
+class VehicleIndex:
+    """The last `size` fixes of every vehicle, keyed by vehicle_ref.
+
+    Adding a fix and looking up a vehicle are O(1). Vehicles are kept in the
+    order they last reported, so the ones silent for longer than max_age are
+    evicted from the front without scanning the others.
+    """
+
+    def __init__(self, size: int, max_age: float, max_speed: float, min_heading_distance: float) -> None:
+        """Initialize an empty index; max_age is in seconds and max_speed in km/h."""
+        self.size = size
+        self.max_age = max_age
+        self.max_speed = max_speed
+        self.min_heading_distance = min_heading_distance
+        # vehicle_ref -> (time, lat, lon) fixes, oldest first; least recently reporting vehicle first
+        self._fixes: OrderedDict[str, deque[tuple[float, float, float]]] = OrderedDict()
+
+    def __len__(self) -> int:
+        """Return the number of vehicles in the index."""
+        return len(self._fixes)
+
+    def update(self, locations: VehicleLocations) -> None:
+        """Add the fixes newer than each vehicle's latest, then evict vehicles that stopped reporting."""
+        if locations.is_empty:
+            return
+        times = locations["recorded_at_time"]
+        order = np.argsort(times, kind="stable")
+        vehicle_refs = locations["siri_ride__vehicle_ref"][order].tolist()
+        lats = locations["lat"][order].tolist()
+        lons = locations["lon"][order].tolist()
+
+        for vehicle_ref, fix_time, lat, lon in zip(vehicle_refs, times[order].tolist(), lats, lons, strict=True):
+            if not vehicle_ref or lat != lat or lon != lon:
+                continue
+            fixes = self._fixes.get(vehicle_ref)
+            if fixes is None:
+                fixes = self._fixes[vehicle_ref] = deque(maxlen=self.size)
+            elif fix_time <= fixes[-1][0]:
+                continue
+            else:
+                self._fixes.move_to_end(vehicle_ref)
+            fixes.append((fix_time, lat, lon))
+
+        newest = float(times[order[-1]])
+        while self._fixes:
+            vehicle_ref, fixes = next(iter(self._fixes.items()))
+            if newest - fixes[-1][0] <= self.max_age:
+                break
+            del self._fixes[vehicle_ref]
+
+    def motion(self, vehicle_ref: str | None) -> tuple[float | None, float | None]:
+        """Return a vehicle's (speed in km/h, bearing in degrees) derived from its latest fixes.
+
+        A fix that would mean moving faster than max_speed from the previous
+        kept one is a GPS jump and is dropped. The last step between kept fixes
+        gives the speed, and the heading when it is long enough to be meaningful.
+        """
+        fixes = self._fixes.get(vehicle_ref) if vehicle_ref else None
+        if not fixes or len(fixes) < 2:
+            return None, None
+
+        fixes = list(fixes)
+        # Should the oldest fix be the jump, nothing follows it; start from the next one
+        for start in range(len(fixes) - 1):
+            kept = [fixes[start]]
+            for fix in fixes[start + 1 :]:
+                if self._speed(kept[-1], fix)[0] <= self.max_speed:
+                    kept.append(fix)
+            if len(kept) >= 2:
+                break
+        else:
+            return None, None
+
+        speed, distance = self._speed(kept[-2], kept[-1])
+        bearing = None
+        if distance >= self.min_heading_distance:
+            bearing = round(initial_bearing(kept[-2][1], kept[-2][2], kept[-1][1], kept[-1][2]), 1)
+        return round(speed, 1), bearing
+
+    @staticmethod
+    def _speed(earlier: tuple[float, float, float], later: tuple[float, float, float]) -> tuple[float, float]:
+        """Return the speed in km/h and the distance in meters between two fixes."""
+        distance = haversine_distance(earlier[1], earlier[2], later[1], later[2])
+        return distance / (later[0] - earlier[0]) * 3.6, distance
@@ -0,0 +1,81 @@
+"""WebSocket API of the Bus Line Tracker integration."""
+
+from __future__ import annotations
+
+from typing import Any
+
+import voluptuous as vol
+from homeassistant.components import websocket_api
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+
+from .const import DOMAIN, SIGNAL_ENTRY_UNLOADED
+
+WS_TYPE_FLEET_SUBSCRIBE = f"{DOMAIN}/fleet/subscribe"
+
+
+@callback
+def async_register_websocket_commands(hass: HomeAssistant) -> None:
+    """Register the integration's WebSocket commands."""
+    websocket_api.async_register_command(hass, websocket_fleet_subscribe)
+
+
+@websocket_api.websocket_command(
+    {
+        vol.Required("type"): WS_TYPE_FLEET_SUBSCRIBE,
+        vol.Required("entry_id"): str,
+    }
+)
+@callback
+def websocket_fleet_subscribe(
+    hass: HomeAssistant, connection: websocket_api.ActiveConnection, msg: dict[str, Any]
+) -> None:
+    """Send every active bus of an entry's routes once, then only the vehicles that changed.
+
+    The first event holds the whole fleet as {"full": {route: {ride: state}}};
+    each refresh that changes anything is followed by {"changed": ..., "removed": ...}
+    with the updated vehicles and the ride ids that stopped reporting. When the
+    entry unloads, {"unloaded": true} is sent and the subscription ends.
+    """
+    from . import BusLineDataCoordinator  # the package imports this module
+
+    coordinator = hass.data.get(DOMAIN, {}).get(msg["entry_id"])
+    if not isinstance(coordinator, BusLineDataCoordinator):
+        connection.send_error(msg["id"], websocket_api.const.ERR_NOT_FOUND, "Bus Line Tracker entry not loaded")
+        return
+
+    # The version of the fleet last sent, as listeners are also called on failed refreshes
+    sent_version = coordinator.fleet_version
+
+    @callback
+    def async_send_changes() -> None:
+        nonlocal sent_version
+        if coordinator.fleet_version == sent_version:
+            return
+        if coordinator.fleet_version != sent_version + 1:
+            # The changes are relative to a fleet this subscriber never got
+            message = {"full": coordinator.fleet}
+        else:
+            message = coordinator.fleet_changes
+        sent_version = coordinator.fleet_version
+        if message:
+            connection.send_message(websocket_api.event_message(msg["id"], message))
+
+    unsub_listener = coordinator.async_add_listener(async_send_changes)
+
+    @callback
+    def async_unsubscribe() -> None:
+        unsub_listener()
+        unsub_unloaded()
+
+    @callback
+    def async_entry_unloaded() -> None:
+        if connection.subscriptions.pop(msg["id"], None) is None:
+            return
+        async_unsubscribe()
+        connection.send_message(websocket_api.event_message(msg["id"], {"unloaded": True}))
+
+    unsub_unloaded = async_dispatcher_connect(hass, SIGNAL_ENTRY_UNLOADED.format(msg["entry_id"]), async_entry_unloaded)
+    connection.subscriptions[msg["id"]] = async_unsubscribe
+    connection.send_result(msg["id"])
+    connection.send_message(websocket_api.event_message(msg["id"], {"full": coordinator.fleet}))
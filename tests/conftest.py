@@ -1,7 +1,11 @@
 """Test fixtures."""
 
+from datetime import datetime, timedelta
+from types import SimpleNamespace
 from unittest.mock import MagicMock, patch
+from zoneinfo import ZoneInfo
 
+import pandas as pd
 import pytest
 from pytest_homeassistant_custom_component.common import (
     MockModule,
@@ -12,6 +16,10 @@ from pytest_homeassistant_custom_component.common import (
 
 from custom_components.bus_line_tracker.config_flow import BusLineTrackerConfigFlow
 from custom_components.bus_line_tracker.const import DOMAIN
+from custom_components.bus_line_tracker.locations import parse_locations
+from custom_components.bus_line_tracker.shape import RouteShape
+
+ROUTES_DF = pd.DataFrame({"id": [101], "line_ref": [7023]})
 
 
 async def async_mock_coro(*args, **kwargs):
@@ -19,6 +27,23 @@ async def async_mock_coro(*args, **kwargs):
     return True
 
 
+def make_vehicle_locations(now=None, line_ref=7023):
+    """Build vehicle locations for two rides, latest fix first within each ride."""
+    now = now or datetime.now(ZoneInfo("Israel"))
+    columns = {
+        "siri_ride__id": [1, 1, 2, 2],
+        "siri_ride__vehicle_ref": ["111", "111", "222", "222"],
+        "lat": [32.0, 32.0, 32.0, 32.0],
+        "lon": [34.8030, 34.8020, 34.8150, 34.8140],
+        "velocity": [30, 28, 25, 20],
+        "bearing": [90, 90, 90, 90],
+        "distance_from_journey_start": [280, 190, 1410, 1320],
+        "recorded_at_time": [now, now - timedelta(minutes=1), now, now - timedelta(minutes=1)],
+    }
+    records = [dict(zip(columns, values, strict=True)) for values in zip(*columns.values(), strict=True)]
+    return parse_locations(records, len(records), line_ref)
+
+
 @pytest.fixture(autouse=True)
 async def auto_enable_custom_integrations(hass):
     """Enable custom integrations for testing."""
@@ -58,3 +83,36 @@ def mock_bus_data():
         "ATTR_DISTANCE_FROM_START": 5.0,
         "ATTR_DISTANCE_FROM_STATION": 0.5,
     }
+
+
+@pytest.fixture
+def route_shape():
+    """Get a route shape running 2 km east along lat 32.0, 60 m north, then back west."""
+    return RouteShape(
+        "2024-03-20",
+        [32.0] * 21 + [32.00054] * 21,
+        [34.8 + i * 0.00106 for i in range(21)] + [34.8 + i * 0.00106 for i in reversed(range(21))],
+    )
+
+
+@pytest.fixture
+def mock_stride():
+    """Patch the coordinator's stride requests to serve ROUTES_DF, make_vehicle_locations() and no route shape.
+
+    Tests change the return_value or side_effect of the mocks as they need.
+    """
+    with (
+        patch(
+            "custom_components.bus_line_tracker.backends.get_routes_for_route_mkt", return_value=ROUTES_DF
+        ) as get_routes,
+        patch(
+            "custom_components.bus_line_tracker.backends.fetch_vehicle_locations",
+            return_value=make_vehicle_locations(),
+        ) as fetch_vehicle_locations,
+        patch("custom_components.bus_line_tracker.build_route_shape", return_value=None) as build_route_shape,
+    ):
+        yield SimpleNamespace(
+            get_routes=get_routes,
+            fetch_vehicle_locations=fetch_vehicle_locations,
+            build_route_shape=build_route_shape,
+        )
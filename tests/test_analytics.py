@@ -0,0 +1,199 @@
+"""Test the Bus Line Tracker punctuality analytics."""
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from functools import partial
+from unittest.mock import patch
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pandas as pd
+import pytest
+from homeassistant.core import HomeAssistant
+from homeassistant.exceptions import ServiceValidationError
+from stride import StrideRequestFailedException
+
+from custom_components.bus_line_tracker import analytics
+from custom_components.bus_line_tracker.analytics import (
+    RIDE_SUMMARY_FIELDS,
+    aggregate,
+    async_analyze_punctuality,
+    describe,
+    summarize_rides,
+)
+from custom_components.bus_line_tracker.const import CONF_LAT, CONF_LON, CONF_ROUTE_MKT, DOMAIN
+from custom_components.bus_line_tracker.locations import parse_locations
+from custom_components.bus_line_tracker.services import SERVICE_ANALYZE_PUNCTUALITY, async_register_services
+
+from .test_config_flow import MockConfigEntry
+
+REF_POINT = (32.0, 34.81)
+
+
+def make_day(service_date, delays=(0, 120), line_ref=7023):
+    """Build a day with one ride per delay, driving east through REF_POINT 10 minutes after its scheduled start."""
+    day = datetime.fromisoformat(service_date).replace(hour=8, tzinfo=ZoneInfo("Israel"))
+    records = []
+    for ride, delay in enumerate(delays):
+        scheduled = day + timedelta(minutes=15 * ride)
+        for fix in range(21):
+            records.append(
+                {
+                    "siri_ride__id": 100 + ride,
+                    "siri_ride__vehicle_ref": f"77{ride}",
+                    "siri_route__line_ref": line_ref,
+                    "lat": 32.0,
+                    "lon": 34.80 + fix * 0.001,
+                    "recorded_at_time": scheduled + timedelta(seconds=delay + 60 * fix),
+                    "siri_ride__scheduled_start_time": scheduled,
+                }
+            )
+    return parse_locations(records[::-1], len(records))
+
+
+def test_summarize_rides():
+    """Test reducing a day of fixes to one row per ride."""
+    summary = summarize_rides(make_day("2024-03-20"), "2024-03-20", REF_POINT)
+
+    assert set(summary) == set(RIDE_SUMMARY_FIELDS)
+    assert summary["ride_id"].tolist() == [100, 101]
+    assert summary["fixes"].tolist() == [21, 21]
+    assert summary["vehicle_ref"].tolist() == ["770", "771"]
+    assert summary["closest_distance"].max() < 1
+    start = datetime(2024, 3, 20, 8, 0, tzinfo=ZoneInfo("Israel")).timestamp()
+    assert summary["arrival"].tolist() == [start + 600, start + 900 + 120 + 600]
+
+    # Without a reference point there are no arrivals
+    assert np.isnan(summarize_rides(make_day("2024-03-20"), "2024-03-20", None)["arrival"]).all()
+    # A ride that never comes near the stop has no arrival
+    assert np.isnan(summarize_rides(make_day("2024-03-20"), "2024-03-20", (32.1, 34.81))["arrival"]).all()
+
+
+def test_aggregate_delay_and_headway():
+    """Test delays against the usual travel time and gaps between buses."""
+    summaries = [
+        summarize_rides(make_day("2024-03-20", delays=(0, 120)), "2024-03-20", REF_POINT),
+        summarize_rides(make_day("2024-03-21", delays=(0, 0, 360)), "2024-03-21", REF_POINT),
+    ]
+    result = aggregate(summaries)
+
+    assert result["service_date"].tolist() == ["2024-03-20"] * 2 + ["2024-03-21"] * 3
+    assert result["delay"].tolist() == [0, 120, 0, 0, 360]
+    assert np.isnan(result["headway"][[0, 2]]).all()
+    assert result["headway"][[1, 3, 4]].tolist() == [900 + 120, 900, 900 + 360]
+
+    stats = describe(result)
+    assert stats["rides"] == stats["arrivals"] == 5
+    assert stats["median_delay"] == 0
+    assert stats["median_headway"] == 1020
+
+    assert describe(aggregate([]))["median_delay"] is None
+
+
+async def test_analyze_punctuality(hass: HomeAssistant, tmp_path):
+    """Test analysing a date range in day chunks, skipping days that fail."""
+    hass.config.config_dir = str(tmp_path)
+
+    def fetch(line_refs, start_time, end_time, session=None):
+        if start_time.day == 21:
+            raise StrideRequestFailedException(500, "boom")
+        return make_day(start_time.date().isoformat())
+
+    with (
+        patch("custom_components.bus_line_tracker.analytics._create_pool", side_effect=ThreadPoolExecutor),
+        patch(
+            "custom_components.bus_line_tracker.analytics.get_routes_for_route_mkt",
+            return_value=pd.DataFrame({"line_ref": [7023]}),
+        ),
+        patch("custom_components.bus_line_tracker.analytics.fetch_vehicle_locations", side_effect=fetch),
+    ):
+        response = await async_analyze_punctuality(
+            hass, "23056", None, None, REF_POINT, date(2024, 3, 20), date(2024, 3, 22)
+        )
+
+    assert response["days"] == 3
+    assert response["failed_days"] == ["2024-03-21"]
+    assert response["rides"] == 4
+
+    with np.load(response["path"]) as results:
+        assert results["service_date"].tolist() == ["2024-03-20"] * 2 + ["2024-03-22"] * 2
+        # Usual travel to the stop is the median of 600 s and 720 s
+        assert results["delay"].tolist() == [-60, 60, -60, 60]
+
+
+def _fixture_routes(route_mkt, date_from, date_to, filter_name, direction):
+    return pd.DataFrame({"line_ref": [7023]})
+
+
+def _fixture_locations(line_refs, start_time, end_time, session=None):
+    return make_day(start_time.date().isoformat())
+
+
+def _serve_fixture_days():
+    # Worker initializer: the patches of the test process don't reach spawned workers
+    analytics.get_routes_for_route_mkt = _fixture_routes
+    analytics.fetch_vehicle_locations = _fixture_locations
+
+
+async def test_analyze_punctuality_worker_processes(hass: HomeAssistant, tmp_path):
+    """Test that days are summarized in the spawned worker processes, whose arguments and results pickle."""
+    hass.config.config_dir = str(tmp_path)
+
+    with patch(
+        "custom_components.bus_line_tracker.analytics.ProcessPoolExecutor",
+        partial(ProcessPoolExecutor, initializer=_serve_fixture_days),
+    ):
+        response = await async_analyze_punctuality(
+            hass, "23056", None, None, REF_POINT, date(2024, 3, 20), date(2024, 3, 21)
+        )
+
+    assert response["days"] == 2
+    assert response["failed_days"] == []
+    assert response["rides"] == 4
+    with np.load(response["path"]) as results:
+        assert results["vehicle_ref"].tolist() == ["770", "771"] * 2
+
+
+async def test_analyze_punctuality_service(hass: HomeAssistant):
+    """Test the service validates its entry and date range."""
+    config_entry = MockConfigEntry(domain=DOMAIN, data={CONF_ROUTE_MKT: "23056", CONF_LAT: 32.0, CONF_LON: 34.81})
+    config_entry.add_to_hass(hass)
+    async_register_services(hass)
+
+    with patch(
+        "custom_components.bus_line_tracker.services.async_analyze_punctuality", return_value={"rides": 0}
+    ) as mock_analyze:
+        response = await hass.services.async_call(
+            DOMAIN,
+            SERVICE_ANALYZE_PUNCTUALITY,
+            {"config_entry_id": config_entry.entry_id, "start_date": "2024-03-01", "end_date": "2024-03-31"},
+            blocking=True,
+            return_response=True,
+        )
+        assert response == {"rides": 0}
+        assert mock_analyze.call_args[0][1:] == (
+            "23056",
+            None,
+            None,
+            (32.0, 34.81),
+            date(2024, 3, 1),
+            date(2024, 3, 31),
+        )
+
+        with pytest.raises(ServiceValidationError):
+            await hass.services.async_call(
+                DOMAIN,
+                SERVICE_ANALYZE_PUNCTUALITY,
+                {"config_entry_id": config_entry.entry_id, "start_date": "2024-03-31", "end_date": "2024-03-01"},
+                blocking=True,
+                return_response=True,
+            )
+
+        with pytest.raises(ServiceValidationError):
+            await hass.services.async_call(
+                DOMAIN,
+                SERVICE_ANALYZE_PUNCTUALITY,
+                {"config_entry_id": "missing", "start_date": "2024-03-01", "end_date": "2024-03-02"},
+                blocking=True,
+                return_response=True,
+            )
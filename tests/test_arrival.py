@@ -0,0 +1,90 @@
+"""Test the Bus Line Tracker arrival estimates."""
+
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from custom_components.bus_line_tracker.arrival import ArrivalDetector, estimate_arrival
+from custom_components.bus_line_tracker.const import ETA_FALLBACK_SPEED
+from custom_components.bus_line_tracker.locations import parse_locations
+
+FIX_TIME = datetime(2024, 3, 20, 8, 0, tzinfo=ZoneInfo("Israel"))
+STATION = (32.0, 34.81)
+METER_LON = 1 / 94300  # degrees of longitude per meter at lat 32
+
+
+def make_poll(*rides):
+    """Build the fixes of one poll from (ride_id, [(minute, meters east of the station), ...]) pairs."""
+    records = [
+        {
+            "siri_ride__id": ride_id,
+            "siri_ride__vehicle_ref": f"v{ride_id}",
+            "siri_route__line_ref": 7023,
+            "lat": STATION[0],
+            "lon": STATION[1] + offset * METER_LON,
+            "recorded_at_time": FIX_TIME + timedelta(minutes=minute),
+        }
+        for ride_id, fixes in rides
+        for minute, offset in fixes
+    ]
+    return parse_locations(records, len(records))
+
+
+def test_estimate_arrival():
+    """Test arrival estimates from distance and speed."""
+    assert estimate_arrival(FIX_TIME, 1000, 36) == FIX_TIME + timedelta(seconds=100)
+
+    # Standing or crawling buses use a typical speed
+    fallback = FIX_TIME + timedelta(seconds=1000 / (ETA_FALLBACK_SPEED / 3.6))
+    assert estimate_arrival(FIX_TIME, 1000, 0) == fallback
+    assert estimate_arrival(FIX_TIME, 1000, None) == fallback
+    assert estimate_arrival(FIX_TIME, 1000, 2) == fallback
+
+    # Passed the station, or nothing to estimate from
+    assert estimate_arrival(FIX_TIME, -50, 36) is None
+    assert estimate_arrival(FIX_TIME, None, 36) is None
+    assert estimate_arrival(None, 1000, 36) is None
+
+
+def test_arrival_detector_records_each_pass_once():
+    """Test that a ride arrives once, at its closest fix, after moving away again."""
+    detector = ArrivalDetector(STATION)
+
+    # Approaching: nothing yet
+    assert detector.update(make_poll((1, [(0, -600), (1, -300)]))) == []
+    # Closest at minute 2, but it hasn't moved away yet; the poll window repeats older fixes
+    assert detector.update(make_poll((1, [(0, -600), (1, -300), (2, -20)]))) == []
+
+    arrivals = detector.update(make_poll((1, [(1, -300), (2, -20), (3, 260)])))
+    assert len(arrivals) == 1
+    assert arrivals[0].ride_id == 1
+    assert arrivals[0].vehicle_ref == "v1"
+    assert arrivals[0].line_ref == 7023
+    assert arrivals[0].time == FIX_TIME + timedelta(minutes=2)
+    assert arrivals[0].distance == pytest.approx(20, abs=1)
+
+    # Later fixes of the same ride never arrive again
+    assert detector.update(make_poll((1, [(3, 260), (4, 40), (5, 600)]))) == []
+    assert len(detector) == 1
+
+    # Not even after a poll that missed the ride reports its fixes again
+    assert detector.update(make_poll()) == []
+    assert detector.update(make_poll((1, [(3, 260), (4, 40), (5, 600)]))) == []
+
+    # Once its fixes are older than the lookback window the ride is forgotten
+    detector.update(make_poll((2, [(40, 5000)])))
+    assert detector._arrived == {}
+
+
+def test_arrival_detector_ride_lifecycle():
+    """Test rides that end near the station, and rides that never come close."""
+    detector = ArrivalDetector(STATION)
+
+    detector.update(make_poll((1, [(0, -300), (1, -50)]), (2, [(0, 2000), (1, 1500)])))
+    assert len(detector) == 2
+
+    # Both rides end: the one that stopped at the station arrived, the far one is just forgotten
+    arrivals = detector.update(make_poll())
+    assert [arrival.ride_id for arrival in arrivals] == [1]
+    assert len(detector) == 0
@@ -0,0 +1,176 @@
+"""Test the Bus Line Tracker location backends."""
+
+import io
+import json
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pytest
+from homeassistant.core import HomeAssistant
+
+from custom_components.bus_line_tracker import BusLineDataCoordinator
+from custom_components.bus_line_tracker.backends import (
+    Backend,
+    FileBackend,
+    SiriVmBackend,
+    StrideBackend,
+    create_backend,
+    parse_siri_vm,
+    siri_ride_id,
+)
+from custom_components.bus_line_tracker.const import (
+    BACKEND_FILE,
+    BACKEND_SIRI_VM,
+    CONF_BACKEND,
+    CONF_BACKEND_SOURCE,
+    CONF_LAT,
+    CONF_LON,
+    CONF_ROUTE_MKT,
+    CONF_UPDATE_INTERVAL,
+    DOMAIN,
+)
+
+from .test_config_flow import MockConfigEntry
+
+
+def make_activity(line_ref, journey_ref, lon, recorded_at, vehicle_ref="111"):
+    """Build one SIRI-VM vehicle activity."""
+    return {
+        "RecordedAtTime": recorded_at.isoformat(),
+        "MonitoredVehicleJourney": {
+            "LineRef": str(line_ref),
+            "FramedVehicleJourneyRef": {"DataFrameRef": "2024-03-20", "DatedVehicleJourneyRef": journey_ref},
+            "OriginAimedDepartureTime": (recorded_at - timedelta(minutes=20)).isoformat(),
+            "VehicleLocation": {"Latitude": "32.0", "Longitude": str(lon)},
+            "Bearing": "90",
+            "Velocity": "30",
+            "VehicleRef": vehicle_ref,
+        },
+    }
+
+
+def make_snapshot(activities):
+    """Build a SIRI-VM snapshot."""
+    return {"Siri": {"ServiceDelivery": {"VehicleMonitoringDelivery": [{"VehicleActivity": activities}]}}}
+
+
+def test_parse_siri_vm():
+    """Test that a snapshot is parsed into typed arrays, keeping the requested lines."""
+    now = datetime.now(ZoneInfo("Israel")).replace(microsecond=0)
+    snapshot = make_snapshot(
+        [
+            make_activity(7023, "1001", 34.8030, now),
+            make_activity(9999, "2001", 35.0, now),
+            make_activity("not a line", "3001", 35.0, now),
+        ]
+    )
+
+    locations = parse_siri_vm(io.BytesIO(json.dumps(snapshot).encode()), {7023})
+
+    assert len(locations) == 1
+    assert locations["siri_route__line_ref"][0] == 7023
+    assert locations["siri_ride__id"][0] == siri_ride_id("2024-03-20", "1001", 7023)
+    assert locations["lon"][0] == np.float64(34.8030)
+    assert locations["recorded_at_time"][0] == now.timestamp()
+    assert locations["siri_ride__vehicle_ref"][0] == "111"
+
+
+def test_file_backend_replays_snapshots(tmp_path):
+    """Test that snapshots are replayed in order and earlier fixes are kept."""
+    now = datetime.now(ZoneInfo("Israel")).replace(microsecond=0)
+    first = [make_activity(7023, "1001", 34.8020, now - timedelta(minutes=1))]
+    # The vehicle that didn't report again is repeated unchanged
+    second = [make_activity(7023, "1001", 34.8030, now), *first, make_activity(7024, "1002", 34.8150, now)]
+    (tmp_path / "001.json").write_text(json.dumps(make_snapshot(first)))
+    (tmp_path / "002.json").write_text(json.dumps(make_snapshot(second)))
+
+    backend = FileBackend(str(tmp_path))
+    start, end = now - timedelta(minutes=30), now
+
+    assert len(backend.fetch_vehicle_locations([7023], start, end)) == 1
+    locations = backend.fetch_vehicle_locations([7023], start, end)
+    assert len(locations) == 2
+    assert sorted(locations["lon"]) == [34.8020, 34.8030]
+    # The last snapshot is repeated once the directory is exhausted
+    assert len(backend.fetch_vehicle_locations([7023], start, end)) == 2
+    # Fixes older than the window are dropped from the history
+    assert len(backend.fetch_vehicle_locations([7023], now - timedelta(seconds=30), end)) == 1
+
+
+def test_file_backend_empty_snapshot(tmp_path):
+    """Test that a snapshot without vehicles, such as overnight, returns no fixes."""
+    (tmp_path / "001.json").write_text(json.dumps(make_snapshot([])))
+    backend = FileBackend(str(tmp_path))
+    now = datetime.now(ZoneInfo("Israel"))
+
+    assert len(backend.fetch_vehicle_locations([7023], now - timedelta(minutes=30), now)) == 0
+    assert len(backend.fetch_vehicle_locations([7023], now - timedelta(minutes=30), now)) == 0
+
+
+def test_file_backend_routes(tmp_path):
+    """Test that routes.json replaces stride's routes, filtered like them."""
+    (tmp_path / "routes.json").write_text(
+        json.dumps(
+            {
+                "23056": [
+                    {"id": 101, "line_ref": 7023, "route_long_name": "Tel Aviv - Holon", "route_direction": "1"},
+                    {"id": 102, "line_ref": 7024, "route_long_name": "Holon - Tel Aviv", "route_direction": "2"},
+                ]
+            }
+        )
+    )
+    backend = FileBackend(str(tmp_path))
+
+    assert list(backend.get_routes("23056", "2024-03-20", None, None)["line_ref"]) == [7023, 7024]
+    assert list(backend.get_routes("23056", "2024-03-20", "Holon - ", None)["line_ref"]) == [7024]
+    assert list(backend.get_routes("23056", "2024-03-20", None, "1")["line_ref"]) == [7023]
+    assert backend.get_routes("11111", "2024-03-20", None, None).empty
+
+
+def test_create_backend():
+    """Test that backends are chosen by their option."""
+    assert type(create_backend("stride")) is StrideBackend
+    assert type(create_backend("unknown")) is StrideBackend
+    assert type(create_backend(BACKEND_SIRI_VM, "https://siri.example/vm.json")) is SiriVmBackend
+    assert create_backend(BACKEND_SIRI_VM, "https://siri.example/vm.json").realtime
+
+    class RoutesOnlyBackend(Backend):
+        def get_routes(self, route_mkt, date_str, filter_name, direction):
+            return None
+
+    # An incomplete backend fails when it is created, not on its first poll
+    with pytest.raises(TypeError):
+        RoutesOnlyBackend()
+
+
+async def test_coordinator_file_backend(hass: HomeAssistant, tmp_path):
+    """Test the coordinator end to end on replayed snapshots."""
+    now = datetime.now(ZoneInfo("Israel")).replace(microsecond=0)
+    (tmp_path / "routes.json").write_text(json.dumps({"23056": [{"id": 101, "line_ref": 7023}]}))
+    (tmp_path / "001.json").write_text(
+        json.dumps(
+            make_snapshot(
+                [
+                    make_activity(7023, "1001", 34.8030, now - timedelta(seconds=10), vehicle_ref="111"),
+                    make_activity(7023, "1002", 34.8150, now - timedelta(seconds=10), vehicle_ref="222"),
+                ]
+            )
+        )
+    )
+    config_entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={CONF_ROUTE_MKT: "23056", CONF_LAT: 32.0, CONF_LON: 34.8040},
+        options={CONF_UPDATE_INTERVAL: 30, CONF_BACKEND: BACKEND_FILE, CONF_BACKEND_SOURCE: str(tmp_path)},
+    )
+    coordinator = BusLineDataCoordinator(hass, config_entry=config_entry, update_interval=timedelta(seconds=30))
+
+    try:
+        with patch("custom_components.bus_line_tracker.build_route_shape", return_value=None):
+            data = (await coordinator._async_update_data())["23056"]
+    finally:
+        await coordinator.async_shutdown()
+
+    assert data["vehicle_ref"] == "111"
+    assert data["distance_from_station"] < 150
@@ -0,0 +1,107 @@
+"""Test the Bus Line Tracker GTFS catalogs."""
+
+from unittest.mock import MagicMock
+
+import pytest
+
+from custom_components.bus_line_tracker.catalog import (
+    Route,
+    RouteCatalog,
+    Stop,
+    StopCatalog,
+    load_cached_catalog,
+)
+from custom_components.bus_line_tracker.geo import haversine_distance
+
+STOPS = [
+    Stop(code="21470", name="Reading Terminal", city="Tel Aviv", lat=32.1019, lon=34.7910),
+    Stop(code="21471", name="Einstein/Levanon", city="Tel Aviv", lat=32.1130, lon=34.8050),
+    Stop(code="25001", name="Dizengoff Center", city="Tel Aviv", lat=32.0753, lon=34.7752),
+    Stop(code="30001", name="Central Station", city="Jerusalem", lat=31.7890, lon=35.2030),
+]
+
+ROUTES = [
+    Route("23056", "56", "תחנה מרכזית-תל אביב יפו<->רדינג-תל אביב יפו", "1", "0", 7023, "דן"),
+    Route("23056", "56", "רדינג-תל אביב יפו<->תחנה מרכזית-תל אביב יפו", "2", "0", 7024, "דן"),
+    Route("23005", "5", "תחנה מרכזית-תל אביב יפו<->מרכז עזריאלי-תל אביב יפו", "1", "0", 6001, "דן"),
+    Route("10480", "480", "תחנה מרכזית-ירושלים<->ארלוזורוב-תל אביב יפו", "1", "0", 9001, "אגד"),
+]
+
+
+def test_stop_catalog_nearest():
+    """Test that nearest returns stops ordered by distance."""
+    catalog = StopCatalog("2024-03-20", STOPS)
+    assert len(catalog) == 4
+
+    nearest = catalog.nearest(32.0760, 34.7760, count=2)
+    assert [stop.code for _, stop in nearest] == ["25001", "21470"]
+    assert nearest[0][0] == pytest.approx(haversine_distance(32.0760, 34.7760, 32.0753, 34.7752))
+
+    # Matches a brute force scan
+    brute = sorted(STOPS, key=lambda stop: haversine_distance(31.8, 35.1, stop.lat, stop.lon))
+    assert [stop.code for _, stop in catalog.nearest(31.8, 35.1, count=4)] == [stop.code for stop in brute]
+
+
+def test_stop_catalog_nearest_max_distance():
+    """Test that stops beyond the radius are not suggested."""
+    catalog = StopCatalog("2024-03-20", STOPS)
+
+    assert [stop.code for _, stop in catalog.nearest(32.0760, 34.7760, max_distance=2000)] == ["25001"]
+    assert catalog.nearest(32.87336, -117.22743, max_distance=2000) == []
+    assert StopCatalog("2024-03-20", []).nearest(32.0, 34.8) == []
+
+
+def test_load_cached_catalog_builds_once_per_day(tmp_path):
+    """Test that the pickled catalog is reused for the same date."""
+    path = str(tmp_path / "stops.pickle")
+    builder = MagicMock(side_effect=lambda date_str: StopCatalog(date_str, STOPS))
+
+    catalog = load_cached_catalog(path, "2024-03-20", builder)
+    assert catalog.get("21470") == STOPS[0]
+    assert builder.call_count == 1
+
+    catalog = load_cached_catalog(path, "2024-03-20", builder)
+    assert len(catalog) == 4
+    assert builder.call_count == 1
+
+    catalog = load_cached_catalog(path, "2024-03-21", builder)
+    assert catalog.date_str == "2024-03-21"
+    assert builder.call_count == 2
+
+
+def test_load_cached_catalog_falls_back_to_stale(tmp_path):
+    """Test that a failed rebuild keeps the previous day's catalog."""
+    path = str(tmp_path / "stops.pickle")
+    load_cached_catalog(path, "2024-03-20", lambda date_str: StopCatalog(date_str, STOPS))
+
+    failing_builder = MagicMock(side_effect=ConnectionError("offline"))
+    catalog = load_cached_catalog(path, "2024-03-21", failing_builder)
+    assert catalog.date_str == "2024-03-20"
+
+    with pytest.raises(ConnectionError):
+        load_cached_catalog(str(tmp_path / "missing.pickle"), "2024-03-21", failing_builder)
+
+
+def test_route_catalog_prefix_search():
+    """Test prefix search over route_mkt, short name and long name words."""
+    catalog = RouteCatalog("2024-03-20", ROUTES)
+    assert len(catalog) == 4
+
+    assert {route.line_ref for route in catalog.search("2305")} == {7023, 7024}
+    assert [route.route_mkt for route in catalog.search("230")] == ["23005", "23056", "23056"]
+    assert [route.line_ref for route in catalog.search("48")] == [9001]
+    assert {route.line_ref for route in catalog.search("רדי")} == {7023, 7024}
+    assert catalog.search("99") == []
+    assert catalog.search("") == []
+    assert len(catalog.search("2", limit=2)) == 2
+
+
+def test_route_catalog_matches():
+    """Test filtering route variants the way the coordinator does."""
+    catalog = RouteCatalog("2024-03-20", ROUTES)
+
+    assert len(catalog.get("23056")) == 2
+    assert catalog.get("99999") == []
+    assert [route.line_ref for route in catalog.matches("23056", direction="2")] == [7024]
+    assert len(catalog.matches("23056", filter_name="רדינג")) == 2
+    assert catalog.matches("23056", filter_name="עזריאלי") == []
@@ -1,5 +1,6 @@
 """Test the Bus Line Tracker config flow."""
 
+from datetime import timedelta
 from unittest.mock import patch
 
 import pytest
@@ -7,16 +8,32 @@ from homeassistant import config_entries, data_entry_flow
 from homeassistant.core import HomeAssistant
 from pytest_homeassistant_custom_component.common import MockConfigEntry
 
+from custom_components.bus_line_tracker import BusLineDataCoordinator
+from custom_components.bus_line_tracker.catalog import Route, RouteCatalog, Stop, StopCatalog
 from custom_components.bus_line_tracker.const import (
+    BACKEND_SIRI_VM,
+    CONF_ADD_ANOTHER,
+    CONF_BACKEND,
+    CONF_BACKEND_SOURCE,
+    CONF_COMPACT,
     CONF_DIRECTION,
+    CONF_EXECUTOR_WORKERS,
     CONF_FILTER_NAME,
+    CONF_INTERPOLATION_INTERVAL,
     CONF_LAT,
     CONF_LON,
+    CONF_PLACES,
     CONF_ROUTE_MKT,
+    CONF_ROUTES,
+    CONF_STOP,
     CONF_UPDATE_INTERVAL,
     CONF_WALKING_TIME,
+    DEFAULT_BACKEND,
+    DEFAULT_EXECUTOR_WORKERS,
+    DEFAULT_INTERPOLATION_INTERVAL,
     DOMAIN,
 )
+from custom_components.bus_line_tracker.route import Place, parse_places
 
 
 async def test_successful_config_flow(hass):
@@ -126,4 +143,214 @@ async def test_options_flow(hass: HomeAssistant) -> None:
         assert config_entry.options == {
             CONF_UPDATE_INTERVAL: 60,
             CONF_WALKING_TIME: 10,
+            CONF_EXECUTOR_WORKERS: DEFAULT_EXECUTOR_WORKERS,
+            CONF_INTERPOLATION_INTERVAL: DEFAULT_INTERPOLATION_INTERVAL,
+            CONF_BACKEND: DEFAULT_BACKEND,
+            CONF_COMPACT: False,
         }
+
+
+async def test_options_flow_keeps_route_walking_time(hass: HomeAssistant) -> None:
+    """Test that saving options without a walking time keeps the one chosen at setup."""
+    config_entry = MockConfigEntry(
+        domain=DOMAIN,
+        entry_id="test_1",
+        data={CONF_ROUTE_MKT: "23056", CONF_WALKING_TIME: 12},
+        options={},
+    )
+
+    with patch(
+        "custom_components.bus_line_tracker.BusLineDataCoordinator._async_update_data",
+        return_value={},
+    ):
+        config_entry.add_to_hass(hass)
+        await hass.config_entries.async_setup(config_entry.entry_id)
+        await hass.async_block_till_done()
+
+        result = await hass.config_entries.options.async_init(config_entry.entry_id)
+        result = await hass.config_entries.options.async_configure(
+            result["flow_id"],
+            user_input={CONF_UPDATE_INTERVAL: 60},
+        )
+        await hass.async_block_till_done()
+
+        assert result["type"] == data_entry_flow.FlowResultType.CREATE_ENTRY
+        assert CONF_WALKING_TIME not in config_entry.options
+
+    coordinator = BusLineDataCoordinator(hass, config_entry=config_entry, update_interval=timedelta(seconds=60))
+    assert coordinator.trackers["23056"].walking_time == timedelta(minutes=12)
+    await coordinator.async_shutdown()
+
+
+async def test_options_flow_backend_source(hass: HomeAssistant) -> None:
+    """Test that the SIRI-VM backend requires a feed URL."""
+    config_entry = MockConfigEntry(domain=DOMAIN, entry_id="test_1", data={}, options={})
+
+    with patch(
+        "custom_components.bus_line_tracker.BusLineDataCoordinator._async_update_data",
+        return_value={},
+    ):
+        config_entry.add_to_hass(hass)
+        await hass.config_entries.async_setup(config_entry.entry_id)
+        await hass.async_block_till_done()
+
+        result = await hass.config_entries.options.async_init(config_entry.entry_id)
+        result = await hass.config_entries.options.async_configure(
+            result["flow_id"],
+            user_input={CONF_BACKEND: BACKEND_SIRI_VM},
+        )
+        assert result["type"] == data_entry_flow.FlowResultType.FORM
+        assert result["errors"] == {CONF_BACKEND_SOURCE: "missing_backend_source"}
+
+        result = await hass.config_entries.options.async_configure(
+            result["flow_id"],
+            user_input={CONF_BACKEND: BACKEND_SIRI_VM, CONF_BACKEND_SOURCE: "https://siri.example/vm.json"},
+        )
+        assert result["type"] == data_entry_flow.FlowResultType.CREATE_ENTRY
+        assert config_entry.options[CONF_BACKEND_SOURCE] == "https://siri.example/vm.json"
+
+
+def test_parse_places():
+    """Test parsing the places option."""
+    assert parse_places(None) == []
+    assert parse_places("Home: 32.07, 34.78\nWork: Azrieli: 32.074, 34.792;") == [
+        Place("Home", 32.07, 34.78),
+        Place("Work: Azrieli", 32.074, 34.792),
+    ]
+    for text in ("Home 32.07, 34.78", ": 32.07, 34.78", "Home: 32.07", "Home: north, 34.78", "A: 32, 34; a: 32, 35"):
+        with pytest.raises(ValueError):
+            parse_places(text)
+
+
+async def test_options_flow_places(hass: HomeAssistant) -> None:
+    """Test that places are validated and kept as entered."""
+    config_entry = MockConfigEntry(domain=DOMAIN, entry_id="test_1", data={}, options={})
+
+    with patch(
+        "custom_components.bus_line_tracker.BusLineDataCoordinator._async_update_data",
+        return_value={},
+    ):
+        config_entry.add_to_hass(hass)
+        await hass.config_entries.async_setup(config_entry.entry_id)
+        await hass.async_block_till_done()
+
+        for places in ("Home: 32.07", "London: 51.5, -0.12"):
+            result = await hass.config_entries.options.async_init(config_entry.entry_id)
+            result = await hass.config_entries.options.async_configure(
+                result["flow_id"], user_input={CONF_PLACES: places}
+            )
+            assert result["type"] == data_entry_flow.FlowResultType.FORM
+            assert result["errors"] == {CONF_PLACES: "invalid_places"}
+
+        result = await hass.config_entries.options.async_configure(
+            result["flow_id"], user_input={CONF_PLACES: "Home: 32.07, 34.78; Work: 32.074, 34.792"}
+        )
+        assert result["type"] == data_entry_flow.FlowResultType.CREATE_ENTRY
+        assert config_entry.options[CONF_PLACES] == "Home: 32.07, 34.78; Work: 32.074, 34.792"
+
+
+async def test_config_flow_nearest_stop(hass: HomeAssistant) -> None:
+    """Test that choosing a suggested stop fills the reference point."""
+    hass.config.latitude = 32.0760
+    hass.config.longitude = 34.7760
+    catalog = StopCatalog(
+        "2024-03-20",
+        [
+            Stop(code="25001", name="Dizengoff Center", city="Tel Aviv", lat=32.0753, lon=34.7752),
+            Stop(code="30001", name="Central Station", city="Jerusalem", lat=31.7890, lon=35.2030),
+        ],
+    )
+
+    with patch(
+        "custom_components.bus_line_tracker.config_flow.async_get_stop_catalog",
+        return_value=catalog,
+    ):
+        result = await hass.config_entries.flow.async_init(DOMAIN, context={"source": config_entries.SOURCE_USER})
+
+        assert result["type"] == data_entry_flow.FlowResultType.FORM
+        assert CONF_STOP in result["data_schema"].schema
+
+        result = await hass.config_entries.flow.async_configure(
+            result["flow_id"],
+            {
+                CONF_ROUTE_MKT: "123",
+                CONF_STOP: "25001",
+                CONF_WALKING_TIME: 5,
+                CONF_UPDATE_INTERVAL: 30,
+            },
+        )
+
+    assert result["type"] == data_entry_flow.FlowResultType.CREATE_ENTRY
+    assert result["data"][CONF_STOP] == "25001"
+    assert result["data"][CONF_LAT] == 32.0753
+    assert result["data"][CONF_LON] == 34.7752
+
+
+async def test_config_flow_route_catalog_validation(hass: HomeAssistant) -> None:
+    """Test that unknown routes are rejected with suggestions from the route catalog."""
+    catalog = RouteCatalog(
+        "2024-03-20",
+        [
+            Route("23056", "56", "תחנה מרכזית-תל אביב יפו<->רדינג-תל אביב יפו", "1", "0", 7023, "דן"),
+            Route("23005", "5", "תחנה מרכזית-תל אביב יפו<->מרכז עזריאלי-תל אביב יפו", "1", "0", 6001, "דן"),
+        ],
+    )
+    user_input = {
+        CONF_ROUTE_MKT: "230",
+        CONF_WALKING_TIME: 5,
+        CONF_UPDATE_INTERVAL: 30,
+    }
+
+    with patch(
+        "custom_components.bus_line_tracker.config_flow.async_get_route_catalog",
+        return_value=catalog,
+    ) as mock_get_route_catalog:
+        result = await hass.config_entries.flow.async_init(DOMAIN, context={"source": config_entries.SOURCE_USER})
+        assert mock_get_route_catalog.call_count == 1
+
+        result = await hass.config_entries.flow.async_configure(result["flow_id"], user_input)
+        assert result["type"] == data_entry_flow.FlowResultType.FORM
+        assert result["errors"] == {CONF_ROUTE_MKT: "unknown_route_mkt"}
+        assert "23056" in result["description_placeholders"]["suggestions"]
+        assert "23005" in result["description_placeholders"]["suggestions"]
+
+        result = await hass.config_entries.flow.async_configure(
+            result["flow_id"], {**user_input, CONF_ROUTE_MKT: "23056", CONF_FILTER_NAME: "עזריאלי"}
+        )
+        assert result["type"] == data_entry_flow.FlowResultType.FORM
+        assert result["errors"] == {CONF_FILTER_NAME: "no_matching_routes"}
+
+        result = await hass.config_entries.flow.async_configure(
+            result["flow_id"], {**user_input, CONF_ROUTE_MKT: "23056", CONF_FILTER_NAME: "רדינג"}
+        )
+        assert result["type"] == data_entry_flow.FlowResultType.CREATE_ENTRY
+        # Submitting never reloads the catalog
+        assert mock_get_route_catalog.call_count == 1
+
+
+async def test_config_flow_multiple_routes(hass: HomeAssistant) -> None:
+    """Test adding several routes to a single entry."""
+    route = {CONF_ROUTE_MKT: "23056", CONF_DIRECTION: "1", CONF_WALKING_TIME: 5, CONF_UPDATE_INTERVAL: 30}
+    result = await hass.config_entries.flow.async_init(DOMAIN, context={"source": config_entries.SOURCE_USER})
+
+    result = await hass.config_entries.flow.async_configure(result["flow_id"], {**route, CONF_ADD_ANOTHER: True})
+    assert result["type"] == data_entry_flow.FlowResultType.FORM
+    assert result["description_placeholders"]["routes"] == "23056"
+
+    # The same route can't be added twice
+    result = await hass.config_entries.flow.async_configure(result["flow_id"], route)
+    assert result["type"] == data_entry_flow.FlowResultType.FORM
+    assert result["errors"] == {"base": "duplicate_route"}
+
+    result = await hass.config_entries.flow.async_configure(
+        result["flow_id"], {**route, CONF_DIRECTION: "2", CONF_UPDATE_INTERVAL: 60}
+    )
+    assert result["type"] == data_entry_flow.FlowResultType.CREATE_ENTRY
+    assert result["title"] == "Bus Lines 23056, 23056"
+    assert result["data"] == {
+        CONF_ROUTES: [
+            {CONF_ROUTE_MKT: "23056", CONF_DIRECTION: "1", CONF_WALKING_TIME: 5},
+            {CONF_ROUTE_MKT: "23056", CONF_DIRECTION: "2", CONF_WALKING_TIME: 5},
+        ],
+    }
+    assert result["options"] == {CONF_UPDATE_INTERVAL: 60}
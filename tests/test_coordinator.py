@@ -4,10 +4,13 @@ from datetime import datetime, timedelta
 from unittest.mock import patch
 from zoneinfo import ZoneInfo
 
+import pandas as pd
 import pytest
+from freezegun import freeze_time
 from homeassistant.core import HomeAssistant
 from homeassistant.exceptions import ConfigEntryNotReady
 from homeassistant.helpers.update_coordinator import UpdateFailed
+from pytest_homeassistant_custom_component.common import async_capture_events, async_fire_time_changed
 
 from custom_components.bus_line_tracker import (
     BusLineDataCoordinator,
@@ -15,11 +18,28 @@ from custom_components.bus_line_tracker import (
     haversine_distance,
 )
 from custom_components.bus_line_tracker.const import (
+    ATTR_BUNCHING,
+    ATTR_ESTIMATED_ARRIVAL,
+    ATTR_HEADWAY,
+    ATTR_LEAVE_AT,
+    ATTR_PLACES,
+    ATTR_TRAIL,
+    CONF_LAT,
+    CONF_LON,
+    CONF_PLACES,
     CONF_ROUTE_MKT,
+    CONF_ROUTES,
+    CONF_STOP,
     CONF_UPDATE_INTERVAL,
+    CONF_WALKING_TIME,
     DOMAIN,
+    EVENT_ARRIVAL,
+    EVENT_LEAVE_NOW,
 )
+from custom_components.bus_line_tracker.locations import VehicleLocations
+from custom_components.bus_line_tracker.trail import encode_polyline
 
+from .conftest import ROUTES_DF, make_vehicle_locations
 from .test_config_flow import MockConfigEntry
 
 
@@ -27,12 +47,12 @@ def test_haversine_distance():
     """Test the haversine distance calculation function."""
     # Test case 1: Same point should return 0
     assert haversine_distance(32.0, 34.0, 32.0, 34.0) == pytest.approx(0, abs=0.1)
-    
+
     # Test case 2: Known distance between two points
     # Tel Aviv (32.0853, 34.7818) to Jerusalem (31.7683, 35.2137) is about 54.4 km
     distance = haversine_distance(32.0853, 34.7818, 31.7683, 35.2137)
     assert distance == pytest.approx(54400, rel=0.05)  # Within 5% of expected value
-    
+
     # Test case 3: Short distance
     # Two points 1km apart
     lat1, lon1 = 32.0853, 34.7818
@@ -110,6 +130,21 @@ async def test_coordinator_setup(hass: HomeAssistant):
     ):
         assert await async_setup_entry(hass, config_entry)
         assert config_entry.entry_id in hass.data[DOMAIN]
+        assert hass.data[DOMAIN][config_entry.entry_id].update_interval == timedelta(seconds=30)
+
+    # The interval chosen at setup applies until the options are saved
+    config_entry3 = MockConfigEntry(
+        domain=DOMAIN,
+        entry_id="test3",
+        data={CONF_ROUTE_MKT: "23056", CONF_UPDATE_INTERVAL: 45},
+    )
+    config_entry3.add_to_hass(hass)
+    with patch(
+        "custom_components.bus_line_tracker.BusLineDataCoordinator._async_update_data",
+        return_value={},
+    ):
+        assert await async_setup_entry(hass, config_entry3)
+        assert hass.data[DOMAIN][config_entry3.entry_id].update_interval == timedelta(seconds=45)
 
     # Test failed setup
     config_entry2 = MockConfigEntry(
@@ -153,3 +188,259 @@ async def test_update_interval_change(hass: HomeAssistant):
     )
 
     assert coordinator.update_interval == timedelta(seconds=60)
+
+
+async def test_coordinator_along_route_distance(hass: HomeAssistant, mock_stride, route_shape):
+    """Test that distance_from_station follows the route shape on a looping route."""
+    config_entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={CONF_ROUTE_MKT: "23056", CONF_LAT: 32.00054, CONF_LON: 34.8021},
+        options={CONF_UPDATE_INTERVAL: 30},
+    )
+    coordinator = BusLineDataCoordinator(hass, config_entry=config_entry, update_interval=timedelta(seconds=30))
+
+    mock_stride.build_route_shape.return_value = route_shape
+
+    data = (await coordinator._async_update_data())["23056"]
+    await coordinator._async_update_data()
+
+    assert data["vehicle_ref"] == "111"
+    # The tracked ride's two fixes, oldest first
+    assert data[ATTR_TRAIL] == encode_polyline([32.0, 32.0], [34.8020, 34.8030])
+    # Ride 2 is 1130 m ahead, 136 s at ride 1's 30 km/h
+    assert data[ATTR_HEADWAY] == 2.3
+    assert data[ATTR_BUNCHING] is False
+    assert haversine_distance(32.0, 34.8030, 32.00054, 34.8021) < 150
+    # Along the route the bus still has to reach the turn and come back
+    assert data["distance_from_station"] == pytest.approx(2 * 2000 - 280 - 200 + 60, rel=0.02)
+    # The shape is only loaded once per day
+    assert mock_stride.build_route_shape.call_count == 1
+
+    await coordinator.async_shutdown()
+
+
+async def test_coordinator_places(hass: HomeAssistant, mock_stride, route_shape):
+    """Test the distance and arrival at each place, along the shape where it can be matched."""
+    config_entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={CONF_ROUTE_MKT: "23056", CONF_LAT: 32.00054, CONF_LON: 34.8021},
+        options={CONF_UPDATE_INTERVAL: 30, CONF_PLACES: "Market: 32.0, 34.8130; Beach: 32.0, 34.7"},
+    )
+    coordinator = BusLineDataCoordinator(hass, config_entry=config_entry, update_interval=timedelta(seconds=30))
+    now = datetime.now(ZoneInfo("Israel")).replace(microsecond=0)
+    mock_stride.fetch_vehicle_locations.return_value = make_vehicle_locations(now)
+    mock_stride.build_route_shape.return_value = route_shape
+
+    try:
+        data = (await coordinator._async_update_data())["23056"]
+    finally:
+        await coordinator.async_shutdown()
+
+    places = data[ATTR_PLACES]
+    assert list(places) == ["Market", "Beach"]
+    # The station is still reported as before
+    assert data["distance_from_station"] == pytest.approx(2 * 2000 - 280 - 200 + 60, rel=0.02)
+    # The market is ahead on the outbound leg
+    assert places["Market"]["distance"] == pytest.approx(945, rel=0.02)
+    travel = places["Market"][ATTR_ESTIMATED_ARRIVAL] - now
+    assert travel.total_seconds() == pytest.approx(places["Market"]["distance"] / (30 / 3.6))
+    # The beach is off the route, so it falls back to the straight-line distance
+    assert places["Beach"]["distance"] == pytest.approx(haversine_distance(32.0, 34.8030, 32.0, 34.7))
+
+
+async def test_coordinator_leave_at(hass: HomeAssistant, mock_stride):
+    """Test the leave_at estimate and the single leave-now callback."""
+    config_entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={CONF_ROUTE_MKT: "23056", CONF_LAT: 32.0, CONF_LON: 34.8165},
+        options={CONF_UPDATE_INTERVAL: 30, CONF_WALKING_TIME: 2},
+    )
+    coordinator = BusLineDataCoordinator(hass, config_entry=config_entry, update_interval=timedelta(seconds=30))
+    now = datetime.now(ZoneInfo("Israel")).replace(microsecond=0)
+    events = async_capture_events(hass, EVENT_LEAVE_NOW)
+    mock_stride.fetch_vehicle_locations.return_value = make_vehicle_locations(now)
+
+    data = (await coordinator._async_update_data())["23056"]
+
+    # Ride 1 is about 1270 m from the station, at 30 km/h
+    travel = data[ATTR_ESTIMATED_ARRIVAL] - now
+    assert travel.total_seconds() == pytest.approx(data["distance_from_station"] / (30 / 3.6))
+    assert data[ATTR_LEAVE_AT] == data[ATTR_ESTIMATED_ARRIVAL] - timedelta(minutes=2)
+    assert coordinator._unsub_leave is not None
+
+    # Rescheduling replaces the pending callback rather than adding another
+    leave_at = datetime.now(ZoneInfo("Israel")) + timedelta(seconds=5)
+    coordinator.trackers["23056"].leave_at = leave_at
+    coordinator._async_schedule_leave()
+    async_fire_time_changed(hass, leave_at + timedelta(seconds=1))
+    await hass.async_block_till_done()
+
+    assert len(events) == 1
+    assert events[0].data["entry_id"] == config_entry.entry_id
+    assert events[0].data[ATTR_LEAVE_AT] == leave_at
+    assert coordinator._unsub_leave is None
+
+    # Without a bus there is nothing to leave for
+    coordinator.trackers["23056"].leave_at = leave_at + timedelta(minutes=1)
+    coordinator._async_schedule_leave()
+    assert coordinator._unsub_leave is not None
+    coordinator.trackers["23056"].leave_at = None
+    coordinator._async_schedule_leave()
+    assert coordinator._unsub_leave is None
+
+    await coordinator.async_shutdown()
+
+
+async def test_coordinator_fires_arrivals(hass: HomeAssistant, mock_stride):
+    """Test that rides passing the station fire one arrival event each."""
+    config_entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={CONF_ROUTE_MKT: "23056", CONF_LAT: 32.0, CONF_LON: 34.8020},
+        options={CONF_UPDATE_INTERVAL: 30},
+    )
+    coordinator = BusLineDataCoordinator(hass, config_entry=config_entry, update_interval=timedelta(seconds=30))
+    events = async_capture_events(hass, EVENT_ARRIVAL)
+    now = datetime.now(ZoneInfo("Israel")).replace(microsecond=0)
+
+    mock_fetch = mock_stride.fetch_vehicle_locations
+
+    # Ride 1 is at the station and then moves on; ride 2 stays far away
+    mock_fetch.return_value = make_vehicle_locations(now)
+    await coordinator._async_update_data()
+    # A failed poll doesn't end the rides
+    mock_fetch.side_effect = KeyError("siri_ride__id")
+    await coordinator._async_update_data()
+    assert len(coordinator.trackers["23056"].arrival_detector) == 2
+    mock_fetch.side_effect = None
+    # The next poll repeats the same fixes, which must not fire again
+    await coordinator._async_update_data()
+    await hass.async_block_till_done()
+    await coordinator.async_shutdown()
+
+    assert len(events) == 1
+    assert events[0].data["ride_id"] == 1
+    assert events[0].data["vehicle_ref"] == "111"
+    assert events[0].data["time"] == now - timedelta(minutes=1)
+    assert coordinator.trackers["23056"].last_arrival.ride_id == 1
+
+
+async def test_coordinator_skips_empty_line_refs(hass: HomeAssistant, mock_stride):
+    """Test that line_refs without vehicles are left out of the next polls."""
+    config_entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={CONF_ROUTE_MKT: "23056"},
+        options={CONF_UPDATE_INTERVAL: 30},
+    )
+    coordinator = BusLineDataCoordinator(hass, config_entry=config_entry, update_interval=timedelta(seconds=30))
+    mock_stride.get_routes.return_value = pd.DataFrame({"id": [101, 102], "line_ref": [7023, 7024]})
+    mock_fetch = mock_stride.fetch_vehicle_locations
+
+    with patch("custom_components.bus_line_tracker.time.monotonic", return_value=1000.0):
+        await coordinator._async_update_data()
+        assert mock_fetch.call_args[0][0] == [7023, 7024]
+
+        # 7024 returned nothing and is skipped until its TTL runs out
+        await coordinator._async_update_data()
+        assert mock_fetch.call_args[0][0] == [7023]
+
+        # A failed request backs nothing off
+        mock_fetch.side_effect = KeyError("siri_ride__id")
+        assert await coordinator._async_update_data() == {"23056": {}}
+        assert await coordinator._async_update_data() == {"23056": {}}
+        assert mock_fetch.call_args[0][0] == [7023]
+        assert mock_fetch.call_count == 4
+
+        # With every line_ref known to be empty no request is made at all
+        mock_fetch.side_effect = None
+        mock_fetch.return_value = VehicleLocations.empty()
+        assert await coordinator._async_update_data() == {"23056": {}}
+        assert await coordinator._async_update_data() == {"23056": {}}
+        assert mock_fetch.call_count == 5
+
+    await coordinator.async_shutdown()
+
+
+async def test_coordinator_prefetches_next_day_routes(hass: HomeAssistant):
+    """Test that tomorrow's routes are prefetched before midnight and swapped in at rollover."""
+    config_entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={CONF_ROUTE_MKT: "23056"},
+        options={CONF_UPDATE_INTERVAL: 30},
+    )
+    coordinator = BusLineDataCoordinator(hass, config_entry=config_entry, update_interval=timedelta(seconds=30))
+    coordinator._prefetch_offset = timedelta(minutes=5)
+
+    with patch("custom_components.bus_line_tracker.async_call_later") as mock_call_later:
+        with freeze_time("2024-03-20 12:00:00"):  # 14:00 Israel time
+            coordinator.async_schedule_prefetch()
+        assert mock_call_later.call_args[0][1] == timedelta(hours=9, minutes=35)
+
+        with freeze_time("2024-03-20 21:50:00"):  # 23:50 Israel time, past today's window
+            coordinator.async_schedule_prefetch()
+        assert mock_call_later.call_args[0][1] == timedelta(hours=23, minutes=45)
+
+        with (
+            patch(
+                "custom_components.bus_line_tracker.backends.get_routes_for_route_mkt",
+                return_value=ROUTES_DF,
+            ) as mock_get_routes,
+            freeze_time("2024-03-20 21:35:00"),
+        ):
+            await coordinator._async_prefetch_next_day()
+            assert mock_get_routes.call_args[0][1] == "2024-03-21"
+            # The prefetch reschedules itself for the next night
+            assert mock_call_later.call_count == 3
+
+            # Today's routes are fetched once and then served from memory
+            await coordinator._async_get_routes("2024-03-20")
+            await coordinator._async_get_routes("2024-03-20")
+            assert mock_get_routes.call_count == 2
+
+            # After midnight the prefetched routes are used without a request
+            routes = await coordinator._async_get_routes("2024-03-21")
+            assert routes[("23056", None, None)] is ROUTES_DF
+            assert mock_get_routes.call_count == 2
+            assert coordinator._next_routes is None
+
+    await coordinator.async_shutdown()
+
+
+async def test_coordinator_multiple_routes(hass: HomeAssistant, mock_stride):
+    """Test that one coordinator refreshes all routes of an entry with shared requests."""
+    config_entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={
+            CONF_ROUTES: [
+                {CONF_ROUTE_MKT: "23056", CONF_STOP: "25001", CONF_LAT: 32.0, CONF_LON: 34.8165},
+                {CONF_ROUTE_MKT: "23056", CONF_STOP: "25002", CONF_LAT: 32.0, CONF_LON: 34.8300},
+                {CONF_ROUTE_MKT: "23005"},
+            ]
+        },
+        options={CONF_UPDATE_INTERVAL: 30, CONF_WALKING_TIME: 1},
+    )
+    coordinator = BusLineDataCoordinator(hass, config_entry=config_entry, update_interval=timedelta(seconds=30))
+    now = datetime.now(ZoneInfo("Israel")).replace(microsecond=0)
+    routes = {"23056": ROUTES_DF, "23005": pd.DataFrame({"id": [102], "line_ref": [7024]})}
+    locations = VehicleLocations.concat([make_vehicle_locations(now), make_vehicle_locations(now, line_ref=7024)])
+
+    mock_stride.get_routes.side_effect = lambda route_mkt, *args: routes[route_mkt]
+    mock_stride.fetch_vehicle_locations.return_value = locations
+
+    data = await coordinator._async_update_data()
+
+    # The two stops of 23056 share its route metadata and shape, and all line_refs go in one request
+    assert mock_stride.get_routes.call_count == 2
+    assert mock_stride.build_route_shape.call_count == 1
+    assert mock_stride.fetch_vehicle_locations.call_count == 1
+    assert mock_stride.fetch_vehicle_locations.call_args[0][0] == [7023, 7024]
+
+    assert set(data) == {"23056_25001", "23056_25002", "23005"}
+    assert data["23056_25001"]["vehicle_ref"] == "111"
+    assert data["23056_25002"]["distance_from_station"] > data["23056_25001"]["distance_from_station"]
+    assert data["23005"]["vehicle_ref"] == "111"
+    assert data["23005"]["distance_from_station"] is None
+    # Only routes with a reference point have a time to leave, and a single callback covers them
+    assert data["23005"][ATTR_LEAVE_AT] is None
+    assert coordinator._leave_at == min(data["23056_25001"][ATTR_LEAVE_AT], data["23056_25002"][ATTR_LEAVE_AT])
+
+    await coordinator.async_shutdown()
@@ -0,0 +1,86 @@
+"""Test the Bus Line Tracker worker pool."""
+
+import asyncio
+import threading
+from datetime import timedelta
+
+from homeassistant.core import HomeAssistant
+
+from custom_components.bus_line_tracker import BusLineDataCoordinator
+from custom_components.bus_line_tracker.const import (
+    CONF_EXECUTOR_WORKERS,
+    CONF_ROUTE_MKT,
+    DOMAIN,
+)
+from custom_components.bus_line_tracker.executor import BoundedExecutor
+
+from .test_config_flow import MockConfigEntry
+
+# More than the workers of Home Assistant's shared executor
+SATURATING_JOBS = 100
+
+
+async def test_executor_runs_jobs(hass: HomeAssistant):
+    """Test that jobs run on the integration's own threads."""
+    executor = BoundedExecutor(hass, 2, name="bus_line_tracker_test")
+
+    thread_name = await executor.async_add_executor_job(lambda: threading.current_thread().name)
+    assert thread_name.startswith("bus_line_tracker_test")
+    assert await executor.async_add_executor_job(sum, [1, 2, 3]) == 6
+    assert executor.queue_depth == 0
+
+    await executor.async_shutdown()
+
+
+async def test_executor_reports_queue_depth(hass: HomeAssistant):
+    """Test that listeners hear about the queue depth as jobs queue and start."""
+    executor = BoundedExecutor(hass, 1, name="bus_line_tracker_test")
+    depths = []
+    unsub = executor.async_add_listener(lambda: depths.append(executor.queue_depth))
+
+    release = threading.Event()
+    jobs = [asyncio.ensure_future(executor.async_add_executor_job(release.wait, 5)) for _ in range(3)]
+    await asyncio.sleep(0.1)
+    assert depths[-1] == 2
+
+    release.set()
+    await asyncio.gather(*jobs)
+    await asyncio.sleep(0.1)
+    assert depths[-1] == 0
+
+    unsub()
+    count = len(depths)
+    await executor.async_add_executor_job(sum, [1])
+    await asyncio.sleep(0.1)
+    assert len(depths) == count
+
+    await executor.async_shutdown()
+
+
+async def test_executor_load_does_not_delay_other_jobs(hass: HomeAssistant):
+    """Test that a saturated integration pool leaves Home Assistant's executor free."""
+    config_entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={CONF_ROUTE_MKT: "23056"},
+        options={CONF_EXECUTOR_WORKERS: 2},
+    )
+    coordinator = BusLineDataCoordinator(hass, config_entry=config_entry, update_interval=timedelta(seconds=30))
+    executor = coordinator.executor
+    assert executor.max_workers == 2
+
+    # Simulate more slow stride requests than Home Assistant's executor has
+    # workers, which on a shared executor would block every one of them
+    release = threading.Event()
+    jobs = [asyncio.ensure_future(executor.async_add_executor_job(release.wait, 5)) for _ in range(SATURATING_JOBS)]
+    await asyncio.sleep(0.1)
+    assert executor.queue_depth == SATURATING_JOBS - 2
+
+    # Another integration's job is not queued behind ours
+    try:
+        assert await asyncio.wait_for(hass.async_add_executor_job(lambda: "other"), 1) == "other"
+    finally:
+        release.set()
+    assert await asyncio.gather(*jobs) == [True] * SATURATING_JOBS
+    assert executor.queue_depth == 0
+
+    await coordinator.async_shutdown()
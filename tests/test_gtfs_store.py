@@ -0,0 +1,120 @@
+"""Test the Bus Line Tracker GTFS static store."""
+
+import zipfile
+from datetime import timedelta
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+from homeassistant.core import HomeAssistant
+from homeassistant.exceptions import ServiceValidationError
+
+from custom_components.bus_line_tracker import BusLineDataCoordinator
+from custom_components.bus_line_tracker.catalog import async_get_stop_catalog
+from custom_components.bus_line_tracker.const import CONF_ROUTE_MKT, DATA_GTFS_STORE, DOMAIN
+from custom_components.bus_line_tracker.gtfs_store import GtfsStore, async_build_gtfs_store, build_gtfs_store
+from custom_components.bus_line_tracker.services import ATTR_PATH, _async_build_gtfs_store
+
+from .test_config_flow import MockConfigEntry
+
+FEED = {
+    "stops.txt": (
+        "stop_id,stop_code,stop_name,stop_desc,stop_lat,stop_lon,location_type\n"
+        "1,25001,דיזנגוף סנטר,,32.0753,34.7752,0\n"
+        "2,21501,Central Station,,31.7890,35.2030,0\n"
+        "3,,Central Station (station),,31.7891,35.2031,1\n"
+    ),
+    "trips.txt": (
+        "route_id,service_id,trip_id,direction_id,shape_id\n"
+        "7023,1,t1,0,s1\n"
+        "7023,1,t2,0,s2\n"
+        "7023,1,t3,0,s2\n"
+        "7024,1,t4,1,\n"
+    ),
+    "shapes.txt": (
+        "shape_id,shape_pt_lat,shape_pt_lon,shape_pt_sequence\n"
+        "s2,32.001,34.81,2\n"
+        "s1,32.0,34.80,1\n"
+        "s2,32.000,34.80,1\n"
+        "s1,32.0,34.81,2\n"
+        "s2,32.002,34.82,3\n"
+    ),
+}
+
+
+@pytest.fixture
+def feed_path(tmp_path):
+    """Write a tiny GTFS feed."""
+    path = tmp_path / "gtfs.zip"
+    with zipfile.ZipFile(path, "w") as feed:
+        for name, content in FEED.items():
+            feed.writestr(name, content.encode("utf-8-sig"))
+    return str(path)
+
+
+def test_build_and_open(feed_path, tmp_path):
+    """Test converting a feed and reading it back through memory maps."""
+    directory = str(tmp_path / "store")
+    meta = build_gtfs_store(feed_path, directory)
+    assert meta["stops"] == 2
+    assert meta["routes"] == 2
+    assert meta["trips"] == 4
+    assert meta["shapes"] == 2
+
+    store = GtfsStore.open(directory)
+    assert isinstance(store._arrays["shape_lat"], np.memmap)
+    assert len(store) == 2
+    assert list(store.stops()) == [
+        ("21501", "Central Station", 31.789, 35.203),
+        ("25001", "דיזנגוף סנטר", 32.0753, 34.7752),
+    ]
+    assert store.stop("25001") == ("דיזנגוף סנטר", 32.0753, 34.7752)
+    assert store.stop("99999") is None
+    assert store.stop("123456789") is None
+
+    # Most trips of route 7023 run on s2, in sequence order
+    lats, lons = store.shape_points(7023)
+    assert lats.tolist() == [32.0, 32.001, 32.002]
+    assert lons.tolist() == [34.80, 34.81, 34.82]
+    shape = store.route_shape(7023, "2024-03-20")
+    assert shape.length == pytest.approx(1890, rel=0.01)
+    assert store.route_shape(7024, "2024-03-20") is None
+    assert store.route_shape(1, "2024-03-20") is None
+
+    assert store.trip_route("t4") == "7024"
+    assert store.trip_route("t5") is None
+
+    # Rebuilding replaces the store; a missing store opens as None
+    build_gtfs_store(feed_path, directory)
+    assert GtfsStore.open(directory).meta["built_at"] >= meta["built_at"]
+    assert GtfsStore.open(str(tmp_path / "missing")) is None
+
+
+async def test_store_hooks(hass: HomeAssistant, feed_path, tmp_path):
+    """Test that stop suggestions and route shapes come from the store once it is built."""
+    with patch("custom_components.bus_line_tracker.gtfs_store.gtfs_store_path", return_value=str(tmp_path / "gtfs")):
+        meta = await async_build_gtfs_store(hass, feed_path)
+    assert meta["stops"] == 2
+    assert isinstance(hass.data[DOMAIN][DATA_GTFS_STORE], GtfsStore)
+
+    catalog = await async_get_stop_catalog(hass)
+    assert catalog.get("25001").name == "דיזנגוף סנטר"
+    assert catalog.nearest(32.0760, 34.7760, count=1)[0][1].code == "25001"
+
+    config_entry = MockConfigEntry(domain=DOMAIN, data={CONF_ROUTE_MKT: "23056"})
+    coordinator = BusLineDataCoordinator(hass, config_entry=config_entry, update_interval=timedelta(seconds=30))
+    try:
+        with patch("custom_components.bus_line_tracker.build_route_shape") as mock_build_shape:
+            shape = await coordinator._async_get_shape("2024-03-20", 101, 7023)
+            assert shape.lats.tolist() == [32.0, 32.001, 32.002]
+            # Routes missing from the store still come from stride
+            await coordinator._async_get_shape("2024-03-20", 1, 1)
+        mock_build_shape.assert_called_once_with(1, "2024-03-20")
+    finally:
+        await coordinator.async_shutdown()
+
+
+async def test_build_service_paths(hass: HomeAssistant, feed_path):
+    """Test that the service only reads feeds from the configuration or allowed directories."""
+    with pytest.raises(ServiceValidationError):
+        await _async_build_gtfs_store(hass, MagicMock(data={ATTR_PATH: feed_path}))
@@ -0,0 +1,124 @@
+"""Test the Bus Line Tracker headway and bunching computation."""
+
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from custom_components.bus_line_tracker.binary_sensor import BusBunchingBinarySensor
+from custom_components.bus_line_tracker.const import (
+    ATTR_BUNCHED_VEHICLES,
+    ATTR_BUNCHING,
+    ATTR_HEADWAY,
+    ATTR_HEADWAY_GAPS,
+    CONF_ROUTE_MKT,
+    DOMAIN,
+)
+from custom_components.bus_line_tracker.headway import compute_gaps, summarize_gaps
+from custom_components.bus_line_tracker.locations import parse_locations
+from custom_components.bus_line_tracker.sensor import BusHeadwaySensor
+
+from .test_config_flow import MockConfigEntry
+
+NOW = datetime(2024, 3, 20, 8, 0, tzinfo=ZoneInfo("Israel"))
+
+
+def make_locations(fixes):
+    """Build vehicle locations from (ride_id, line_ref, seconds ago, distance, velocity) tuples."""
+    records = [
+        {
+            "siri_ride__id": ride_id,
+            "siri_ride__vehicle_ref": f"v{ride_id}",
+            "siri_route__line_ref": line_ref,
+            "recorded_at_time": NOW - timedelta(seconds=ago),
+            "distance_from_journey_start": distance,
+            "velocity": velocity,
+        }
+        for ride_id, line_ref, ago, distance, velocity in fixes
+    ]
+    return parse_locations(records, len(records))
+
+
+def test_compute_gaps_from_the_leaders_fixes():
+    """Test that the time gap is when the bus ahead passed the follower's position."""
+    locations = make_locations(
+        [
+            # Ride 1 passed 1000 m five minutes ago and is now at 2500 m
+            (1, 7023, 600, 0, 20),
+            (1, 7023, 300, 1000, 20),
+            (1, 7023, 0, 2500, 20),
+            # Ride 2 is at 1000 m now
+            (2, 7023, 0, 1000, 20),
+            # Ride 3 runs the other direction and is never compared with them
+            (3, 7024, 0, 1500, 20),
+        ]
+    )
+
+    gaps = compute_gaps(locations)
+
+    assert gaps == [{"vehicle_ref": "v2", "ahead_vehicle_ref": "v1", "distance": 1500.0, "time": 300.0}]
+
+
+def test_compute_gaps_falls_back_to_speed():
+    """Test that without the leader's history the gap is travelled at the follower's speed."""
+    locations = make_locations(
+        [
+            (1, 7023, 0, 2000, 30),
+            (2, 7023, 0, 1700, 36),  # 300 m at 10 m/s
+            (3, 7023, 0, 1600, 0),  # stopped, no time estimate
+            (4, 7023, 0, None, 30),  # no distance, left out
+        ]
+    )
+
+    gaps = compute_gaps(locations)
+
+    assert [gap["vehicle_ref"] for gap in gaps] == ["v2", "v3"]
+    assert gaps[0]["time"] == pytest.approx(30)
+    assert gaps[1]["time"] is None
+    assert compute_gaps(make_locations([(1, 7023, 0, 2000, 30)])) == []
+
+
+def test_summarize_gaps():
+    """Test the headway and bunching summary."""
+    gaps = [
+        {"vehicle_ref": "v2", "ahead_vehicle_ref": "v1", "distance": 300.0, "time": 60.0},
+        {"vehicle_ref": "v3", "ahead_vehicle_ref": "v2", "distance": 3000.0, "time": 600.0},
+        {"vehicle_ref": "v4", "ahead_vehicle_ref": "v3", "distance": 2000.0, "time": None},
+    ]
+
+    summary = summarize_gaps(gaps, bunching_headway=120)
+
+    assert summary[ATTR_HEADWAY] == 5.5
+    assert summary[ATTR_BUNCHING] is True
+    assert summary[ATTR_BUNCHED_VEHICLES] == ["v1", "v2"]
+    assert summarize_gaps([], 120) == {
+        ATTR_HEADWAY: None,
+        ATTR_HEADWAY_GAPS: [],
+        ATTR_BUNCHING: False,
+        ATTR_BUNCHED_VEHICLES: [],
+    }
+
+
+def test_headway_entities():
+    """Test the headway sensor and the bunching binary sensor."""
+    coordinator = MagicMock()
+    coordinator.data = {
+        "23056": summarize_gaps(
+            [{"vehicle_ref": "v2", "ahead_vehicle_ref": "v1", "distance": 300.0, "time": 60.0}], 120
+        )
+    }
+    config_entry = MockConfigEntry(domain=DOMAIN, data={CONF_ROUTE_MKT: "23056"})
+
+    headway = BusHeadwaySensor(coordinator, config_entry)
+    assert headway.state == 1.0
+    assert headway.extra_state_attributes["gaps"][0]["distance"] == 300.0
+
+    bunching = BusBunchingBinarySensor(coordinator, config_entry)
+    assert bunching.is_on is True
+    assert bunching.extra_state_attributes == {"vehicles": ["v1", "v2"]}
+    assert bunching.unique_id == f"{config_entry.entry_id}_binary_sensor.bus_bunching"
+
+    coordinator.data = {}
+    assert headway.state is None
+    assert bunching.is_on is None
@@ -0,0 +1,180 @@
+"""Test the stride HTTP response cache."""
+
+import io
+import json
+import os
+from datetime import datetime
+from unittest.mock import patch
+from urllib.parse import urlsplit
+from zoneinfo import ZoneInfo
+
+import json_stream
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+import custom_components.bus_line_tracker  # noqa: F401 - installs the stride session
+from custom_components.bus_line_tracker.catalog import build_route_catalog, build_stop_catalog
+from custom_components.bus_line_tracker.http_cache import DiskCache, create_session, is_immutable
+from custom_components.bus_line_tracker.shape import build_route_shape
+
+STRIDE_URL = "https://open-bus-stride-api.hasadna.org.il/siri_vehicle_locations/list"
+NOW = datetime(2024, 3, 20, 12, 0, tzinfo=ZoneInfo("Israel"))
+LIVE_URL = f"{STRIDE_URL}?recorded_at_time_to=2099-03-20T10:00:00.000000%2B0000"
+PAST_URL = f"{STRIDE_URL}?recorded_at_time_to=2024-03-18T10:00:00.000000%2B0000"
+
+
+def make_response(request, status_code=200, body=b"", headers=None):
+    """Build a response as the network would return it."""
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers = CaseInsensitiveDict(headers or {})
+    response.raw = io.BytesIO(body)
+    response.url = request.url
+    response.request = request
+    return response
+
+
+def test_is_immutable():
+    """Test that only pages of periods that ended over a day ago are final."""
+    assert is_immutable(f"{STRIDE_URL}?recorded_at_time_to=2024-03-18T10:00:00.000000%2B0000", NOW)
+    assert not is_immutable(f"{STRIDE_URL}?recorded_at_time_to=2024-03-20T09:00:00.000000%2B0000", NOW)
+    # A date covers its whole day, which ends at midnight Israel time
+    assert is_immutable(f"{STRIDE_URL}?date_from=2024-03-18&date_to=2024-03-18", NOW)
+    assert not is_immutable(f"{STRIDE_URL}?date_from=2024-03-19&date_to=2024-03-19", NOW)
+    assert not is_immutable(STRIDE_URL, NOW)
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    """Test that the disk cache stays within its size, dropping the least recently used bodies."""
+    cache = DiskCache(str(tmp_path), max_size=25)
+    cache.put("a", b"a" * 10)
+    # The directory is only scanned again once the cache goes over its size
+    with patch("custom_components.bus_line_tracker.http_cache.os.scandir", wraps=os.scandir) as mock_scandir:
+        cache.put("b", b"b" * 5)
+        cache.put("b", b"b" * 10)
+    assert mock_scandir.call_count == 0
+    os.utime(cache._path("a"), (1000, 1000))
+    os.utime(cache._path("b"), (2000, 2000))
+
+    # Reading "a" makes "b" the least recently used
+    assert cache.get("a") == b"a" * 10
+    cache.put("c", b"c" * 10)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == b"a" * 10
+    assert cache.get("c") == b"c" * 10
+
+
+def test_revalidates_with_etag():
+    """Test that a page with an ETag is revalidated and a 304 is served from memory."""
+    session = create_session()
+    sent = []
+
+    def send(adapter, request, **kwargs):
+        sent.append(dict(request.headers))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return make_response(request, 304, headers={"ETag": '"v1"'})
+        return make_response(request, body=b'[{"id": 1}]', headers={"ETag": '"v1"', "Content-Type": "application/json"})
+
+    with patch.object(HTTPAdapter, "send", new=send):
+        assert session.get(LIVE_URL).json() == [{"id": 1}]
+        with session.get(LIVE_URL, stream=True) as response:
+            assert response.status_code == 200
+            assert response.headers["Content-Type"] == "application/json"
+            assert response.raw.read() == b'[{"id": 1}]'
+
+    assert "If-None-Match" not in sent[0]
+    assert sent[1]["If-None-Match"] == '"v1"'
+    assert "gzip" in sent[0]["Accept-Encoding"]
+
+
+def test_past_pages_come_from_disk(tmp_path):
+    """Test that pages of past periods are downloaded once, and live pages without validators stream through."""
+    session = create_session(DiskCache(str(tmp_path)))
+    sent = []
+
+    def send(adapter, request, **kwargs):
+        sent.append(request.url)
+        return make_response(request, body=b"[]", headers={"Content-Encoding": "gzip"})
+
+    with patch.object(HTTPAdapter, "send", new=send):
+        assert session.get(PAST_URL).json() == []
+        response = session.get(PAST_URL)
+        assert response.json() == []
+        # The cached body is stored decoded
+        assert "Content-Encoding" not in response.headers
+
+        session.get(LIVE_URL)
+        assert session.get(LIVE_URL).headers["Content-Encoding"] == "gzip"
+
+    assert sent == [PAST_URL, LIVE_URL, LIVE_URL]
+
+
+def test_streamed_pages_are_cached_as_read(tmp_path):
+    """Test that streamed bodies are copied into the caches as the caller reads them, not buffered first."""
+    session = create_session(DiskCache(str(tmp_path)))
+    adapter = session.get_adapter("https://")
+    adapter.max_memory_size = 1000
+    sent = []
+    bodies = {PAST_URL: b'[{"id": 1}, {"id": 2}]\n', LIVE_URL: b"[" + b'"x",' * 500 + b'"x"]'}
+
+    def send(adapter, request, **kwargs):
+        sent.append(request.url)
+        return make_response(request, body=bodies[request.url], headers={"ETag": '"v1"'})
+
+    with patch.object(HTTPAdapter, "send", new=send):
+        with session.get(PAST_URL, stream=True) as response:
+            assert isinstance(response.raw, io.RawIOBase)
+            response.raw.decode_content = True
+            # The parser leaves the trailing newline unread
+            assert [row["id"] for row in json_stream.load(response.raw)] == [1, 2]
+        assert session.get(PAST_URL).content == bodies[PAST_URL]
+
+        # A body abandoned halfway is not cached
+        bodies[f"{PAST_URL}&offset=1"] = b"[" + b"1," * 100000 + b"1]"
+        with session.get(f"{PAST_URL}&offset=1", stream=True) as response:
+            assert response.raw.read(10) == b"[1,1,1,1,1"
+        assert DiskCache(str(tmp_path)).get(f"{PAST_URL}&offset=1") is None
+        assert not list(tmp_path.glob("*.tmp"))
+
+        # Revalidatable bodies too large for memory stream through without being kept
+        with session.get(LIVE_URL, stream=True) as response:
+            assert len(response.raw.read()) == len(bodies[LIVE_URL])
+        assert LIVE_URL not in adapter._validated
+
+    assert sent == [PAST_URL, f"{PAST_URL}&offset=1", LIVE_URL]
+
+
+def test_stride_catalog_and_shape_requests_use_the_session():
+    """Test that stride's streamed requests go through the caching adapter without SSL verification."""
+    bodies = {
+        "/gtfs_stops/list": [{"code": 25001, "name": "Dizengoff Center", "lat": 32.0753, "lon": 34.7752}],
+        "/gtfs_routes/list": [],
+        "/gtfs_rides/list": [{"id": 5}],
+        "/gtfs_ride_stops/list": [
+            {"gtfs_stop__lat": 32.0, "gtfs_stop__lon": 34.80, "gtfs_stop__code": 1},
+            {"gtfs_stop__lat": 32.0, "gtfs_stop__lon": 34.81, "gtfs_stop__code": 2},
+        ],
+    }
+    sent = []
+
+    def send(adapter, request, **kwargs):
+        path = urlsplit(request.url).path
+        sent.append((path, kwargs.get("verify")))
+        return make_response(request, body=json.dumps(bodies[path]).encode())
+
+    with (
+        patch("custom_components.bus_line_tracker.http_cache._session", None),
+        patch.object(HTTPAdapter, "send", new=send),
+    ):
+        assert build_stop_catalog("2024-03-20").get("25001").name == "Dizengoff Center"
+        build_route_catalog("2024-03-20")
+        assert build_route_shape(101, "2024-03-20").stop_codes == ["1", "2"]
+
+    assert sent == [
+        ("/gtfs_stops/list", False),
+        ("/gtfs_routes/list", False),
+        ("/gtfs_rides/list", False),
+        ("/gtfs_ride_stops/list", False),
+    ]
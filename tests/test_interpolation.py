@@ -0,0 +1,127 @@
+"""Test the Bus Line Tracker dead-reckoning."""
+
+from datetime import UTC, datetime
+from unittest.mock import MagicMock, patch
+
+import pytest
+from homeassistant.core import HomeAssistant
+
+from custom_components.bus_line_tracker.const import (
+    ATTR_BEARING,
+    ATTR_LAST_UPDATE,
+    ATTR_LOCATION,
+    ATTR_SPEED,
+    CONF_INTERPOLATION_INTERVAL,
+    CONF_ROUTE_MKT,
+    DOMAIN,
+    MAX_DEAD_RECKONING_AGE,
+    MAX_DEAD_RECKONING_DISTANCE,
+)
+from custom_components.bus_line_tracker.device_tracker import BusPositionTracker
+from custom_components.bus_line_tracker.geo import destination_point, haversine_distance
+from custom_components.bus_line_tracker.interpolation import DeadReckoner
+
+from .test_config_flow import MockConfigEntry
+
+
+def test_destination_point():
+    """Test travelling a known distance along a bearing."""
+    lat, lon = destination_point(32.0, 34.8, 90, 1000)
+    assert lat == pytest.approx(32.0, abs=1e-4)
+    assert lon > 34.8
+    assert haversine_distance(32.0, 34.8, lat, lon) == pytest.approx(1000, rel=1e-3)
+
+    lat, lon = destination_point(32.0, 34.8, 0, 1000)
+    assert lon == pytest.approx(34.8)
+    assert haversine_distance(32.0, 34.8, lat, lon) == pytest.approx(1000, rel=1e-3)
+
+
+def test_dead_reckoner():
+    """Test extrapolating from the last fix, the distance cap and snapping to new fixes."""
+    reckoner = DeadReckoner(max_distance=500, max_age=120)
+    assert reckoner.position(0) is None
+
+    # 36 km/h due east is 10 m/s
+    reckoner.update(32.0, 34.8, 36, 90, recorded_at=100)
+    assert reckoner.position(100) == (32.0, 34.8)
+    assert haversine_distance(32.0, 34.8, *reckoner.position(110)) == pytest.approx(100, rel=1e-3)
+    assert haversine_distance(32.0, 34.8, *reckoner.position(200)) == pytest.approx(500, rel=1e-3)
+
+    # A fix that is too old is not extrapolated
+    assert reckoner.position(221) == (32.0, 34.8)
+
+    # A real fix replaces the extrapolation
+    reckoner.update(32.001, 34.801, 36, 90, recorded_at=1000)
+    assert reckoner.position(1000) == (32.001, 34.801)
+
+    # A stopped bus, or one without a bearing, stays on its fix
+    reckoner.update(32.0, 34.8, 0, 90, recorded_at=0)
+    assert not reckoner.is_moving
+    assert reckoner.position(60) == (32.0, 34.8)
+    reckoner.update(32.0, 34.8, 36, None, recorded_at=0)
+    assert reckoner.position(60) == (32.0, 34.8)
+
+
+async def test_tracker_interpolates_between_polls(hass: HomeAssistant):
+    """Test that the tracker moves from when the fix was recorded, keeps unchanged fixes and snaps back on a new one."""
+    fix = {
+        ATTR_LOCATION: "32.0,34.8",
+        ATTR_SPEED: 36,
+        ATTR_BEARING: 90,
+        ATTR_LAST_UPDATE: datetime.fromtimestamp(1000, UTC),
+    }
+    coordinator = MagicMock()
+    coordinator.data = {"23056": dict(fix)}
+    config_entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={CONF_ROUTE_MKT: "23056"},
+        options={CONF_INTERPOLATION_INTERVAL: 5},
+    )
+    tracker = BusPositionTracker(coordinator, config_entry)
+    tracker.hass = hass
+
+    def distance() -> float:
+        return haversine_distance(32.0, 34.8, tracker.latitude, tracker.longitude)
+
+    with (
+        patch("custom_components.bus_line_tracker.interpolation.time.time", return_value=1000.0) as mock_time,
+        patch.object(tracker, "async_write_ha_state") as mock_write,
+    ):
+        tracker._update_fix()
+        assert (tracker.latitude, tracker.longitude) == (32.0, 34.8)
+
+        mock_time.return_value = 1005.0
+        tracker._async_interpolate()
+        assert mock_write.call_count == 1
+        assert distance() == pytest.approx(50, rel=1e-3)
+
+        # A refresh with the same fix doesn't restart the extrapolation
+        coordinator.data = {"23056": dict(fix)}
+        mock_time.return_value = 1010.0
+        tracker._handle_coordinator_update()
+        assert distance() == pytest.approx(50, rel=1e-3)
+        tracker._async_interpolate()
+        assert distance() == pytest.approx(100, rel=1e-3)
+
+        mock_time.return_value = 1100.0
+        tracker._async_interpolate()
+        assert distance() == pytest.approx(MAX_DEAD_RECKONING_DISTANCE, rel=1e-3)
+
+        # Capped positions don't change, so no further state writes
+        write_count = mock_write.call_count
+        tracker._async_interpolate()
+        assert mock_write.call_count == write_count
+
+        # A fix that has grown too old is shown where it was recorded
+        mock_time.return_value = 1000.0 + MAX_DEAD_RECKONING_AGE + 1
+        tracker._async_interpolate()
+        assert (tracker.latitude, tracker.longitude) == (32.0, 34.8)
+
+        # A fix received late is extrapolated from when it was recorded
+        coordinator.data = {"23056": {**fix, ATTR_LAST_UPDATE: datetime.fromtimestamp(1120, UTC)}}
+        tracker._handle_coordinator_update()
+        assert distance() == pytest.approx(10, rel=1e-3)
+
+        coordinator.data = {"23056": {ATTR_LOCATION: "32.01,34.81", ATTR_SPEED: 0, ATTR_BEARING: 90}}
+        tracker._handle_coordinator_update()
+        assert (tracker.latitude, tracker.longitude) == (32.01, 34.81)
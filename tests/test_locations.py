@@ -0,0 +1,145 @@
+"""Test the Bus Line Tracker streaming vehicle location parser."""
+
+import io
+import json
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from zoneinfo import ZoneInfo
+
+import json_stream
+import numpy as np
+import pytest
+
+from custom_components.bus_line_tracker.locations import (
+    LOCATION_FIELDS,
+    LOCATIONS_ORDER_BY,
+    VEHICLE_LOCATIONS_PATH,
+    build_locations_query,
+    fetch_vehicle_locations,
+    parse_locations,
+)
+
+STRIDE_URL = "https://open-bus-stride-api.hasadna.org.il"
+
+
+def make_api_items(count, line_ref=7023):
+    """Build stride siri_vehicle_locations items, including fields the parser ignores."""
+    start = datetime(2024, 3, 20, 8, 0, tzinfo=ZoneInfo("UTC"))
+    return [
+        {
+            "id": 1000 + i,
+            "siri_snapshot_id": 55,
+            "siri_ride_stop_id": 77,
+            "recorded_at_time": (start + timedelta(seconds=30 * i)).isoformat(),
+            "lon": 34.78 + i * 0.001,
+            "lat": 32.08,
+            "bearing": 90,
+            "velocity": None if i == 0 else 30,
+            "distance_from_journey_start": 100 * i,
+            "distance_from_siri_ride_stop_meters": 12,
+            "siri_snapshot__snapshot_id": "2024/03/20/08/00",
+            "siri_route__id": 9,
+            "siri_route__line_ref": line_ref,
+            "siri_route__operator_ref": 5,
+            "siri_ride__id": 1 + i % 2,
+            "siri_ride__journey_ref": "2024-03-20-1",
+            "siri_ride__scheduled_start_time": start.isoformat(),
+            "siri_ride__vehicle_ref": f"77{i % 2}",
+        }
+        for i in range(count)
+    ]
+
+
+def test_parse_locations_from_stream():
+    """Test that only the needed fields are decoded into typed arrays."""
+    items = make_api_items(4)
+    # Some operators report vehicle refs well past 16 characters
+    items[3]["siri_ride__vehicle_ref"] = "IL-DAN-7023-0000012345678"
+    stream = json_stream.load(io.BytesIO(json.dumps(items).encode()))
+
+    locations = parse_locations(stream, capacity=10)
+
+    assert len(locations) == 4
+    assert set(locations.columns) == set(LOCATION_FIELDS)
+    assert locations["lat"].dtype == np.float64
+    assert locations["siri_ride__id"].dtype == np.int64
+    assert locations["siri_route__line_ref"].tolist() == [7023] * 4
+    assert locations["lon"].tolist() == pytest.approx([34.78, 34.781, 34.782, 34.783])
+    assert np.isnan(locations["velocity"][0])
+
+    row = locations.row(0)
+    assert row["velocity"] is None
+    assert row["siri_ride__vehicle_ref"] == "770"
+    assert row["recorded_at_time"] == datetime(2024, 3, 20, 10, 0, tzinfo=ZoneInfo("Israel"))
+    assert row["siri_ride__scheduled_start_time"] == datetime(2024, 3, 20, 10, 0, tzinfo=ZoneInfo("Israel"))
+    assert locations.row(3)["siri_ride__vehicle_ref"] == "IL-DAN-7023-0000012345678"
+
+
+def test_parse_locations_capacity():
+    """Test that parsing stops at the preallocated capacity."""
+    locations = parse_locations(make_api_items(5), capacity=3)
+    assert len(locations) == 3
+
+
+def test_latest_per_ride():
+    """Test picking the most recent fix of every ride."""
+    items = make_api_items(6)
+    locations = parse_locations(list(reversed(items)), capacity=6)
+
+    latest = locations.latest_per_ride()
+    assert sorted(locations["siri_ride__id"][latest].tolist()) == [1, 2]
+    assert sorted(locations["distance_from_journey_start"][latest].tolist()) == [400, 500]
+    assert parse_locations([], capacity=1).latest_per_ride().size == 0
+
+    # Newest-first results need no sorting, the first fix of each ride wins
+    newest_first = parse_locations(list(reversed(items)), capacity=6, newest_first=True)
+    assert newest_first.latest_per_ride().tolist() == latest.tolist()
+
+
+def test_build_locations_query():
+    """Test that stride is asked for the newest fixes first."""
+    start_time = datetime(2024, 3, 20, 9, 30, tzinfo=ZoneInfo("Israel"))
+    query = build_locations_query([7023, 7024], start_time, start_time + timedelta(minutes=30), offset=10)
+
+    assert query["order_by"] == LOCATIONS_ORDER_BY == "recorded_at_time desc"
+    assert query["siri_routes__line_ref"] == "7023,7024"
+    assert query["offset"] == 10
+    assert query["limit"] > 0
+
+
+def test_fetch_vehicle_locations_pages(requests_mock):
+    """Test that pages are requested until a short page is returned."""
+    items = make_api_items(5)
+    requests_mock.get(
+        STRIDE_URL + VEHICLE_LOCATIONS_PATH,
+        [{"json": items[:2]}, {"json": items[2:4]}, {"json": items[4:]}],
+    )
+    start_time = datetime(2024, 3, 20, 9, 30, tzinfo=ZoneInfo("Israel"))
+
+    with patch("custom_components.bus_line_tracker.locations.PAGE_SIZE", 2):
+        locations = fetch_vehicle_locations([7023], start_time, start_time + timedelta(minutes=30))
+
+    assert len(locations) == 5
+    assert requests_mock.call_count == 3
+    assert [request.qs["offset"] for request in requests_mock.request_history] == [["0"], ["2"], ["4"]]
+    assert requests_mock.last_request.qs["siri_routes__line_ref"] == ["7023"]
+    assert requests_mock.last_request.qs["order_by"] == ["recorded_at_time desc"]
+    assert locations.newest_first
+
+
+def test_fetch_vehicle_locations_batched(requests_mock):
+    """Test that several line_refs are fetched in one request and split client-side."""
+    items = make_api_items(3, line_ref=7023) + make_api_items(2, line_ref=7024)
+    requests_mock.get(STRIDE_URL + VEHICLE_LOCATIONS_PATH, json=items)
+    start_time = datetime(2024, 3, 20, 9, 30, tzinfo=ZoneInfo("Israel"))
+
+    locations = fetch_vehicle_locations([7023, 7024], start_time, start_time + timedelta(minutes=30))
+
+    assert requests_mock.call_count == 1
+    assert requests_mock.last_request.qs["siri_routes__line_ref"] == ["7023,7024"]
+
+    by_line_ref = locations.split_by_line_ref()
+    assert set(by_line_ref) == {7023, 7024}
+    assert len(by_line_ref[7023]) == 3
+    assert len(by_line_ref[7024]) == 2
+    assert by_line_ref[7024].newest_first
@@ -0,0 +1,44 @@
+"""Test the Bus Line Tracker negative result cache."""
+
+from datetime import timedelta
+
+from custom_components.bus_line_tracker.negative_cache import NegativeCache
+
+
+def test_negative_cache_backoff():
+    """Test that consecutive empty results back off exponentially up to the cap."""
+    cache = NegativeCache(timedelta(seconds=60), timedelta(seconds=200))
+    cache.start_day("2024-03-20")
+    assert not cache.is_suppressed(7023, 0)
+
+    cache.record_empty(7023, 0)
+    assert cache.is_suppressed(7023, 59)
+    assert not cache.is_suppressed(7023, 60)
+
+    cache.record_empty(7023, 60)
+    assert cache.is_suppressed(7023, 179)
+    assert not cache.is_suppressed(7023, 180)
+
+    cache.record_empty(7023, 180)
+    # 240 s would exceed the cap
+    assert not cache.is_suppressed(7023, 380)
+    assert not cache.is_suppressed(7024, 180)
+
+    cache.record_hit(7023)
+    assert not cache.is_suppressed(7023, 180)
+    assert len(cache) == 0
+
+
+def test_negative_cache_date_rollover():
+    """Test that a new service date clears every entry."""
+    cache = NegativeCache(timedelta(seconds=60), timedelta(minutes=10))
+    cache.start_day("2024-03-20")
+    cache.record_empty(7023, 0)
+    cache.record_empty(7024, 0)
+
+    cache.start_day("2024-03-20")
+    assert len(cache) == 2
+
+    cache.start_day("2024-03-21")
+    assert len(cache) == 0
+    assert not cache.is_suppressed(7023, 1)
@@ -1,30 +1,46 @@
 """Test the Bus Line Tracker sensors."""
 
+from datetime import datetime
 from unittest.mock import MagicMock, patch
+from zoneinfo import ZoneInfo
 
 import pytest
 from homeassistant.core import HomeAssistant
+from homeassistant.helpers import entity_registry as er
 from pytest_homeassistant_custom_component.common import MockPlatform, mock_platform
 
-from custom_components.bus_line_tracker import async_setup_entry
+from custom_components.bus_line_tracker import async_setup_entry, async_update_options
+from custom_components.bus_line_tracker.binary_sensor import BusBunchingBinarySensor
 from custom_components.bus_line_tracker.const import (
     ATTR_BEARING,
     ATTR_DISTANCE_FROM_START,
     ATTR_DISTANCE_FROM_STATION,
+    ATTR_ESTIMATED_ARRIVAL,
+    ATTR_LAST_ARRIVAL,
+    ATTR_LEAVE_AT,
     ATTR_LOCATION,
+    ATTR_PLACES,
     ATTR_SPEED,
     BEARING_UNITS,
+    CONF_COMPACT,
+    CONF_PLACES,
     CONF_ROUTE_MKT,
+    CONF_ROUTES,
     DISTANCE_UNITS,
     DOMAIN,
     SPEED_UNITS,
 )
+from custom_components.bus_line_tracker.route import entry_places, entry_routes
 from custom_components.bus_line_tracker.sensor import (
     BusBearingSensor,
     BusDistanceFromStartSensor,
     BusDistanceFromStationSensor,
+    BusExecutorQueueDepthSensor,
     BusLocationSensor,
+    BusPlaceArrivalSensor,
+    BusPlaceDistanceSensor,
     BusSpeedSensor,
+    BusSummarySensor,
 )
 from custom_components.bus_line_tracker.sensor import (
     async_setup_entry as sensor_async_setup_entry,
@@ -39,11 +55,13 @@ def mock_coordinator():
     """Create a mock coordinator."""
     coordinator = MagicMock()
     coordinator.data = {
-        ATTR_LOCATION: "32.0865,34.7876",
-        ATTR_SPEED: 35.5,
-        ATTR_BEARING: 180,
-        ATTR_DISTANCE_FROM_START: 1500,
-        ATTR_DISTANCE_FROM_STATION: 500,
+        "123": {
+            ATTR_LOCATION: "32.0865,34.7876",
+            ATTR_SPEED: 35.5,
+            ATTR_BEARING: 180,
+            ATTR_DISTANCE_FROM_START: 1500,
+            ATTR_DISTANCE_FROM_STATION: 500,
+        }
     }
     return coordinator
 
@@ -58,12 +76,16 @@ async def test_sensor_creation(hass: HomeAssistant):
 
     mock_coordinator = MagicMock()
     mock_coordinator.data = {
-        ATTR_LOCATION: "32.0865,34.7876",
-        ATTR_SPEED: 35.5,
-        ATTR_BEARING: 180,
-        ATTR_DISTANCE_FROM_START: 1500,
-        ATTR_DISTANCE_FROM_STATION: 500,
+        "123": {
+            ATTR_LOCATION: "32.0865,34.7876",
+            ATTR_SPEED: 35.5,
+            ATTR_BEARING: 180,
+            ATTR_DISTANCE_FROM_START: 1500,
+            ATTR_DISTANCE_FROM_STATION: 500,
+            ATTR_LEAVE_AT: datetime(2024, 3, 20, 8, 5, tzinfo=ZoneInfo("Israel")),
+        }
     }
+    mock_coordinator.trackers = {"123": MagicMock(last_arrival=None)}
     mock_coordinator.async_config_entry_first_refresh = MagicMock(side_effect=async_mock_coro)
     mock_coordinator.async_request_refresh = MagicMock(side_effect=async_mock_coro)
     mock_coordinator.async_refresh = MagicMock(side_effect=async_mock_coro)
@@ -107,6 +129,14 @@ async def test_sensor_creation(hass: HomeAssistant):
         assert state.state == "500"
         assert state.attributes["unit_of_measurement"] == DISTANCE_UNITS
 
+        state = hass.states.get("sensor.leave_at")
+        assert state is not None
+        assert state.state == "2024-03-20T06:05:00+00:00"
+
+        state = hass.states.get("sensor.last_arrival")
+        assert state is not None
+        assert state.state == "unknown"
+
 
 def test_sensor_state_updates(mock_coordinator):
     """Test sensor state updates."""
@@ -165,3 +195,125 @@ def test_sensor_unavailable_state(mock_coordinator):
 
     distance_station_sensor = BusDistanceFromStationSensor(mock_coordinator, config_entry)
     assert distance_station_sensor.state is None
+
+
+def test_sensor_per_route(mock_coordinator):
+    """Test that each route of a multi-route entry gets its own sensors."""
+    config_entry = MockConfigEntry(
+        domain=DOMAIN,
+        entry_id="multi",
+        data={CONF_ROUTES: [{CONF_ROUTE_MKT: "123"}, {CONF_ROUTE_MKT: "456"}]},
+    )
+    mock_coordinator.data["456"] = {}
+    first, second = (BusLocationSensor(mock_coordinator, config_entry, route) for route in entry_routes(config_entry))
+
+    assert first.unique_id == "multi_123_sensor.bus_location"
+    assert first.name == "123 Bus Location"
+    assert first.device_info["identifiers"] == {(DOMAIN, "multi_123")}
+    assert first.state == "32.0865,34.7876"
+
+    assert second.unique_id == "multi_456_sensor.bus_location"
+    assert second.state is None
+
+
+def test_place_sensors(mock_coordinator):
+    """Test the sensors of each place of an entry."""
+    config_entry = MockConfigEntry(
+        domain=DOMAIN,
+        entry_id="places",
+        data={CONF_ROUTE_MKT: "123"},
+        options={CONF_PLACES: "Home: 32.07, 34.78; Tel Aviv University: 32.11, 34.80"},
+    )
+    arrival = datetime(2024, 3, 20, 8, 5, tzinfo=ZoneInfo("Israel"))
+    mock_coordinator.data["123"][ATTR_PLACES] = {"Home": {"distance": 820.5, ATTR_ESTIMATED_ARRIVAL: arrival}}
+    route = entry_routes(config_entry)[0]
+    home, university = entry_places(config_entry)
+
+    distance = BusPlaceDistanceSensor(mock_coordinator, config_entry, route, home)
+    assert distance.unique_id == "places_sensor.distance_to_home"
+    assert distance.name == "Distance to Home"
+    assert distance.native_unit_of_measurement == DISTANCE_UNITS
+    assert distance.state == 820.5
+
+    eta = BusPlaceArrivalSensor(mock_coordinator, config_entry, route, home)
+    assert eta.name == "Arrival at Home"
+    assert eta.native_value == arrival
+
+    eta = BusPlaceArrivalSensor(mock_coordinator, config_entry, route, university)
+    assert eta.unique_id == "places_sensor.arrival_at_tel_aviv_university"
+    assert eta.native_value is None
+
+
+def test_compact_mode(mock_coordinator):
+    """Test that compact mode keeps every value on one sensor and disables the others by default."""
+    config_entry = MockConfigEntry(
+        domain=DOMAIN, entry_id="compact", data={CONF_ROUTE_MKT: "123"}, options={CONF_COMPACT: True}
+    )
+    arrival = datetime(2024, 3, 20, 8, 5, tzinfo=ZoneInfo("Israel"))
+    mock_coordinator.data["123"][ATTR_ESTIMATED_ARRIVAL] = arrival
+    mock_coordinator.trackers = {"123": MagicMock(last_arrival=None)}
+
+    summary = BusSummarySensor(mock_coordinator, config_entry)
+    assert summary.unique_id == "compact_sensor.bus"
+    assert summary.entity_registry_enabled_default
+    assert summary.native_value == arrival
+    attributes = summary.extra_state_attributes
+    assert attributes["latitude"] == 32.0865
+    assert attributes["longitude"] == 34.7876
+    assert attributes[ATTR_SPEED] == 35.5
+    assert attributes[ATTR_DISTANCE_FROM_STATION] == 500
+    assert attributes[ATTR_LAST_ARRIVAL] is None
+
+    assert not BusSpeedSensor(mock_coordinator, config_entry).entity_registry_enabled_default
+    assert not BusExecutorQueueDepthSensor(mock_coordinator, config_entry).entity_registry_enabled_default
+    assert not BusBunchingBinarySensor(mock_coordinator, config_entry).entity_registry_enabled_default
+    assert BusSpeedSensor(
+        mock_coordinator, MockConfigEntry(domain=DOMAIN, data={CONF_ROUTE_MKT: "123"})
+    ).entity_registry_enabled_default
+
+
+async def test_compact_mode_toggle(hass: HomeAssistant):
+    """Test that toggling compact mode updates the entities already registered and reloads the entry."""
+    config_entry = MockConfigEntry(domain=DOMAIN, entry_id="compact", data={CONF_ROUTE_MKT: "123"})
+    config_entry.add_to_hass(hass)
+    registry = er.async_get(hass)
+
+    def register(domain, unique_id, **kwargs):
+        return registry.async_get_or_create(domain, DOMAIN, unique_id, config_entry=config_entry, **kwargs).entity_id
+
+    speed = register("sensor", "compact_sensor.bus_speed")
+    tracker = register("device_tracker", "compact_bus_position")
+    user_disabled = register("sensor", "compact_sensor.bus_bearing", disabled_by=er.RegistryEntryDisabler.USER)
+    queue_depth = register("sensor", "compact_sensor.executor_queue_depth")
+
+    def disabled_by(entity_id):
+        return registry.async_get(entity_id).disabled_by
+
+    hass.data[DOMAIN] = {config_entry.entry_id: MagicMock(compact=False)}
+    with patch.object(hass.config_entries, "async_reload") as mock_reload:
+        hass.config_entries.async_update_entry(config_entry, options={CONF_COMPACT: True})
+        await async_update_options(hass, config_entry)
+        mock_reload.assert_called_once_with(config_entry.entry_id)
+        assert disabled_by(speed) is er.RegistryEntryDisabler.INTEGRATION
+        assert disabled_by(tracker) is er.RegistryEntryDisabler.INTEGRATION
+        assert disabled_by(user_disabled) is er.RegistryEntryDisabler.USER
+        # The queue depth changes with every job, so it would write far more often than the summary
+        assert disabled_by(queue_depth) is er.RegistryEntryDisabler.INTEGRATION
+
+        # Once compact, the reloaded entry registers its summary sensor
+        hass.data[DOMAIN] = {config_entry.entry_id: MagicMock(compact=True)}
+        summary = register("sensor", "compact_sensor.bus")
+        hass.config_entries.async_update_entry(config_entry, options={CONF_COMPACT: False})
+        await async_update_options(hass, config_entry)
+        assert disabled_by(speed) is None
+        assert disabled_by(tracker) is None
+        assert disabled_by(queue_depth) is None
+        assert disabled_by(user_disabled) is er.RegistryEntryDisabler.USER
+        assert registry.async_get(summary) is None
+
+        # Other options only reload the entry
+        hass.data[DOMAIN] = {config_entry.entry_id: MagicMock(compact=False)}
+        hass.config_entries.async_update_entry(config_entry, options={CONF_COMPACT: False, "update_interval": 60})
+        await async_update_options(hass, config_entry)
+        assert disabled_by(speed) is None
+        assert mock_reload.call_count == 3
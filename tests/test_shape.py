@@ -0,0 +1,114 @@
+"""Test the Bus Line Tracker route shapes."""
+
+import math
+
+import numpy as np
+import pytest
+
+from custom_components.bus_line_tracker.geo import haversine_distance
+from custom_components.bus_line_tracker.shape import RouteShape, ShapeMatcher
+
+LAT = 32.0
+METER_LAT = 1 / 111195  # degrees of latitude per meter
+METER_LON = METER_LAT / math.cos(math.radians(LAT))  # degrees of longitude per meter
+
+
+def _loop_shape():
+    """A route that runs 2 km east, 60 m north and 2 km back west."""
+    out_x = np.arange(0, 2001, 100)
+    lats = np.concatenate((np.full(len(out_x), LAT), np.full(len(out_x), LAT + 60 * METER_LAT)))
+    lons = np.concatenate((34.8 + out_x * METER_LON, 34.8 + out_x[::-1] * METER_LON))
+    return RouteShape("2024-03-20", lats, lons)
+
+
+def test_route_shape_cumulative_distance():
+    """Test the precomputed cumulative distances."""
+    shape = _loop_shape()
+    assert shape.segments == 41
+    assert shape.length == pytest.approx(4060, rel=0.01)
+    assert shape.segment_at(0) == 0
+    assert shape.segment_at(250) == 2
+    assert shape.segment_at(10**6) == shape.segments - 1
+
+    with pytest.raises(ValueError):
+        RouteShape("2024-03-20", [LAT], [34.8])
+
+
+def test_route_shape_projection():
+    """Test projecting points with and without a search window."""
+    shape = _loop_shape()
+
+    along, segment, offset = shape.project(LAT + 10 * METER_LAT, 34.8 + 250 * METER_LON)
+    assert along == pytest.approx(250, abs=2)
+    assert segment == 2
+    assert offset == pytest.approx(10, abs=1)
+
+    # A window on the return leg matches the return leg even though the outbound leg is as close
+    along, segment, _ = shape.project(LAT + 30 * METER_LAT, 34.8 + 250 * METER_LON, hint=38, window=2)
+    assert along == pytest.approx(2060 + 1750, abs=2)
+    assert segment == 38
+
+
+def test_shape_matcher_along_route_distance():
+    """Test that a bus on the opposite leg of a loop is reported far along the route."""
+    station = (LAT + 60 * METER_LAT, 34.8 + 200 * METER_LON)
+    matcher = ShapeMatcher(_loop_shape(), station)
+    assert matcher.station_along == pytest.approx(2060 + 1800, abs=2)
+
+    bus = (LAT, 34.8 + 250 * METER_LON)
+    assert haversine_distance(*bus, *station) < 100
+
+    distance = matcher.distance_to_station("ride1", *bus, distance_from_start=250)
+    assert distance == pytest.approx(3610, abs=5)
+
+    # The next fix is found near the last match
+    distance = matcher.distance_to_station("ride1", LAT, 34.8 + 450 * METER_LON)
+    assert distance == pytest.approx(3410, abs=5)
+
+    # A ride that already passed the station along the route
+    distance = matcher.distance_to_station("ride3", station[0], 34.8 + 100 * METER_LON, distance_from_start=3960)
+    assert distance == pytest.approx(-100, abs=5)
+
+    # Far off the route cannot be matched
+    assert matcher.distance_to_station("ride2", LAT + 0.01, 34.8) is None
+
+    matcher.prune(["ride2"])
+    assert matcher.distance_to_station("ride1", *bus, distance_from_start=250) == pytest.approx(3610, abs=5)
+
+
+def test_shape_matcher_station_follows_stop_sequence():
+    """Test that the station is projected onto its own stop's leg even when another leg is closer."""
+    shape = _loop_shape()
+    # Closer to the outbound leg, but the stop served on the way back
+    station = (LAT + 25 * METER_LAT, 34.8 + 200 * METER_LON)
+    assert ShapeMatcher(shape, station).station_along == pytest.approx(200, abs=2)
+
+    codes = [f"out{index}" for index in range(21)] + [f"back{index}" for index in range(21)]
+    shape = RouteShape("2024-03-20", shape.lats, shape.lons, codes)
+    assert shape.stop_segment("back18") == 39
+    assert shape.stop_segment("missing") is None
+
+    matcher = ShapeMatcher(shape, station, stop="back18")
+    assert matcher.station_along == pytest.approx(2060 + 1800, abs=2)
+    assert matcher.station_offset == pytest.approx(35, abs=1)
+    # Stops the shape doesn't know fall back to the nearest leg
+    assert ShapeMatcher(shape, station, stop="missing").station_along == pytest.approx(200, abs=2)
+
+
+def test_shape_matcher_places():
+    """Test that one match of the vehicle gives the distance to the station and every place."""
+    station = (LAT + 60 * METER_LAT, 34.8 + 200 * METER_LON)
+    places = [(LAT, 34.8 + 1000 * METER_LON), (LAT + 0.01, 34.8)]
+    matcher = ShapeMatcher(_loop_shape(), station, places)
+
+    distances = matcher.distances_along("ride1", LAT, 34.8 + 250 * METER_LON, distance_from_start=250)
+    assert distances[0] == pytest.approx(3610, abs=5)
+    assert distances[1] == pytest.approx(750, abs=5)
+    # A place far off the route has no along-route distance
+    assert math.isnan(distances[2])
+    assert matcher.distances_along("ride2", LAT + 0.01, 34.8) is None
+
+    # Places alone, without a station
+    matcher = ShapeMatcher(_loop_shape(), None, places[:1])
+    assert matcher.distance_to_station("ride1", LAT, 34.8 + 250 * METER_LON) is None
+    assert matcher.distances_along("ride1", LAT, 34.8 + 250 * METER_LON)[0] == pytest.approx(750, abs=5)
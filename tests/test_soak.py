@@ -0,0 +1,203 @@
+"""Memory soak test for the Bus Line Tracker coordinator.
+
+Replays recorded-style stride responses through many coordinator refreshes and
+fails if memory retained between refreshes keeps growing. Under pytest a short
+soak runs by default; for a long soak run it as a module from the repository root:
+
+    python -m tests.test_soak --cycles 20000
+"""
+
+import argparse
+import gc
+import io
+import json
+import logging
+import os
+import sys
+import tracemalloc
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+import pytest
+from homeassistant.core import HomeAssistant
+
+from custom_components.bus_line_tracker import BusLineDataCoordinator
+from custom_components.bus_line_tracker.const import (
+    CONF_LAT,
+    CONF_LON,
+    CONF_ROUTE_MKT,
+    CONF_UPDATE_INTERVAL,
+    DOMAIN,
+)
+from custom_components.bus_line_tracker.shape import RouteShape
+
+from .test_config_flow import MockConfigEntry
+
+_LOGGER = logging.getLogger(__name__)
+
+SOAK_CYCLES = int(os.environ.get("BUS_SOAK_CYCLES", 60))
+SOAK_WARMUP = int(os.environ.get("BUS_SOAK_WARMUP", 20))
+SOAK_SNAPSHOT_INTERVAL = int(os.environ.get("BUS_SOAK_SNAPSHOT_INTERVAL", 30))
+SOAK_MAX_GROWTH = int(os.environ.get("BUS_SOAK_MAX_GROWTH", 512 * 1024))  # bytes
+SOAK_TOP_SITES = 10
+
+REPLAY_FRAMES = 40
+RIDES_PER_FRAME = 4
+FIXES_PER_RIDE = 20
+ROUTES_DF = pd.DataFrame({"id": [101, 102], "line_ref": [7023, 7024]})
+
+
+def build_replay_frames():
+    """Build stride responses for successive polls, as raw JSON bytes.
+
+    Rides move along a straight 10 km route and are replaced by new ride ids over
+    time, so per-ride state is created and pruned during the soak.
+    """
+    start = datetime(2024, 3, 20, 8, 0, tzinfo=ZoneInfo("UTC"))
+    frames = []
+    for frame in range(REPLAY_FRAMES):
+        items = []
+        for ride in range(RIDES_PER_FRAME):
+            ride_id = frame // 5 + ride
+            progress = (frame % 5) * 500 + ride * 2000
+            for fix in range(FIXES_PER_RIDE):
+                distance = max(progress - fix * 30, 0)
+                items.append(
+                    {
+                        "id": frame * 10000 + ride * 100 + fix,
+                        "recorded_at_time": (start + timedelta(seconds=30 * (frame - fix))).isoformat(),
+                        "lat": 32.0,
+                        "lon": 34.8 + distance / 94300,
+                        "bearing": 90,
+                        "velocity": 30,
+                        "distance_from_journey_start": distance,
+                        "siri_route__line_ref": 7023 if ride % 2 else 7024,
+                        "siri_ride__id": ride_id,
+                        "siri_ride__vehicle_ref": f"{ride_id:05d}",
+                    }
+                )
+        frames.append(json.dumps(items).encode())
+    return frames
+
+
+class ReplayResponse:
+    """A streaming stride response serving one replayed frame."""
+
+    status_code = 200
+    text = ""
+
+    def __init__(self, body: bytes) -> None:
+        """Initialize the response."""
+        self.raw = io.BytesIO(body)
+
+    def __enter__(self):
+        """Enter the response context."""
+        return self
+
+    def __exit__(self, *args):
+        """Close the response."""
+        self.raw.close()
+
+
+# Allocations made by the harness itself rather than by the code under test
+SOAK_IGNORED_FILES = [tracemalloc.__file__, logging.__file__, "*/_pytest/*", "*/pluggy/*"]
+
+
+def _take_snapshot() -> tracemalloc.Snapshot:
+    gc.collect()
+    filters = [tracemalloc.Filter(False, pattern) for pattern in SOAK_IGNORED_FILES]
+    return tracemalloc.take_snapshot().filter_traces(filters)
+
+
+def _retained_growth(snapshot, baseline) -> tuple[int, list]:
+    """Return the growth in retained bytes and the top growing allocation sites."""
+    stats = snapshot.compare_to(baseline, "lineno")
+    return sum(stat.size_diff for stat in stats), stats[:SOAK_TOP_SITES]
+
+
+async def run_soak(hass: HomeAssistant, cycles: int) -> list[tuple[int, int]]:
+    """Refresh a coordinator `cycles` times and return (cycle, retained bytes growth) samples."""
+    config_entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={CONF_ROUTE_MKT: "23056", CONF_LAT: 32.0, CONF_LON: 34.85},
+        options={CONF_UPDATE_INTERVAL: 30},
+    )
+    coordinator = BusLineDataCoordinator(hass, config_entry=config_entry, update_interval=timedelta(seconds=30))
+    frames = build_replay_frames()
+    shape = RouteShape("2024-03-20", [32.0] * 11, [34.8 + i * 1000 / 94300 for i in range(11)])
+    cycle = 0
+
+    # Plain functions rather than mocks, which would retain every call's arguments
+    def replay_get(*args, **kwargs):
+        return ReplayResponse(frames[cycle % len(frames)])
+
+    def get_routes(*args):
+        return ROUTES_DF
+
+    def build_shape(*args):
+        return shape
+
+    # pytest keeps every captured log record, which would show up as growth; debug
+    # logging is off in production anyway
+    integration_logger = logging.getLogger("custom_components.bus_line_tracker")
+    log_level = integration_logger.level
+    integration_logger.setLevel(logging.INFO)
+
+    samples = []
+    tracemalloc.start()
+    try:
+        with (
+            patch("custom_components.bus_line_tracker.backends.get_routes_for_route_mkt", new=get_routes),
+            patch("custom_components.bus_line_tracker.build_route_shape", new=build_shape),
+            patch("custom_components.bus_line_tracker.locations.requests.Session.get", new=replay_get),
+        ):
+            for _ in range(SOAK_WARMUP):
+                await coordinator.async_refresh()
+            baseline = _take_snapshot()
+
+            for cycle in range(SOAK_WARMUP, SOAK_WARMUP + cycles):
+                await coordinator.async_refresh()
+                assert coordinator.last_update_success, coordinator.last_exception
+                done = cycle - SOAK_WARMUP + 1
+                if done % SOAK_SNAPSHOT_INTERVAL == 0 or done == cycles:
+                    growth, top_sites = _retained_growth(_take_snapshot(), baseline)
+                    samples.append((done, growth))
+                    _LOGGER.info("Soak cycle %d: retained growth %d bytes, top allocation sites:", done, growth)
+                    for stat in top_sites:
+                        _LOGGER.info("  %s", stat)
+    finally:
+        tracemalloc.stop()
+        integration_logger.setLevel(log_level)
+        await coordinator.async_shutdown()
+
+    return samples
+
+
+@pytest.mark.soak
+async def test_coordinator_memory_soak(hass: HomeAssistant):
+    """Test that repeated refreshes do not retain memory."""
+    samples = await run_soak(hass, SOAK_CYCLES)
+
+    assert samples
+    cycle, growth = samples[-1]
+    assert growth < SOAK_MAX_GROWTH, f"Retained memory grew by {growth} bytes after {cycle} cycles: {samples}"
+
+
+def main():
+    """Run a long soak directly, outside the default test run."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cycles", type=int, default=20000)
+    parser.add_argument("--snapshot-interval", type=int, default=1000)
+    parser.add_argument("--max-growth", type=int, default=SOAK_MAX_GROWTH, help="bytes")
+    args = parser.parse_args()
+
+    os.environ["BUS_SOAK_CYCLES"] = str(args.cycles)
+    os.environ["BUS_SOAK_SNAPSHOT_INTERVAL"] = str(args.snapshot_interval)
+    os.environ["BUS_SOAK_MAX_GROWTH"] = str(args.max_growth)
+    sys.exit(pytest.main([__file__, "-m", "soak", "-o", "log_cli=true", "-o", "log_cli_level=INFO"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Test the Bus Line Tracker frame tracing and diagnostics."""
+
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pytest
+from homeassistant.components.diagnostics import REDACTED
+from homeassistant.core import HomeAssistant
+from homeassistant.exceptions import ServiceValidationError
+
+from custom_components.bus_line_tracker import BusLineDataCoordinator
+from custom_components.bus_line_tracker.const import CONF_LAT, CONF_LON, CONF_PLACES, CONF_ROUTE_MKT, DOMAIN
+from custom_components.bus_line_tracker.diagnostics import async_get_config_entry_diagnostics
+from custom_components.bus_line_tracker.locations import VehicleLocations
+from custom_components.bus_line_tracker.services import (
+    SERVICE_START_TRACE,
+    SERVICE_STOP_TRACE,
+    async_register_services,
+)
+from custom_components.bus_line_tracker.trace import FrameTracer
+
+from .conftest import ROUTES_DF, make_vehicle_locations
+from .test_config_flow import MockConfigEntry
+
+
+def test_frame_tracer_ring_buffer():
+    """Test that only the frames of the last refreshes are kept while tracing."""
+    tracer = FrameTracer()
+    assert not tracer.enabled
+    assert tracer.as_dict() == {"enabled": False, "refreshes": []}
+
+    tracer.start(2)
+    now = datetime.now(ZoneInfo("Israel"))
+    for minutes in range(3):
+        time = now + timedelta(minutes=minutes)
+        tracer.capture(time, {"23056": ROUTES_DF}, [7023], time - timedelta(minutes=30), time, make_vehicle_locations())
+
+    trace = tracer.as_dict()
+    assert trace["max_refreshes"] == 2
+    assert [refresh["time"] for refresh in trace["refreshes"]] == [
+        (now + timedelta(minutes=1)).isoformat(),
+        (now + timedelta(minutes=2)).isoformat(),
+    ]
+    assert trace["refreshes"][0]["routes"] == {"23056": [{"id": 101, "line_ref": 7023}]}
+    assert trace["refreshes"][0]["locations"]["siri_ride__id"] == [1, 1, 2, 2]
+
+    tracer.stop()
+    assert not tracer.enabled
+
+
+async def test_trace_service_and_diagnostics(hass: HomeAssistant, mock_stride):
+    """Test that tracing is started by a service call and downloaded with the diagnostics."""
+    config_entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={CONF_ROUTE_MKT: "23056", CONF_LAT: 32.0, CONF_LON: 34.81},
+        options={CONF_PLACES: "Home: 32.0853, 34.7818"},
+    )
+    config_entry.add_to_hass(hass)
+    coordinator = BusLineDataCoordinator(hass, config_entry=config_entry, update_interval=timedelta(seconds=30))
+    hass.data.setdefault(DOMAIN, {})[config_entry.entry_id] = coordinator
+    async_register_services(hass)
+
+    try:
+        # Nothing is captured until tracing is started
+        await coordinator.async_refresh()
+        diagnostics = await async_get_config_entry_diagnostics(hass, config_entry)
+        assert diagnostics["entry"]["data"][CONF_LAT] == REDACTED
+        assert diagnostics["entry"]["options"][CONF_PLACES] == REDACTED
+        assert diagnostics["data"]["23056"]["vehicle_ref"] == "111"
+        assert diagnostics["trace"]["refreshes"] == []
+
+        await hass.services.async_call(
+            DOMAIN, SERVICE_START_TRACE, {"config_entry_id": config_entry.entry_id, "refreshes": 2}, blocking=True
+        )
+        for _ in range(3):
+            await coordinator.async_refresh()
+        diagnostics = await async_get_config_entry_diagnostics(hass, config_entry)
+        assert len(diagnostics["trace"]["refreshes"]) == 2
+        assert diagnostics["trace"]["refreshes"][-1]["line_refs"] == [7023]
+
+        await hass.services.async_call(
+            DOMAIN, SERVICE_STOP_TRACE, {"config_entry_id": config_entry.entry_id}, blocking=True
+        )
+        assert not coordinator.tracer.enabled
+
+        # Other keys of the integration's data are not entries
+        for entry_id in ("missing", "stop_catalog"):
+            hass.data[DOMAIN]["stop_catalog"] = object()
+            with pytest.raises(ServiceValidationError):
+                await hass.services.async_call(
+                    DOMAIN, SERVICE_START_TRACE, {"config_entry_id": entry_id}, blocking=True
+                )
+    finally:
+        await coordinator.async_shutdown()
+
+
+def test_tracer_empty_locations():
+    """Test that a refresh without fixes is captured too."""
+    tracer = FrameTracer()
+    tracer.start(1)
+    now = datetime.now(ZoneInfo("Israel"))
+    tracer.capture(now, {"23056": None}, [], now - timedelta(minutes=30), now, VehicleLocations.empty())
+
+    refresh = tracer.as_dict()["refreshes"][0]
+    assert refresh["routes"] == {"23056": None}
+    assert refresh["locations"]["lat"] == []
@@ -0,0 +1,68 @@
+"""Test the Bus Line Tracker position trails."""
+
+from datetime import UTC, datetime
+from unittest.mock import MagicMock
+
+import numpy as np
+
+from custom_components.bus_line_tracker.const import ATTR_LOCATION, ATTR_TRAIL, CONF_ROUTE_MKT, DOMAIN
+from custom_components.bus_line_tracker.device_tracker import BusPositionTracker
+from custom_components.bus_line_tracker.locations import parse_locations
+from custom_components.bus_line_tracker.trail import RideTrail, RideTrails, encode_polyline
+
+from .test_config_flow import MockConfigEntry
+
+
+def test_encode_polyline():
+    """Test the encoding against the reference example of the algorithm."""
+    assert encode_polyline([38.5, 40.7, 43.252], [-120.2, -120.95, -126.453]) == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+    assert encode_polyline([], []) == ""
+
+
+def test_ride_trail_is_bounded():
+    """Test that the trail keeps the latest points only, oldest first."""
+    trail = RideTrail(3, min_distance=15)
+    lons = 34.8 + np.arange(5) * 0.001  # ~94 m apart
+    trail.extend(np.arange(5.0), np.full(5, 32.0), lons)
+
+    assert len(trail) == 3
+    assert trail.points()[1].tolist() == lons[2:].tolist()
+
+    # Fixes already on the trail are ignored, later ones overwrite the oldest
+    trail.extend(np.arange(6.0), np.full(6, 32.0), 34.8 + np.arange(6) * 0.001)
+    assert trail.points()[1].tolist() == (34.8 + np.arange(3, 6) * 0.001).tolist()
+    assert len(trail.encoded()) < 40
+
+
+def test_ride_trail_skips_standing_fixes():
+    """Test that fixes close to the previous kept point don't fill the ring."""
+    trail = RideTrail(10, min_distance=15)
+    trail.extend(np.arange(4.0), np.full(4, 32.0), np.array([34.8, 34.80001, 34.80002, 34.801]))
+    assert trail.points()[1].tolist() == [34.8, 34.801]
+
+
+def test_ride_trails_follow_reporting_rides():
+    """Test that trails are kept per ride and dropped once a ride stops reporting."""
+    records = [
+        {"siri_ride__id": ride_id, "lat": 32.0, "lon": lon, "recorded_at_time": datetime.fromtimestamp(t, UTC)}
+        for ride_id, lon, t in [(1, 34.800, 1), (2, 34.900, 1), (1, 34.801, 2), (2, 34.901, 2)]
+    ]
+    trails = RideTrails(10, 15)
+    trails.update(parse_locations(records, len(records)))
+    assert len(trails) == 2
+    assert trails.encoded(1) == encode_polyline([32.0, 32.0], [34.800, 34.801])
+
+    trails.update(parse_locations(records[::2], 2))
+    assert len(trails) == 1
+    assert trails.encoded(2) is None
+
+
+def test_tracker_trail_attribute():
+    """Test that the trail is exposed as an attribute but not recorded."""
+    coordinator = MagicMock()
+    coordinator.data = {"23056": {ATTR_LOCATION: "32.0,34.8", ATTR_TRAIL: "_p~iF~ps|U"}}
+    config_entry = MockConfigEntry(domain=DOMAIN, data={CONF_ROUTE_MKT: "23056"})
+    tracker = BusPositionTracker(coordinator, config_entry)
+
+    assert tracker.extra_state_attributes["trail"] == "_p~iF~ps|U"
+    assert ATTR_TRAIL in tracker._unrecorded_attributes
@@ -0,0 +1,136 @@
+"""Test the Bus Line Tracker vehicle index."""
+
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pytest
+from homeassistant.core import HomeAssistant
+
+from custom_components.bus_line_tracker import BusLineDataCoordinator
+from custom_components.bus_line_tracker.const import CONF_ROUTE_MKT, DOMAIN
+from custom_components.bus_line_tracker.geo import initial_bearing
+from custom_components.bus_line_tracker.locations import parse_locations
+from custom_components.bus_line_tracker.vehicle_index import VehicleIndex
+
+from .test_config_flow import MockConfigEntry
+
+NOW = datetime(2024, 3, 20, 8, 0, tzinfo=ZoneInfo("Israel"))
+
+# ~94.4 m of longitude at lat 32
+LON_STEP = 0.001
+
+
+def make_locations(fixes):
+    """Build vehicle locations from (vehicle_ref, seconds after NOW, lat, lon) tuples."""
+    records = [
+        {
+            "siri_ride__id": int(vehicle_ref),
+            "siri_ride__vehicle_ref": vehicle_ref,
+            "recorded_at_time": NOW + timedelta(seconds=seconds),
+            "lat": lat,
+            "lon": lon,
+        }
+        for vehicle_ref, seconds, lat, lon in fixes
+    ]
+    return parse_locations(records, len(records))
+
+
+def make_index():
+    """Return an index like the coordinator's."""
+    return VehicleIndex(5, max_age=1800, max_speed=120, min_heading_distance=10)
+
+
+def test_initial_bearing():
+    """Test the bearing between two points."""
+    assert initial_bearing(32.0, 34.8, 32.0, 34.81) == pytest.approx(90, abs=0.1)
+    assert initial_bearing(32.0, 34.8, 31.99, 34.8) == pytest.approx(180, abs=0.1)
+    assert initial_bearing(32.0, 34.8, 32.01, 34.79) == pytest.approx(319.7, abs=0.5)
+
+
+def test_motion_from_consecutive_fixes():
+    """Test that speed and heading come from the latest step, across polls."""
+    index = make_index()
+    index.update(make_locations([("111", 0, 32.0, 34.800)]))
+    assert index.motion("111") == (None, None)
+
+    # Fixes already indexed are ignored when the window is fetched again
+    index.update(make_locations([("111", 0, 32.0, 34.800), ("111", 10, 32.0, 34.800 + LON_STEP)]))
+    speed, bearing = index.motion("111")
+    assert speed == pytest.approx(34.0, abs=0.2)  # 94.4 m in 10 s
+    assert bearing == pytest.approx(90, abs=0.1)
+
+    # Standing still: no speed, and no heading from GPS noise
+    index.update(make_locations([("111", 20, 32.0, 34.800 + LON_STEP + 0.00002)]))
+    speed, bearing = index.motion("111")
+    assert speed < 1
+    assert bearing is None
+    assert index.motion("222") == (None, None)
+    assert index.motion(None) == (None, None)
+
+
+def test_motion_rejects_jumps():
+    """Test that fixes implying impossible speeds are dropped."""
+    index = make_index()
+    index.update(
+        make_locations(
+            [
+                ("111", 0, 32.0, 34.800),
+                ("111", 10, 32.0, 34.800 + LON_STEP),
+                ("111", 20, 32.05, 34.800),  # 5.5 km away in 10 s
+                ("111", 30, 32.0, 34.800 + 3 * LON_STEP),
+            ]
+        )
+    )
+    speed, bearing = index.motion("111")
+    assert speed == pytest.approx(34.0, abs=0.2)  # 2 steps over the 20 s since the fix before the jump
+    assert bearing == pytest.approx(90, abs=0.1)
+
+    # A jump in the latest fix isn't trusted either
+    index.update(make_locations([("111", 40, 31.9, 34.800)]))
+    assert index.motion("111")[0] == pytest.approx(34.0, abs=0.2)
+
+    # Nor one in the oldest fix
+    index = make_index()
+    index.update(make_locations([("222", 0, 32.5, 34.8), ("222", 10, 32.0, 34.8), ("222", 20, 32.0, 34.801)]))
+    assert index.motion("222")[0] == pytest.approx(34.0, abs=0.2)
+
+
+def test_index_is_bounded():
+    """Test that each vehicle keeps its last fixes and silent vehicles are evicted."""
+    index = make_index()
+    index.update(make_locations([("111", seconds, 32.0, 34.8 + seconds * 1e-4) for seconds in range(0, 100, 10)]))
+    assert len(index._fixes["111"]) == 5
+
+    index.update(make_locations([("222", 1000, 32.0, 34.9)]))
+    assert len(index) == 2
+    index.update(make_locations([("222", 1900, 32.0, 34.9)]))
+    assert len(index) == 1
+    assert index.motion("111") == (None, None)
+
+
+async def test_coordinator_derives_missing_speed(hass: HomeAssistant, mock_stride):
+    """Test that a fix without speed and bearing gets them from the vehicle's previous fixes."""
+    config_entry = MockConfigEntry(domain=DOMAIN, data={CONF_ROUTE_MKT: "23056"})
+    coordinator = BusLineDataCoordinator(hass, config_entry=config_entry, update_interval=timedelta(seconds=30))
+    now = datetime.now(ZoneInfo("Israel")).replace(microsecond=0)
+    records = [
+        {
+            "siri_ride__id": 1,
+            "siri_ride__vehicle_ref": "111",
+            "lat": 32.0,
+            "lon": lon,
+            "velocity": 0,
+            "recorded_at_time": now - timedelta(seconds=ago),
+        }
+        for lon, ago in [(34.800 + LON_STEP, 0), (34.800, 10)]
+    ]
+
+    mock_stride.fetch_vehicle_locations.return_value = parse_locations(records, len(records), 7023)
+
+    try:
+        data = (await coordinator._async_update_data())["23056"]
+    finally:
+        await coordinator.async_shutdown()
+
+    assert data["speed"] == pytest.approx(34.0, abs=0.2)
+    assert data["bearing"] == pytest.approx(90, abs=0.1)
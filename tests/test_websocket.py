@@ -0,0 +1,94 @@
+"""Test the Bus Line Tracker WebSocket API."""
+
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+from zoneinfo import ZoneInfo
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+
+from custom_components.bus_line_tracker import BusLineDataCoordinator
+from custom_components.bus_line_tracker.const import CONF_ROUTE_MKT, DATA_GTFS_STORE, DOMAIN, SIGNAL_ENTRY_UNLOADED
+from custom_components.bus_line_tracker.fleet import diff_fleet
+from custom_components.bus_line_tracker.websocket import WS_TYPE_FLEET_SUBSCRIBE, websocket_fleet_subscribe
+
+from .conftest import make_vehicle_locations
+from .test_config_flow import MockConfigEntry
+
+
+def test_diff_fleet():
+    """Test that only new, changed and removed vehicles are reported."""
+    old = {"23056": {"1": {"lat": 32.0}, "2": {"lat": 32.1}, "3": {"lat": 32.2}}}
+    new = {"23056": {"1": {"lat": 32.0}, "2": {"lat": 32.15}, "4": {"lat": 32.3}}}
+
+    assert diff_fleet(old, new) == {
+        "changed": {"23056": {"2": {"lat": 32.15}, "4": {"lat": 32.3}}},
+        "removed": {"23056": ["3"]},
+    }
+    assert diff_fleet(new, new) == {}
+    assert diff_fleet(new, {}) == {"removed": {"23056": ["1", "2", "4"]}}
+
+
+async def test_fleet_subscription(hass: HomeAssistant, mock_stride):
+    """Test that a subscriber gets the whole fleet once and then the changes."""
+    config_entry = MockConfigEntry(domain=DOMAIN, data={CONF_ROUTE_MKT: "23056"})
+    config_entry.add_to_hass(hass)
+    coordinator = BusLineDataCoordinator(hass, config_entry=config_entry, update_interval=timedelta(seconds=30))
+    hass.data.setdefault(DOMAIN, {})[config_entry.entry_id] = coordinator
+    connection = MagicMock(subscriptions={})
+    now = datetime.now(ZoneInfo("Israel")).replace(microsecond=0)
+    mock_fetch = mock_stride.fetch_vehicle_locations
+    mock_fetch.return_value = make_vehicle_locations(now)
+
+    try:
+        await coordinator.async_refresh()
+
+        websocket_fleet_subscribe(
+            hass, connection, {"id": 1, "type": WS_TYPE_FLEET_SUBSCRIBE, "entry_id": config_entry.entry_id}
+        )
+        connection.send_result.assert_called_once_with(1)
+        fleet = connection.send_message.call_args[0][0]["event"]["full"]["23056"]
+        assert set(fleet) == {"1", "2"}
+        assert fleet["1"]["vehicle_ref"] == "111"
+        assert fleet["1"]["lon"] == 34.8030
+        assert fleet["1"]["recorded_at"] == now
+
+        # Ride 1 moves on and ride 2 stops reporting
+        locations = make_vehicle_locations(now + timedelta(seconds=30))
+        mock_fetch.return_value = locations.take(locations["siri_ride__id"] == 1)
+        await coordinator.async_refresh()
+        event = connection.send_message.call_args[0][0]["event"]
+        assert set(event["changed"]["23056"]) == {"1"}
+        assert event["removed"] == {"23056": ["2"]}
+
+        # Nothing changed, so nothing is sent
+        await coordinator.async_refresh()
+        assert connection.send_message.call_count == 2
+
+        # Unsubscribing removes the listener
+        connection.subscriptions[1]()
+        mock_fetch.return_value = make_vehicle_locations(now + timedelta(seconds=60))
+        await coordinator.async_refresh()
+        assert connection.send_message.call_count == 2
+
+        websocket_fleet_subscribe(hass, connection, {"id": 2, "type": WS_TYPE_FLEET_SUBSCRIBE, "entry_id": "x"})
+        assert connection.send_error.call_args[0][:2] == (2, "not_found")
+
+        # Other keys of the integration's data are not entries
+        hass.data[DOMAIN][DATA_GTFS_STORE] = object()
+        msg = {"id": 3, "type": WS_TYPE_FLEET_SUBSCRIBE, "entry_id": DATA_GTFS_STORE}
+        websocket_fleet_subscribe(hass, connection, msg)
+        assert connection.send_error.call_args[0][:2] == (3, "not_found")
+
+        # Unloading the entry ends its subscriptions
+        msg = {"id": 4, "type": WS_TYPE_FLEET_SUBSCRIBE, "entry_id": config_entry.entry_id}
+        websocket_fleet_subscribe(hass, connection, msg)
+        async_dispatcher_send(hass, SIGNAL_ENTRY_UNLOADED.format(config_entry.entry_id))
+        assert connection.send_message.call_args[0][0]["event"] == {"unloaded": True}
+        assert 4 not in connection.subscriptions
+        sent = connection.send_message.call_count
+        mock_fetch.return_value = make_vehicle_locations(now + timedelta(seconds=90))
+        await coordinator.async_refresh()
+        assert connection.send_message.call_count == sent
+    finally:
+        await coordinator.async_shutdown()